@@ -0,0 +1,204 @@
+# Script for generating designs for many study landscapes at once
+# File: batch_generate_designs.py
+# Author: Ellie Bowler
+# Contact: e.bowler@uea.ac.uk
+# All code available at https://github.com/EllieBowler/
+# This script reads a manifest of landscapes and runs a stratified or uniform design for each of them on a
+# pool of processes, starting with the largest landscapes. Plots are not shown.
+###################################################################
+# Usage:
+# --manifest is a csv file with one row per landscape and the columns:
+#       name        : name of the landscape, results are saved in a sub-folder with this name
+#       design      : stratified or uniform
+#       nsp         : number of sample sites
+#       mask_path   : path to the invalid areas mask (optional for uniform designs)
+#       hab_path    : path to the habitat map (uniform designs only)
+#       metrics     : metric map paths separated by ; (uniform designs only)
+#       bins        : number of bins for each metric separated by ; (uniform designs only)
+# --save_folder is the name of the directory where outputs will be saved, in the results subfolder
+# --processes is the number of designs run at the same time (default is the number of cpus)
+# --max_memory (optional) memory limit for each design, such as 16G
+###################################################################
+# Example
+# python batch_generate_designs.py --manifest=input/landscapes.csv --save_folder=Batch_Designs --processes=8
+###################################################################
+
+from utils import get_file_info, extract_raster, get_raster_shape, save_stratified, save_uniform, plan_memory
+from sda import generate_stratified_design
+from uda import generate_uniform_design, build_id_image, generate_id_list
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import click
+import time
+import sys
+import os
+try:
+    import resource
+except ImportError:  # not available on windows, peak memory is then not recorded
+    resource = None
+
+
+def split_list(value):
+    """
+    Split a ; separated manifest entry into a list, empty entries give an empty list
+    """
+    if pd.isnull(value) or str(value).strip() == '':
+        return []
+    return [v.strip() for v in str(value).split(';')]
+
+
+def job_size(job):
+    """
+    Estimate the relative cost of a job as the number of pixels times the number of sample sites.
+    Jobs whose maps cannot be read are given size zero, the error is recorded when the job runs
+    """
+    try:
+        imheight, imwidth = get_raster_shape(job['mask_path'] if job['design'] == 'stratified' else job['hab_path'])
+    except Exception:
+        return 0
+    return imheight * imwidth * int(job['nsp'])
+
+
+def run_stratified(job, save_path, timings):
+    """
+    Load, design and save a stratified design, as in generate_stratified_design.py
+    """
+    t = time.time()
+    mask, n_bins, res, geo_t, prj_info = get_file_info(job['mask_path'])
+    if job['max_memory'] is not None:
+        plan_memory(mask.shape[0], mask.shape[1], 0, [], job['nsp'], job['max_memory'], design='stratified')
+    timings['load_seconds'] = time.time() - t
+
+    t = time.time()
+    x_strat, y_strat = generate_stratified_design(mask, job['nsp'])
+    timings['design_seconds'] = time.time() - t
+
+    t = time.time()
+    csv_path = save_stratified(x_strat, y_strat, prj_info, geo_t, save_path)
+    timings['save_seconds'] = time.time() - t
+    return csv_path
+
+
+def run_uniform(job, save_path, timings, random_state):
+    """
+    Load, design and save a uniform design, as in generate_uniform_design.py, drawing the ids from random_state
+    """
+    t = time.time()
+    habmap, n_bins, res, geo_t, prj_info = get_file_info(job['hab_path'])
+    metrics = split_list(job['metrics'])
+    bins_list = [n_bins] + [int(b) for b in split_list(job['bins'])]
+
+    representation, tile_rows = 'in-memory', None
+    if job['max_memory'] is not None:
+        plan = plan_memory(habmap.shape[0], habmap.shape[1], len(metrics) + 1, bins_list, job['nsp'],
+                           job['max_memory'])
+        representation, tile_rows = plan['representation'], plan['tile_rows']
+
+    if pd.notnull(job['mask_path']):
+        mask = extract_raster(job['mask_path'])
+    else:
+        mask = np.ones((habmap.shape[0], habmap.shape[1]))
+    metric_list = [habmap] + [extract_raster(metric) for metric in metrics]
+    timings['load_seconds'] = time.time() - t
+
+    t = time.time()
+    binned_metrics, bin_breaks, id_im, unique_ids, id_df, s_opt = build_id_image(
+        metric_list, mask, bins_list, job['nsp'], representation, tile_rows)
+    id_mix, id_df = generate_id_list(unique_ids, s_opt, job['nsp'], id_df, random_state=random_state)
+    timings['layers_seconds'] = time.time() - t
+
+    t = time.time()
+    x_unif, y_unif = generate_uniform_design(id_mix, id_im)
+    timings['design_seconds'] = time.time() - t
+
+    t = time.time()
+    csv_path = save_uniform(x_unif, y_unif, id_mix, id_df, id_im, prj_info, geo_t, save_path,
+                            binned_metrics=binned_metrics, mask=mask)
+    timings['save_seconds'] = time.time() - t
+    return csv_path
+
+
+def run_job(job):
+    """
+    Run a single design from the manifest, recording the output path, timings and peak memory.
+    Errors are recorded in the index rather than stopping the other jobs.
+    """
+    # Worker processes are forked with the parent's random state, so each job draws its id list from its own
+    # freshly seeded random state. The design functions draw ties from their own generator, seeded fresh for each design
+    random_state = np.random.RandomState()
+
+    save_path = '{}/{}'.format(job['save_path'], job['name'])
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+
+    start = time.time()
+    timings = {}
+    record = {'name': job['name'], 'design': job['design'], 'nsp': job['nsp'], 'status': 'done',
+              'output': '', 'error': ''}
+    try:
+        if job['design'] == 'stratified':
+            record['output'] = run_stratified(job, save_path, timings)
+        elif job['design'] == 'uniform':
+            record['output'] = run_uniform(job, save_path, timings, random_state)
+        else:
+            raise ValueError('Unknown design {}, use stratified or uniform'.format(job['design']))
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+    record['total_seconds'] = time.time() - start
+    record.update(timings)
+
+    # ru_maxrss is in bytes on macOS and kilobytes on linux, each job runs in a fresh process so this is the job's peak
+    if resource is not None:
+        scale = 1024.0 ** 2 if sys.platform == 'darwin' else 1024.0
+        record['peak_memory_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    print('Finished {} ({}) in {:.1f}s'.format(job['name'], record['status'], record['total_seconds']))
+    return record
+
+
+# Arguments used to call the method from the command line
+@click.command()
+@click.option('--manifest', type=str, required=True, help='Path to csv file listing the landscapes to design')
+@click.option('--save_folder', type=str, default='Batch_Designs', help='Name of folder where results will be saved')
+@click.option('--processes', type=int, default=None, help='Number of designs to run at once (default all cpus)')
+@click.option('--max_memory', type=str, default=None, help='Memory limit for each design, for example 16G')
+def generate_designs(manifest, save_folder, processes, max_memory):
+
+    # make results folder to save output
+    save_path = 'results/{}'.format(save_folder)
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+    print('Results will be saved to {}'.format(save_path))
+
+    manifest_df = pd.read_csv(manifest, dtype=str)
+    jobs = []
+    for i, row in manifest_df.iterrows():
+        job = {key: row.get(key) for key in ['name', 'design', 'mask_path', 'hab_path', 'metrics', 'bins']}
+        job['nsp'] = int(row['nsp'])
+        job['save_path'] = save_path
+        job['max_memory'] = max_memory
+        jobs.append(job)
+
+    # Start the largest landscapes first so they do not hold up the end of the batch
+    jobs = sorted(jobs, key=job_size, reverse=True)
+    print('Running {} designs'.format(len(jobs)))
+
+    # A fresh process for each job keeps memory from one landscape out of the next, and the peak per job
+    index_path = '{}/batch_index.csv'.format(save_path)
+    records = []
+    pool = Pool(processes, maxtasksperchild=1)
+    for record in pool.imap_unordered(run_job, jobs):
+        records.append(record)
+        # Rewrite the index after every job so it is usable if the batch is stopped early
+        pd.DataFrame(records).to_csv(index_path, index=False)
+    pool.close()
+    pool.join()
+
+    n_failed = sum(record['status'] == 'failed' for record in records)
+    print('Batch complete, {} of {} designs failed. Index saved to {}'.format(n_failed, len(records), index_path))
+    return
+
+
+if __name__ == '__main__':
+    generate_designs()
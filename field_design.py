@@ -0,0 +1,118 @@
+# Script for changing a stratified design site by site during field work
+# File: field_design.py
+# Author: Ellie Bowler
+# Contact: e.bowler@uea.ac.uk
+# All code available at https://github.com/EllieBowler/
+# The design is kept in a state file between field days, so sites can be dropped, added and suggested one at a
+# time without generating the whole design again. Each command saves the state and the current design as .csv and .shp
+###################################################################
+# Usage:
+# --state_path is the state file of the design, in the results subfolder
+# --save_folder is the name of the directory where the designs will be saved, in the results subfolder
+# Commands:
+# start --mask_path --nsp     begin a design of nsp sites over the mask
+# drop SITE... [--replace]    remove sites (numbered as in the last saved .csv), suggesting a new site for each
+#                             with --replace
+# add --row --col             add a site at a chosen location, which must be a valid area of the mask
+# suggest --n                 add the n best new sites
+###################################################################
+# Example of starting a 30 site design, then dropping sites 4 and 12 and replacing them
+# python field_design.py start --mask_path=input/InvalidAreasMask.tif --nsp=30
+# python field_design.py drop 4 12 --replace
+###################################################################
+
+from utils import get_file_info, save_stratified
+from sda import SiteDesigner
+import os
+import click
+
+
+@click.group()
+@click.option('--state_path', type=str, default='field_design.npz', help='Name of the state file of the design')
+@click.option('--save_folder', type=str, default='Field_Design', help='Name folder where results will be saved')
+@click.pass_context
+def field_design(ctx, state_path, save_folder):
+    # make results folder to save output
+    save_path = 'results/{}'.format(save_folder)
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+    ctx.obj = {'state_path': 'results/{}'.format(state_path), 'save_path': save_path}
+    return
+
+
+def load_design(ctx):
+    designer, extra = SiteDesigner.load(ctx.obj['state_path'])
+    return designer, extra['geo_t'], extra['prj_info']
+
+
+def save_design(ctx, designer, geo_t, prj_info):
+    designer.save(ctx.obj['state_path'], geo_t=geo_t, prj_info=prj_info)
+    x_vals, y_vals, labels = designer.coordinates()
+    save_stratified(x_vals, y_vals, prj_info, geo_t, ctx.obj['save_path'])
+    print('{} sites in the design, state saved to {}'.format(len(x_vals), ctx.obj['state_path']))
+    return
+
+
+@field_design.command()
+@click.option('--mask_path', type=str, default='input/InvalidAreasMask.tif', help='Path and name of the study site mask')
+@click.option('--nsp', type=int, default=30, help='Integer number of sample sites')
+@click.pass_context
+def start(ctx, mask_path, nsp):
+    mask, n_bins, res, geo_t, prj_info = get_file_info(mask_path)
+    designer = SiteDesigner(mask)
+    for i in range(nsp):
+        print('Plotting site {}'.format(i + 1))
+        designer.add_site(*designer.next_best_site())
+    save_design(ctx, designer, geo_t, prj_info)
+    return
+
+
+@field_design.command()
+@click.argument('sites', type=int, nargs=-1)
+@click.option('--replace', is_flag=True, help='Suggest a new site for each site dropped')
+@click.pass_context
+def drop(ctx, sites, replace):
+    designer, geo_t, prj_info = load_design(ctx)
+    labels = designer.coordinates()[2]
+    if any(site < 1 or site > len(labels) for site in sites):
+        raise click.UsageError('Sites are numbered 1 to {} as in the last saved .csv'.format(len(labels)))
+    if len(set(sites)) < len(sites):
+        raise click.UsageError('Each site can only be dropped once')
+    for site in sites:
+        designer.remove_site(labels[site - 1])
+    if replace:
+        for site in sites:
+            designer.add_site(*designer.next_best_site())
+    save_design(ctx, designer, geo_t, prj_info)
+    return
+
+
+@field_design.command()
+@click.option('--row', type=int, required=True, help='Row of the new site')
+@click.option('--col', type=int, required=True, help='Column of the new site')
+@click.pass_context
+def add(ctx, row, col):
+    designer, geo_t, prj_info = load_design(ctx)
+    imheight, imwidth = designer.shape
+    if not (0 <= row < imheight and 0 <= col < imwidth):
+        raise click.UsageError('Row {} and column {} are outside the {} by {} map'.format(row, col, imheight, imwidth))
+    if not designer.valid[row, col]:
+        raise click.UsageError('Row {} and column {} are in an invalid area of the mask'.format(row, col))
+    designer.add_site(row, col)
+    save_design(ctx, designer, geo_t, prj_info)
+    return
+
+
+@field_design.command()
+@click.option('--n', type=int, default=1, help='Number of sites to add')
+@click.pass_context
+def suggest(ctx, n):
+    designer, geo_t, prj_info = load_design(ctx)
+    for i in range(n):
+        designer.add_site(*designer.next_best_site())
+    save_design(ctx, designer, geo_t, prj_info)
+    return
+
+
+if __name__ == '__main__':
+    field_design()
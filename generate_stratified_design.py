@@ -11,15 +11,33 @@
 # --save_folder is the name of the directory where outputs will be saved, in the results subfolder
 # --mask_path is the name of the input mask (for example InvalidAreasMask.tif)
 # --nsp is the number of sample points which should be an integer value
+# --max_memory (optional) memory limit such as 16G, the design stops before starting if it will not fit
+# --resume (optional flag) continue from the last checkpoint if the previous run was stopped
+# --checkpoint_every (optional) number of sites placed between checkpoints, default 10
+# --mode (optional) greedy (default) places each site at the maximum distance from all others, poisson is a
+#        faster approximation for very large maps using Poisson disk sampling, tiled splits the map into
+#        --tiles x --tiles tiles designed in parallel on --processes processes, cost spaces sites by travel cost
+#        over the --friction_path raster instead of straight line distance
+# --move_margin (optional) pixels sites may move over tile borders when fixing sites too close across borders
+# --compare (optional flag) with tiled mode, also run a single tile design to compare the minimum spacing
+# --exclude_path (optional) extra exclusion mask combined with the mask, for example input/AdditionalMasks.tif
+#        (repeat for each mask)
+# --candidates_path (optional) .csv or vector file of the points sites may be placed at, for example along trails
+#        and roads, combined with the mask (see load_candidate_points)
+# --friction_path (optional) raster of the cost of crossing each pixel, zero where it cannot be crossed (for example
+#        rivers), needed with --mode=cost
 ###################################################################
 # Example of a 30 site stratified design using InvalidAreasMask.tif, saving outputs to Stratified_Design_Demo
 # python generate_stratified_design.py --save_folder=Stratified_Design_Demo --mask_path=input/InvalidAreasMask.tif --nsp=30
 ###################################################################
 
-from utils import get_file_info, plot_stratified, save_stratified
-from sda import generate_stratified_design
+from utils import get_file_info, plot_stratified, save_stratified, get_raster_shape, plan_memory, clear_checkpoint
+from utils import MaskStack, load_candidate_points, extract_raster
+from sda import generate_stratified_design, generate_poisson_design, generate_tiled_stratified_design, \
+    generate_stratified_design_points, generate_cost_design
 import os
 import click
+import pandas as pd
 
 
 # Arguments used to call the method from the command line
@@ -27,7 +45,28 @@ import click
 @click.option('--save_folder', type=str, default='Stratified_Design', help='Name folder where results will be saved')
 @click.option('--mask_path', type=str, default='input/InvalidAreasMask.tif', help='Path and name of the study site mask')
 @click.option('--nsp', type=int, default=30, help='Integer number of sample sites')
-def generate_design(save_folder, mask_path, nsp):
+@click.option('--max_memory', type=str, default=None, help='Memory limit, for example 16G (default no limit)')
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped design')
+@click.option('--checkpoint_every', type=int, default=None, help='Number of sites placed between checkpoints (default 10)')
+@click.option('--mode', type=click.Choice(['greedy', 'poisson', 'tiled', 'cost']), default='greedy', help='Site placement method')
+@click.option('--tiles', type=int, default=2, help='Number of tiles along each side in tiled mode')
+@click.option('--move_margin', type=int, default=50, help='Pixels sites may move over tile borders in tiled mode')
+@click.option('--processes', type=int, default=None, help='Number of processes in tiled mode (default all cpus)')
+@click.option('--compare', is_flag=True, help='Compare tiled spacing with a single tile design')
+@click.option('--exclude_path', multiple=True, help='Path and name of an extra exclusion mask')
+@click.option('--candidates_path', type=str, default=None, help='Path and name of the candidate points file')
+@click.option('--friction_path', type=str, default=None, help='Path and name of the friction raster for cost mode')
+def generate_design(save_folder, mask_path, nsp, max_memory, resume, checkpoint_every, mode, tiles, move_margin,
+                    processes, compare, exclude_path, candidates_path, friction_path):
+    if candidates_path is not None and mode != 'greedy':
+        raise click.UsageError('--candidates_path can only be used with the greedy mode')
+    if (mode == 'cost') != (friction_path is not None):
+        raise click.UsageError('--friction_path is needed with, and only used with, --mode=cost')
+    if mode == 'poisson' and (resume or checkpoint_every is not None):
+        raise click.UsageError('--resume and --checkpoint_every can not be used with --mode=poisson, which places '
+                               'all sites at once')
+    if checkpoint_every is None:
+        checkpoint_every = 10
     
     # make results folder to save output
     save_path = 'results/{}'.format(save_folder)
@@ -35,17 +74,51 @@ def generate_design(save_folder, mask_path, nsp):
         os.mkdir(save_path)
     print('Results will be saved to {}'.format(save_path))
 
+    # check the design will fit in memory before reading the mask
+    if max_memory is not None:
+        imheight, imwidth = get_raster_shape(mask_path)
+        plan_memory(imheight, imwidth, 0, [], nsp, max_memory, design='stratified')
+
     # get geo info and mask from tif file
     mask, n_bins, res, geo_t, prj_info = get_file_info(mask_path)
 
-    # generate design
-    x_strat, y_strat = generate_stratified_design(mask, nsp)
+    # combine any extra exclusion masks, stored one bit per pixel
+    if exclude_path:
+        stack = MaskStack(mask.shape).add('mask', mask)
+        for path in exclude_path:
+            stack.add_file(path, path)
+        mask = stack.mask()
+
+    # generate design, saving progress to a checkpoint
+    checkpoint_path = '{}/{}site_strat_checkpoint.pkl'.format(save_path, nsp)
+    if not resume:
+        clear_checkpoint(checkpoint_path)
+    spacing = None
+    if candidates_path is not None:
+        # place sites only at the candidate points, the time taken depends on the number of points not the map size
+        rows, cols = load_candidate_points(candidates_path, prj_info, geo_t, mask.shape, mask)
+        x_strat, y_strat = generate_stratified_design_points(rows, cols, nsp)
+    elif mode == 'poisson':
+        x_strat, y_strat = generate_poisson_design(mask, nsp)
+    elif mode == 'cost':
+        friction = extract_raster(friction_path)
+        x_strat, y_strat = generate_cost_design(mask, friction, nsp, checkpoint_path, checkpoint_every, resume)
+    elif mode == 'tiled':
+        x_strat, y_strat, spacing = generate_tiled_stratified_design(mask, nsp, tiles, move_margin, processes,
+                                                                     compare=compare)
+    else:
+        x_strat, y_strat = generate_stratified_design(mask, nsp, checkpoint_path, checkpoint_every, resume)
 
     # plot design in pop up (please close plot to continue)
     plot_stratified(mask, x_strat, y_strat)
 
     # save results to csv
-    save_stratified(x_strat, y_strat, prj_info, geo_t, save_path)
+    csv_path = save_stratified(x_strat, y_strat, prj_info, geo_t, save_path)
+    clear_checkpoint(checkpoint_path)
+
+    # save the spacing achieved by a tiled design alongside it
+    if spacing is not None:
+        pd.DataFrame([spacing]).to_csv(csv_path.replace('.csv', '_spacing.csv'), index=False)
     return
 
 
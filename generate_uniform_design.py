@@ -12,17 +12,43 @@
 # --n_metrics is the number of fragmentation metrics you are interested in sampling
 # --mask_path is the name of the input mask (for example InvalidAreasMask.tif)
 # --nsp is the number of sample points which should be an integer value
+# --max_memory (optional) memory limit such as 16G, used to choose how the metric layers are stored
+# --resume (optional flag) continue from the last checkpoint if the previous run was stopped
+# --checkpoint_every (optional) number of sites placed between checkpoints, default 10
+# --mode (optional) greedy (default) places each site at the maximum distance from all others, poisson is a
+#        faster approximation for very large maps using Poisson disk sampling within each id, cost spaces sites by
+#        travel cost over the --friction_path raster instead of straight line distance
+# --backend (optional) numpy (default) holds the maps in memory, dask reads and bins them in chunks in parallel
+# --scheduler (optional) with the dask backend, processes (default) for the local cpus or the address of a
+#        dask.distributed scheduler to run on a cluster
+# --chunk_rows (optional) with the dask backend, number of map rows in each chunk, default 1024
+# --exclude_path (optional) extra exclusion mask combined with the mask, for example input/AdditionalMasks.tif
+#        (repeat for each mask)
+# --threads (optional) with the numpy backend, number of metric maps read and binned at once, by default they
+#        are read one after another
+# --candidates_path (optional) .csv or vector file of the points sites may be placed at, for example along trails
+#        and roads, combined with the mask. The metrics are binned over the points only (see load_candidate_points)
+# --friction_path (optional) raster of the cost of crossing each pixel, zero where it cannot be crossed (for example
+#        rivers), needed with --mode=cost
+# --batch_size (optional) with the greedy mode, place up to this many sites of different ids between distance
+#        transforms, keeping only sites whose spacing is within --tolerance (default 0) of the one site at a time design
 ###################################################################
 # Example command line input for an 80 site uniform design with the example metrics provided...
 # python generate_uniform_design.py --metrics=input/FragmentAreaLog10.tif --bins=7
 # --metrics=input/DistanceToEdgeLog2.tif --bins=6
 ###################################################################
 
-from utils import get_file_info, plot_uniform, save_uniform, extract_raster
-from uda import generate_uniform_design, bin_metrics, generate_all_layers, generate_id_im, generate_id_list
+from utils import get_file_info, plot_uniform, save_uniform, extract_raster, plan_memory
+from utils import load_checkpoint, save_checkpoint, clear_checkpoint
+from utils import get_scheduler, get_file_info_chunked, load_raster_chunked, MaskStack
+from utils import load_candidate_points, points_to_image
+from uda import generate_uniform_design, build_id_image, build_id_image_chunked, generate_id_list, \
+    generate_uniform_design_batched
+from sda import generate_uniform_poisson_design, generate_uniform_design_points, generate_uniform_cost_design
 import os
 import numpy as np
 import click
+from functools import partial
 from matplotlib import pyplot as plt
 
 
@@ -34,44 +60,127 @@ from matplotlib import pyplot as plt
 @click.option('--bins', multiple=True, help='Number of bins to break each metric into')
 @click.option('--mask_path', type=str, default=None, help='Specify path and name of the invalid areas mask')
 @click.option('--nsp', type=int, default=30, help='Specify an integer number of sample sites')
-def generate_design(save_folder, hab_path, metrics, bins, mask_path, nsp):
+@click.option('--max_memory', type=str, default=None, help='Memory limit, for example 16G (default no limit)')
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped design')
+@click.option('--checkpoint_every', type=int, default=None, help='Number of sites placed between checkpoints (default 10)')
+@click.option('--mode', type=click.Choice(['greedy', 'poisson', 'cost']), default='greedy', help='Site placement method')
+@click.option('--backend', type=click.Choice(['numpy', 'dask']), default='numpy', help='Array backend used to bin the metrics')
+@click.option('--scheduler', type=str, default='processes', help='Dask scheduler, processes or a cluster address')
+@click.option('--chunk_rows', type=int, default=1024, help='Number of map rows in each chunk for the dask backend')
+@click.option('--threads', type=int, default=None, help='Number of metric maps read and binned at once')
+@click.option('--exclude_path', multiple=True, help='Path and name of an extra exclusion mask')
+@click.option('--candidates_path', type=str, default=None, help='Path and name of the candidate points file')
+@click.option('--friction_path', type=str, default=None, help='Path and name of the friction raster for cost mode')
+@click.option('--batch_size', type=int, default=None, help='Largest number of sites placed between distance transforms')
+@click.option('--tolerance', type=float, default=0.0, help='Fraction of spacing a site may lose in a batch')
+def generate_design(save_folder, hab_path, metrics, bins, mask_path, nsp, max_memory, resume, checkpoint_every, mode,
+                    backend, scheduler, chunk_rows, threads, exclude_path, candidates_path, friction_path, batch_size,
+                    tolerance):
+    if candidates_path is not None and (mode != 'greedy' or backend != 'numpy'):
+        raise click.UsageError('--candidates_path can only be used with the greedy mode and numpy backend')
+    if (mode == 'cost') != (friction_path is not None):
+        raise click.UsageError('--friction_path is needed with, and only used with, --mode=cost')
+    if mode == 'poisson' and (resume or checkpoint_every is not None):
+        raise click.UsageError('--resume and --checkpoint_every can not be used with --mode=poisson, which places '
+                               'all sites at once')
+    if checkpoint_every is None:
+        checkpoint_every = 10
+    if batch_size is not None and (mode != 'greedy' or candidates_path is not None):
+        raise click.UsageError('--batch_size can only be used with the greedy mode on the maps')
 
     # make results folder to save output
     save_path = 'results/{}'.format(save_folder)
     if not os.path.exists(save_path):
         os.mkdir(save_path)
 
-    # get geo info and habitat map from tif file
-    habmap, n_bins, res, geo_t, prj_info = get_file_info(hab_path)
+    # get geo info and habitat map from tif file, the dask backend only reads the maps chunk by chunk
+    if backend == 'dask':
+        compute_kwargs = get_scheduler(scheduler)
+        habmap, n_bins, res, geo_t, prj_info = get_file_info_chunked(hab_path, chunk_rows, compute_kwargs)
+        read_metric = partial(load_raster_chunked, chunk_rows=chunk_rows)
+    else:
+        habmap, n_bins, res, geo_t, prj_info = get_file_info(hab_path)
+        read_metric = extract_raster
+
+    # choose how to store the metric layers, failing now if the design will not fit in memory
+    representation, tile_rows = 'in-memory', None
+    if max_memory is not None and backend == 'numpy':
+        plan = plan_memory(habmap.shape[0], habmap.shape[1], len(metrics) + 1,
+                           [n_bins] + [int(b) for b in bins], nsp, max_memory)
+        representation, tile_rows = plan['representation'], plan['tile_rows']
 
     if mask_path is not None:
         mask = extract_raster(mask_path)
     else:
         mask = np.ones((habmap.shape[0], habmap.shape[1]))
 
+    # combine any extra exclusion masks, stored one bit per pixel
+    if exclude_path:
+        stack = MaskStack(mask.shape).add('mask', mask)
+        for path in exclude_path:
+            stack.add_file(path, path)
+        mask = stack.mask()
+
     metric_list = [habmap]
     bins_list = [n_bins]
 
     for i in range(len(metrics)):
-        metric = extract_raster(metrics[i])
+        if backend == 'numpy' and threads is not None and candidates_path is None:
+            # read on the thread pool by build_id_image, while the other metrics are being binned
+            metric = metrics[i]
+        else:
+            metric = read_metric(metrics[i])
         metric_list.append(metric)
         bins_list.append(int(bins[i]))
 
-    binned_metrics, combo_df, bin_breaks = bin_metrics(metric_list, mask, bins_list)
-    all_layers, id_df, s_opt = generate_all_layers(binned_metrics, mask, combo_df, nsp)
-    id_im, unique_ids = generate_id_im(all_layers, id_df)
+    if candidates_path is not None:
+        # bin the metric values at the candidate points only, so the ids are balanced over the points
+        rows, cols = load_candidate_points(candidates_path, prj_info, geo_t, mask.shape, mask)
+        point_metrics = [metric[rows, cols] for metric in metric_list]
+        binned_points, bin_breaks, point_ids, unique_ids, id_df, s_opt = build_id_image(
+            point_metrics, np.ones(len(rows)), bins_list, nsp, 'sparse')
+        id_im = points_to_image(point_ids, rows, cols, mask.shape)
+        binned_metrics = None
+    elif backend == 'dask':
+        binned_metrics, bin_breaks, id_im, unique_ids, id_df, s_opt = build_id_image_chunked(
+            metric_list, mask, bins_list, nsp, compute_kwargs)
+    else:
+        binned_metrics, bin_breaks, id_im, unique_ids, id_df, s_opt = build_id_image(
+            metric_list, mask, bins_list, nsp, representation, tile_rows, threads=threads)
+
+    # the ids to sample are drawn at random, so restore the random state of the run being resumed
+    checkpoint_path = '{}/{}site_unif_checkpoint.pkl'.format(save_path, nsp)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        np.random.set_state(checkpoint['np_random_state'])
+    else:
+        clear_checkpoint(checkpoint_path)
+        save_checkpoint(checkpoint_path, np_random_state=np.random.get_state())
     id_mix, id_df = generate_id_list(unique_ids, s_opt, nsp, id_df)
 
     print(id_df.head())
 
     # generate design
-    x_unif, y_unif = generate_uniform_design(id_mix, id_im)
+    if candidates_path is not None:
+        x_unif, y_unif = generate_uniform_design_points(id_mix, rows, cols, point_ids)
+    elif mode == 'poisson':
+        x_unif, y_unif = generate_uniform_poisson_design(id_mix, id_im)
+    elif mode == 'cost':
+        x_unif, y_unif = generate_uniform_cost_design(id_mix, id_im, extract_raster(friction_path), checkpoint_path,
+                                                      checkpoint_every, resume)
+    elif batch_size is not None:
+        x_unif, y_unif = generate_uniform_design_batched(id_mix, id_im, batch_size, tolerance, checkpoint_path,
+                                                         checkpoint_every, resume)
+    else:
+        x_unif, y_unif = generate_uniform_design(id_mix, id_im, checkpoint_path, checkpoint_every, resume)
 
     # plot design in pop up
     plot_uniform(id_im, mask, x_unif, y_unif)
 
     # save results to csv
-    save_uniform(x_unif, y_unif, id_mix, id_df, id_im, prj_info, geo_t, save_path)
+    save_uniform(x_unif, y_unif, id_mix, id_df, id_im, prj_info, geo_t, save_path, binned_metrics=binned_metrics,
+                 mask=mask)
+    clear_checkpoint(checkpoint_path)
 
     return
 
@@ -0,0 +1,62 @@
+# Script for generating a stratified design directly from polygons
+# File: generate_vector_design.py
+# Author: Ellie Bowler
+# Contact: e.bowler@uea.ac.uk
+# All code available at https://github.com/EllieBowler/
+# This script distributes sample sites evenly over the valid areas given as polygons (for example a GeoPackage or
+# shape file of the study area), without rasterising them, so the placement is not limited by a pixel size.
+###################################################################
+# Usage:
+# --save_folder is the name of the directory where outputs will be saved, in the results subfolder
+# --valid_path is the polygon file of the areas which may be sampled
+# --nsp is the number of sample points which should be an integer value
+# --exclude_path (optional) polygon file of areas which should not be sampled (repeat for each file), reprojected to
+#                the projection of the valid areas if it differs
+###################################################################
+# Example of a 30 site stratified design over the polygons in StudyArea.gpkg, excluding Rivers.gpkg
+# python generate_vector_design.py --save_folder=Vector_Design_Demo --valid_path=input/StudyArea.gpkg
+# --exclude_path=input/Rivers.gpkg --nsp=30
+###################################################################
+
+from utils import plot_vector, save_projected
+from sda import generate_vector_design, read_polygons
+import os
+import click
+
+
+# Arguments used to call the method from the command line
+@click.command()
+@click.option('--save_folder', type=str, default='Vector_Design', help='Name folder where results will be saved')
+@click.option('--valid_path', type=str, help='Path and name of the polygon file of valid areas')
+@click.option('--nsp', type=int, default=30, help='Integer number of sample sites')
+@click.option('--exclude_path', multiple=True, help='Path and name of a polygon file of excluded areas')
+def generate_design(save_folder, valid_path, nsp, exclude_path):
+
+    # make results folder to save output
+    save_path = 'results/{}'.format(save_folder)
+    if not os.path.exists(save_path):
+        os.mkdir(save_path)
+    print('Results will be saved to {}'.format(save_path))
+
+    # read the polygons, excluded areas in another projection are reprojected to that of the valid areas
+    polygons, prj_info = read_polygons(valid_path)
+    exclude_polygons = []
+    for path in exclude_path:
+        exclude, exclude_prj = read_polygons(path, prj_info)
+        if prj_info is None and exclude_prj is not None:
+            raise ValueError('{} has a projection but {} has none, cannot match them'.format(path, valid_path))
+        exclude_polygons += exclude
+
+    # generate design
+    x_vect, y_vect = generate_vector_design(polygons, nsp, exclude_polygons)
+
+    # plot design in pop up (please close plot to continue)
+    plot_vector(polygons, exclude_polygons, x_vect, y_vect)
+
+    # save results to csv
+    save_projected(x_vect, y_vect, prj_info, save_path)
+    return
+
+
+if __name__ == '__main__':
+    generate_design()
@@ -1,2 +1,8 @@
 from .sda import *
 from .sda_update import *
+from .sda_poisson import *
+from .sda_tiled import *
+from .sda_candidates import *
+from .sda_cost import *
+from .sda_vector import *
+from .sda_dynamic import *
@@ -1,16 +1,24 @@
 import numpy as np
-from random import randint
 from scipy import ndimage
 from copy import copy
+from utils.candidates import choose_max
+from utils.checkpoint import load_placement, save_checkpoint, check_checkpoint, pack_distance, restore_distance
 
 
-def generate_stratified_design(mask, nsp):
+def generate_stratified_design(mask, nsp, checkpoint_path=None, checkpoint_every=10, resume=False,
+                               save_distance=False, rng=None):
     """
     Main function for generating a stratified design.
     Places sites iteratively at the maximum distance apart, spacing them evenly in the landscape.
     INPUTS:
         mask: (.npy array) The invalid areas mask
         nsp: (int) Number of sample sites in design
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        save_distance: (bool) also save the distance transform in checkpoints, so it is not recomputed on resume
+        rng: (np.random.Generator) random number generator used to break ties, pass a seeded generator for
+             reproducible designs
     OUTPUTS:
         x_vals: (list) x coordinates of sample sites
         y_vals: (list) y coordinates of sample sites
@@ -23,19 +31,29 @@ def generate_stratified_design(mask, nsp):
     mask_aux = copy(mask)
     x_vals = []
     y_vals = []
+    start = 0
 
-    for i in range(nsp):
+    if rng is None:
+        rng = np.random.default_rng()
+
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, 'generate_stratified_design', mask.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        sites[x_vals.astype(int), y_vals.astype(int)] = 0
+        dist_im = restore_distance(checkpoint, sites)
+        start = len(x_vals)
+        print('Resuming design from checkpoint, {} sites already placed'.format(start))
+
+    for i in range(start, nsp):
         print('Plotting site {}'.format(i + 1))
 
         # Make all elements of EDT map in invalid region 0
         dist_im = dist_im * mask_aux
 
-        # Extract coordinates of pixels with maximum distance value
-        dist_mx = list(zip(*np.where(dist_im == dist_im.max())))
-
-        # Choose one max coord pair at random
-        idx = randint(0, len(dist_mx) - 1)
-        x, y = dist_mx[idx]
+        # Choose one of the pixels with maximum distance value at random
+        x, y = choose_max(dist_im, rng)
 
         # Save x and y coordinates
         x_vals = np.append(x_vals, x)
@@ -47,5 +65,11 @@ def generate_stratified_design(mask, nsp):
         # Update the euclidean distance transform
         dist_im = ndimage.distance_transform_edt(sites)
 
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and ((i + 1) % checkpoint_every == 0 or i + 1 == nsp):
+            save_checkpoint(checkpoint_path, design='generate_stratified_design', shape=mask.shape,
+                            x_vals=x_vals, y_vals=y_vals, random_state=rng.bit_generator.state,
+                            distance=pack_distance(dist_im) if save_distance else None)
+
     print('Stratified sample design complete!')
     return x_vals, y_vals
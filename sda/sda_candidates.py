@@ -0,0 +1,178 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class CandidateDistances(object):
+    """
+    Squared distance (in pixels) from each candidate point to the nearest placed site. When a site is placed only
+    the candidates closer to it than the current largest distance can change, and these are found with a k-d tree,
+    so each site costs time in the number of candidates near it rather than the size of the map.
+    """
+
+    def __init__(self, rows, cols):
+        """
+        INPUTS:
+            rows: (np.array) row of each candidate point
+            cols: (np.array) column of each candidate point
+        """
+        self.points = np.column_stack([rows, cols]).astype(np.float64)
+        self.tree = cKDTree(self.points)
+        self.dist_sq = np.full(len(self.points), np.inf)
+
+    def add_sites(self, x, y):
+        """
+        Update the distances after placing sites
+        INPUTS:
+            x: (np.array) rows of the new sites
+            y: (np.array) columns of the new sites
+        """
+        for xi, yi in zip(np.atleast_1d(x), np.atleast_1d(y)):
+            reach = np.sqrt(self.dist_sq.max())
+            if np.isfinite(reach):
+                near = np.array(self.tree.query_ball_point([xi, yi], reach), dtype=np.int64)
+            else:
+                near = np.arange(len(self.points))
+            if near.size:
+                new_sq = (self.points[near, 0] - xi) ** 2 + (self.points[near, 1] - yi) ** 2
+                self.dist_sq[near] = np.minimum(self.dist_sq[near], new_sq)
+        return
+
+    def choose_max(self, options, rng):
+        """
+        Choose one of the candidates furthest from all sites, uniformly at random among ties
+        INPUTS:
+            options: (np.array) indices of the candidates which may be chosen
+            rng: (np.random.Generator) random number generator
+        OUTPUTS:
+            k: (int) index of the chosen candidate
+        """
+        dist_sq = self.dist_sq[options]
+        return int(rng.choice(options[dist_sq == dist_sq.max()]))
+
+
+def place_at_candidates(rows, cols, groups, fixed_x=(), fixed_y=(), rng=None):
+    """
+    Place sites one at a time at the candidate point furthest from all other sites, as the raster designs do with
+    the distance transform
+    INPUTS:
+        rows: (np.array) row of each candidate point
+        cols: (np.array) column of each candidate point
+        groups: (list) for each site to place, the indices of the candidates it may be placed at
+        fixed_x: (np.array) rows of sites already placed, which are not moved
+        fixed_y: (np.array) columns of sites already placed
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of the placed sites
+        y_vals: (np.array) y coordinates of the placed sites
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    distances = CandidateDistances(rows, cols)
+    distances.add_sites(fixed_x, fixed_y)
+    x_vals = np.zeros(len(groups), dtype=np.int64)
+    y_vals = np.zeros(len(groups), dtype=np.int64)
+    for i, options in enumerate(groups):
+        print('Plotting site {} of {}'.format(i + 1, len(groups)))
+        k = distances.choose_max(options, rng)
+        x_vals[i], y_vals[i] = rows[k], cols[k]
+        distances.add_sites(rows[k], cols[k])
+    return x_vals, y_vals
+
+
+def id_groups(point_ids, id_mix):
+    """
+    Indices of the candidate points in the id of each site
+    INPUTS:
+        point_ids: (np.array) metric id value of each candidate point
+        id_mix: (list) list of metric id values to be sampled
+    OUTPUTS:
+        groups: (list) indices of the candidates with the id of each site
+    """
+    point_ids = np.asarray(point_ids)
+    by_id = {i: np.flatnonzero(point_ids == i) for i in np.unique(id_mix)}
+    missing = [i for i, options in by_id.items() if options.size == 0]
+    if missing:
+        raise ValueError('No candidate points with id {}'.format(', '.join(str(i) for i in missing)))
+    return [by_id[i] for i in id_mix]
+
+
+def generate_stratified_design_points(rows, cols, nsp, rng=None):
+    """
+    Stratified design restricted to candidate points, such as locations along trails and roads
+    INPUTS:
+        rows: (np.array) row of each candidate point, see load_candidate_points
+        cols: (np.array) column of each candidate point
+        nsp: (int) Number of sample sites in design
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    every = np.arange(len(rows))
+    x_vals, y_vals = place_at_candidates(rows, cols, [every] * nsp, rng=rng)
+    print('Stratified sample design complete!')
+    return x_vals, y_vals
+
+
+def update_stratified_design_points(rows, cols, sampled_csv, rng=None):
+    """
+    Update a stratified design restricted to candidate points, keeping the sampled sites
+    INPUTS:
+        rows: (np.array) row of each candidate point, see load_candidate_points
+        cols: (np.array) column of each candidate point
+        sampled_csv: (data frame) Tagged data frame output by the original stratified design
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites, sampled sites first
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    sampled_df = sampled_csv.loc[sampled_csv['sampled'] == 1]
+    sampled_x = sampled_df['row'].values.astype(np.int64)
+    sampled_y = sampled_df['col'].values.astype(np.int64)
+    every = np.arange(len(rows))
+    x_new, y_new = place_at_candidates(rows, cols, [every] * (len(sampled_csv) - len(sampled_df)), sampled_x,
+                                       sampled_y, rng)
+    print('Adapted stratified design complete!')
+    return np.append(sampled_x, x_new), np.append(sampled_y, y_new)
+
+
+def generate_uniform_design_points(id_mix, rows, cols, point_ids, rng=None):
+    """
+    Uniform design restricted to candidate points, each site placed at a candidate with its metric id
+    INPUTS:
+        id_mix: (list) list of metric id values to be sampled
+        rows: (np.array) row of each candidate point, see load_candidate_points
+        cols: (np.array) column of each candidate point
+        point_ids: (np.array) metric id value of each candidate point
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    x_vals, y_vals = place_at_candidates(rows, cols, id_groups(point_ids, id_mix), rng=rng)
+    print('Uniform sample design complete!')
+    return x_vals, y_vals
+
+
+def update_uniform_design_points(id_mix, rows, cols, point_ids, sampled_csv, rng=None):
+    """
+    Update a uniform design restricted to candidate points, keeping the sampled sites
+    INPUTS:
+        id_mix: (list) list of metric id values of the unsampled sites
+        rows: (np.array) row of each candidate point, see load_candidate_points
+        cols: (np.array) column of each candidate point
+        point_ids: (np.array) metric id value of each candidate point
+        sampled_csv: (data frame) Tagged data frame output by the original uniform design
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites, sampled sites first
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    sampled_df = sampled_csv.loc[sampled_csv['sampled'] == 1]
+    sampled_x = sampled_df['row'].values.astype(np.int64)
+    sampled_y = sampled_df['col'].values.astype(np.int64)
+    x_new, y_new = place_at_candidates(rows, cols, id_groups(point_ids, id_mix), sampled_x, sampled_y, rng)
+    print('Adapted uniform design complete!')
+    return np.append(sampled_x, x_new), np.append(sampled_y, y_new)
@@ -0,0 +1,216 @@
+import numpy as np
+import heapq
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+from utils.candidates import choose_max
+from utils.checkpoint import load_placement, save_checkpoint, check_checkpoint
+
+# Moves to the eight neighbouring pixels, with the length of each step in pixels
+STEPS = [(-1, -1, np.sqrt(2)), (-1, 0, 1.0), (-1, 1, np.sqrt(2)), (0, -1, 1.0),
+         (0, 1, 1.0), (1, -1, np.sqrt(2)), (1, 0, 1.0), (1, 1, np.sqrt(2))]
+
+
+class CostField(object):
+    """
+    Travel cost from every pixel to the nearest placed site over a friction surface, used in place of the euclidean
+    distance transform. Moving between neighbouring pixels costs the step length times the mean friction of the two
+    pixels, and pixels with zero, negative or missing friction (for example rivers) cannot be crossed.
+
+    The field is kept between sites: the first site reaches every pixel, so its costs are found in one call to the
+    compiled scipy Dijkstra over the pixel graph. Each later site spreads outwards from its pixel and the spread stops
+    wherever it no longer lowers the cost, so each site only costs time in the area nearer to it than to any other
+    site.
+    """
+
+    def __init__(self, friction):
+        """
+        INPUTS:
+            friction: (np.array) cost of crossing each pixel, per pixel length
+        """
+        imheight, imwidth = friction.shape
+        self.shape = friction.shape
+
+        # Pad with an impassable border so neighbours never fall outside the map
+        friction = np.asarray(friction, dtype=np.float64)
+        self.friction = np.full((imheight + 2, imwidth + 2), np.inf)
+        self.friction[1:-1, 1:-1] = np.where(np.isfinite(friction) & (friction > 0), friction, np.inf)
+        self.cost = np.full(self.friction.shape, np.inf)
+        self.offsets = [(dx * (imwidth + 2) + dy, step) for dx, dy, step in STEPS]
+        self.n_sites = 0
+
+    @property
+    def field(self):
+        """
+        Travel cost from each pixel to the nearest site, infinite where no site can be reached
+        """
+        return self.cost[1:-1, 1:-1]
+
+    def add_site(self, x, y):
+        """
+        Lower the travel costs to a new site, spreading out only as far as costs improve
+        INPUTS:
+            x: (int) row of the new site
+            y: (int) column of the new site
+        OUTPUTS:
+            n_updated: (int) number of pixels whose cost was lowered
+        """
+        source = (int(x) + 1) * self.friction.shape[1] + int(y) + 1
+        self.n_sites += 1
+        if self.n_sites == 1:
+            return self.flood(source)
+
+        # Memory views of the flat arrays are much faster to index one pixel at a time than the arrays themselves
+        cost = self.cost.reshape(-1).data
+        friction = self.friction.reshape(-1).data
+        offsets = self.offsets
+        cost[source] = 0.0
+        heap = [(0.0, source)]
+        n_updated = 0
+        while heap:
+            c, node = heapq.heappop(heap)
+            if c > cost[node]:
+                continue
+            n_updated += 1
+            half = friction[node] / 2
+            for offset, step in offsets:
+                neighbour = node + offset
+                new_cost = c + step * (half + friction[neighbour] / 2)
+                if new_cost < cost[neighbour]:
+                    cost[neighbour] = new_cost
+                    heapq.heappush(heap, (new_cost, neighbour))
+        return n_updated
+
+    def flood(self, source):
+        """
+        Travel costs from a single site to every pixel, found with the compiled scipy Dijkstra over the graph of
+        passable pixels
+        INPUTS:
+            source: (int) flat index of the site in the padded friction array
+        OUTPUTS:
+            n_updated: (int) number of pixels the site can reach
+        """
+        friction = self.friction.reshape(-1)
+        if not np.isfinite(friction[source]):
+            # A site on a pixel which can not be crossed reaches nothing but itself
+            self.cost.reshape(-1)[source] = 0.0
+            return 1
+        passable = np.flatnonzero(np.isfinite(friction))
+        node = np.full(friction.shape, -1, dtype=np.int64)
+        node[passable] = np.arange(len(passable))
+
+        # Each pair of neighbouring passable pixels is joined once, the graph is searched as undirected
+        rows, cols, weights = [], [], []
+        for offset, step in self.offsets:
+            if offset <= 0:
+                continue
+            start = passable[node[passable + offset] >= 0]
+            rows.append(node[start])
+            cols.append(node[start + offset])
+            weights.append(step * (friction[start] / 2 + friction[start + offset] / 2))
+        graph = coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                           shape=(len(passable), len(passable))).tocsr()
+        cost = dijkstra(graph, directed=False, indices=node[source])
+        self.cost.reshape(-1)[passable] = cost
+        return int(np.count_nonzero(np.isfinite(cost)))
+
+
+def generate_cost_design(mask, friction, nsp, checkpoint_path=None, checkpoint_every=10, resume=False, rng=None):
+    """
+    Stratified design spacing sites by travel cost over a friction surface instead of straight line distance.
+    Places sites iteratively at the valid pixel with the highest travel cost to all other sites
+    INPUTS:
+        mask: (np.array) The invalid areas mask
+        friction: (np.array) cost of crossing each pixel, zero or missing where it cannot be crossed
+        nsp: (int) Number of sample sites in design
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    layers = [mask != 0] * nsp
+    x_vals, y_vals = place_by_cost(layers, friction, 'generate_cost_design', checkpoint_path, checkpoint_every,
+                                   resume, rng)
+    print('Stratified cost distance design complete!')
+    return x_vals, y_vals
+
+
+def generate_uniform_cost_design(id_mix, id_im, friction, checkpoint_path=None, checkpoint_every=10, resume=False,
+                                 rng=None):
+    """
+    Uniform design spacing sites by travel cost over a friction surface instead of straight line distance.
+    Each site is placed within its id at the pixel with the highest travel cost to all other sites
+    INPUTS:
+        id_mix: (list) list of metric id values to be sampled
+        id_im: (np.array) distribution of all metric id values in the study landscape
+        friction: (np.array) cost of crossing each pixel, zero or missing where it cannot be crossed
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    layers = (id_im == i for i in id_mix)
+    x_vals, y_vals = place_by_cost(layers, friction, 'generate_uniform_cost_design', checkpoint_path,
+                                   checkpoint_every, resume, rng, nsp=len(id_mix))
+    print('Uniform cost distance design complete!')
+    return x_vals, y_vals
+
+
+def place_by_cost(layers, friction, design, checkpoint_path=None, checkpoint_every=10, resume=False, rng=None,
+                  nsp=None):
+    """
+    Place one site in each layer at the pixel with the highest travel cost to all sites placed before it
+    INPUTS:
+        layers: (iterable) boolean image of the pixels each site may be placed at
+        friction: (np.array) cost of crossing each pixel
+        design: (str) name of the design saved in checkpoints
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path
+        rng: (np.random.Generator) random number generator used to break ties
+        nsp: (int) number of sites, if layers has no length
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    nsp = len(layers) if nsp is None else nsp
+    field = CostField(friction)
+    passable = np.isfinite(field.friction[1:-1, 1:-1])
+    x_vals = np.array([], dtype=np.int64)
+    y_vals = np.array([], dtype=np.int64)
+
+    # The cost field is rebuilt from the saved sites, which gives exactly the same field
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, design, friction.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        for x, y in zip(x_vals, y_vals):
+            field.add_site(x, y)
+        print('Resuming design from checkpoint, {} sites already placed'.format(len(x_vals)))
+
+    for i, layer in enumerate(layers):
+        if i < len(x_vals):
+            continue
+        print('Plotting site {} of {}'.format(i + 1, nsp))
+
+        # Choose one of the allowed pixels with maximum travel cost at random, sites are never placed on pixels
+        # which can not be crossed, but pixels which can not be reached from any site are chosen first
+        x, y = choose_max(np.where(layer & passable, field.field, -1), rng)
+        x_vals = np.append(x_vals, x)
+        y_vals = np.append(y_vals, y)
+        n_updated = field.add_site(x, y)
+        print('Travel costs updated for {} pixels'.format(n_updated))
+
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and ((i + 1) % checkpoint_every == 0 or i + 1 == nsp):
+            save_checkpoint(checkpoint_path, design=design, shape=friction.shape, x_vals=x_vals, y_vals=y_vals,
+                            random_state=rng.bit_generator.state)
+    return x_vals, y_vals
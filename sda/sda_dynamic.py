@@ -0,0 +1,221 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from utils.candidates import choose_max
+
+
+class SiteDesigner(object):
+    """
+    Stratified design which can be changed site by site, for field work where sites are added and dropped from day to
+    day. Alongside the squared distance from every pixel to the nearest site, the designer keeps which site that is
+    (a nearest site label image, the Voronoi cells of the sites) and the bounding box of each cell. Adding a site only
+    updates the pixels within reach of it, removing a site only reassigns the pixels of its own cell, and the largest
+    distance in each row is cached so the next best site is found without scanning the map.
+
+    Example:
+        designer = SiteDesigner(mask, rng=np.random.default_rng(1))
+        sites = [designer.add_site(*designer.next_best_site()) for i in range(30)]
+        designer.remove_site(sites[4])
+        designer.add_site(*designer.next_best_site())
+        designer.save('results/field_design.npz')
+    """
+
+    def __init__(self, mask, rng=None):
+        """
+        INPUTS:
+            mask: (np.array) The invalid areas mask, sites are only suggested where it is not zero
+            rng: (np.random.Generator) random number generator used to break ties
+        """
+        self.valid = np.asarray(mask) != 0
+        self.shape = self.valid.shape
+        self.labels = np.full(self.shape, -1, dtype=np.int32)
+        self.dist_sq = np.full(self.shape, np.inf)
+        self.sites = {}
+        self.boxes = {}
+        self.next_label = 0
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.update_rows(0, self.shape[0])
+
+    def update_rows(self, start, stop):
+        """
+        Recompute the cached largest distances of a range of rows, over valid pixels and over all pixels
+        """
+        if not hasattr(self, 'row_max'):
+            self.row_max = np.full(self.shape[0], -1.0)
+            self.row_reach = np.full(self.shape[0], np.inf)
+        self.row_max[start:stop] = np.where(self.valid[start:stop], self.dist_sq[start:stop], -1).max(axis=1)
+        self.row_reach[start:stop] = self.dist_sq[start:stop].max(axis=1)
+        return
+
+    def set_mask(self, mask):
+        """
+        Change the invalid areas mask, for example when parts of the landscape are found to be inaccessible. The sites
+        and distances are kept, only where new sites are suggested changes
+        INPUTS:
+            mask: (np.array) The updated invalid areas mask
+        """
+        self.valid = np.asarray(mask) != 0
+        self.update_rows(0, self.shape[0])
+        return self
+
+    def add_site(self, x, y):
+        """
+        Add a site, updating only the pixels closer to it than to any other site
+        INPUTS:
+            x: (int) row of the site
+            y: (int) column of the site
+        OUTPUTS:
+            site: (int) label of the new site, used to remove it
+        """
+        x, y = int(x), int(y)
+        imheight, imwidth = self.shape
+        site = self.next_label
+        self.next_label += 1
+        self.sites[site] = (x, y)
+
+        # Only pixels nearer than the largest current distance can change
+        reach = self.row_reach.max()
+        if np.isfinite(reach):
+            window = int(np.ceil(np.sqrt(reach)))
+            r0, r1 = max(x - window, 0), min(x + window + 1, imheight)
+            c0, c1 = max(y - window, 0), min(y + window + 1, imwidth)
+        else:
+            r0, r1, c0, c1 = 0, imheight, 0, imwidth
+        new_sq = (np.arange(r0, r1)[:, None] - x) ** 2 + (np.arange(c0, c1)[None, :] - y) ** 2
+        closer = new_sq < self.dist_sq[r0:r1, c0:c1]
+        self.dist_sq[r0:r1, c0:c1][closer] = new_sq[closer]
+        self.labels[r0:r1, c0:c1][closer] = site
+
+        rows, cols = np.nonzero(closer)
+        if rows.size:
+            self.boxes[site] = (int(r0 + rows.min()), int(r0 + rows.max() + 1), int(c0 + cols.min()),
+                                int(c0 + cols.max() + 1))
+        else:
+            # Placed on top of another site, so its cell is empty
+            self.boxes[site] = (x, x + 1, y, y + 1)
+        self.update_rows(r0, r1)
+        return site
+
+    def remove_site(self, site):
+        """
+        Remove a site, reassigning the pixels of its cell to the nearest remaining sites
+        INPUTS:
+            site: (int) label of the site, as returned by add_site
+        """
+        del self.sites[site]
+        r0, r1, c0, c1 = self.boxes.pop(site)
+        cell = self.labels[r0:r1, c0:c1] == site
+        rows, cols = np.nonzero(cell)
+        if not self.sites:
+            self.labels[r0:r1, c0:c1][cell] = -1
+            self.dist_sq[r0:r1, c0:c1][cell] = np.inf
+        else:
+            labels = np.array(list(self.sites))
+            points = np.array([self.sites[k] for k in labels])
+            _, nearest = cKDTree(points).query(np.column_stack([rows + r0, cols + c0]))
+            new_labels = labels[nearest]
+            self.labels[r0:r1, c0:c1][cell] = new_labels
+            self.dist_sq[r0:r1, c0:c1][cell] = ((rows + r0 - points[nearest, 0]) ** 2 +
+                                                (cols + c0 - points[nearest, 1]) ** 2)
+
+            # The cells which took over the pixels may have grown
+            for k in np.unique(new_labels):
+                taken = new_labels == k
+                b0, b1, b2, b3 = self.boxes[k]
+                self.boxes[k] = (int(min(b0, r0 + rows[taken].min())), int(max(b1, r0 + rows[taken].max() + 1)),
+                                 int(min(b2, c0 + cols[taken].min())), int(max(b3, c0 + cols[taken].max() + 1)))
+        self.update_rows(r0, r1)
+        return self
+
+    def next_best_site(self, within=None):
+        """
+        Valid pixel furthest from all sites, chosen at random among ties as in generate_stratified_design
+        INPUTS:
+            within: (np.array) if given, only consider pixels where this is True, for example id_im == i to place
+                    a site of a uniform design
+        OUTPUTS:
+            x: (int) row of the suggested site
+            y: (int) column of the suggested site
+        """
+        if within is not None:
+            return choose_max(np.where(self.valid & within, self.dist_sq, -1), self.rng)
+
+        mx = self.row_max.max()
+        if mx < 0:
+            # No valid pixels, as in generate_stratified_design any pixel may be chosen
+            return choose_max(np.zeros(self.shape), self.rng)
+
+        # Only the rows holding the largest distance are searched, in the same order as choose_max
+        counts = np.zeros(self.shape[0], dtype=np.int64)
+        for row in np.flatnonzero(self.row_max == mx):
+            counts[row] = np.count_nonzero(self.valid[row] & (self.dist_sq[row] == mx))
+        cum_counts = np.cumsum(counts)
+        k = self.rng.integers(cum_counts[-1])
+        x = int(np.searchsorted(cum_counts, k, side='right'))
+        k -= cum_counts[x] - counts[x]
+        return x, int(np.flatnonzero(self.valid[x] & (self.dist_sq[x] == mx))[k])
+
+    @property
+    def distance(self):
+        """
+        Euclidean distance from every pixel to the nearest site, as ndimage.distance_transform_edt of the sites
+        """
+        return np.sqrt(self.dist_sq)
+
+    def coordinates(self):
+        """
+        Sites in the order they were added
+        OUTPUTS:
+            x_vals: (np.array) x coordinates of sample sites
+            y_vals: (np.array) y coordinates of sample sites
+            labels: (np.array) label of each site
+        """
+        labels = np.array(sorted(self.sites), dtype=np.int64)
+        points = np.array([self.sites[k] for k in labels], dtype=np.int64).reshape(-1, 2)
+        return points[:, 0], points[:, 1], labels
+
+    def save(self, file_path, **extra):
+        """
+        Save the designer to a .npz file, to continue on another day. The distances are rebuilt from the nearest site
+        labels when loading, so are not saved
+        INPUTS:
+            file_path: (str) path of the .npz file
+            **extra: any other arrays or values to keep with the design, such as geo_t and prj_info
+        """
+        x_vals, y_vals, labels = self.coordinates()
+        np.savez_compressed(file_path, valid=np.packbits(self.valid), shape=np.array(self.shape), labels=self.labels,
+                            x_vals=x_vals, y_vals=y_vals, site_labels=labels, next_label=self.next_label,
+                            random_state=np.array(self.rng.bit_generator.state, dtype=object),
+                            boxes=np.array([self.boxes[k] for k in labels], dtype=np.int64).reshape(-1, 4), **extra)
+        return
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Load a designer saved with save
+        INPUTS:
+            file_path: (str) path of the .npz file
+        OUTPUTS:
+            designer: (SiteDesigner) the saved designer
+            extra: (dict) the extra values saved with it
+        """
+        saved = dict(np.load(file_path, allow_pickle=True))
+        shape = tuple(saved.pop('shape'))
+        designer = cls(np.unpackbits(saved.pop('valid'), count=int(np.prod(shape))).reshape(shape))
+        designer.rng.bit_generator.state = saved.pop('random_state').item()
+        designer.labels = saved.pop('labels')
+        designer.next_label = int(saved.pop('next_label'))
+        labels = saved.pop('site_labels')
+        x_vals, y_vals = saved.pop('x_vals'), saved.pop('y_vals')
+        designer.sites = {int(k): (int(x), int(y)) for k, x, y in zip(labels, x_vals, y_vals)}
+        designer.boxes = {int(k): tuple(int(v) for v in box) for k, box in zip(labels, saved.pop('boxes'))}
+
+        # Distance of every pixel to the site it belongs to
+        if len(labels):
+            lookup = np.zeros((designer.next_label, 2), dtype=np.int64)
+            lookup[labels] = np.column_stack([x_vals, y_vals])
+            owner = lookup[np.maximum(designer.labels, 0)]
+            rows, cols = np.indices(shape)
+            designer.dist_sq = np.where(designer.labels >= 0, (rows - owner[..., 0]) ** 2 +
+                                        (cols - owner[..., 1]) ** 2, np.inf)
+        designer.update_rows(0, shape[0])
+        return designer, {name: value.item() if value.ndim == 0 else value for name, value in saved.items()}
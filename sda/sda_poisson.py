@@ -0,0 +1,244 @@
+import numpy as np
+import heapq
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+
+def poisson_disk_sample(mask, radius, seed=None, k=30):
+    """
+    Place sites over the valid areas of the mask so no two are closer than radius, using grid accelerated
+    Poisson disk sampling (Bridson). Gaps left between regions are filled afterwards, so every valid pixel
+    ends up within radius of a site.
+    INPUTS:
+        mask: (.npy array) The invalid areas mask
+        radius: (float) minimum distance between sites in pixels
+        seed: (int) random seed, the same seed and radius give the same sites
+        k: (int) number of candidate sites tried around each site before it is retired
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    rng = np.random.default_rng(seed)
+    valid = mask != 0
+    imheight, imwidth = mask.shape
+    radius_sq = radius ** 2
+
+    # Background grid with cells small enough to hold at most one site
+    cell = radius / np.sqrt(2)
+    grid = -np.ones((int(np.ceil(imheight / cell)) + 1, int(np.ceil(imwidth / cell)) + 1), dtype=np.int32)
+    x_vals = []
+    y_vals = []
+    active = []
+
+    def fits(x, y):
+        if x < 0 or y < 0 or x >= imheight or y >= imwidth or not valid[x, y]:
+            return False
+        gx, gy = int(x / cell), int(y / cell)
+        for i in grid[max(gx - 2, 0):gx + 3, max(gy - 2, 0):gy + 3].ravel():
+            if i >= 0 and (x_vals[i] - x) ** 2 + (y_vals[i] - y) ** 2 < radius_sq:
+                return False
+        return True
+
+    def add(x, y):
+        grid[int(x / cell), int(y / cell)] = len(x_vals)
+        active.append(len(x_vals))
+        x_vals.append(x)
+        y_vals.append(y)
+
+    def grow():
+        # Try candidates in the annulus between radius and 2 * radius around a random active site
+        while active:
+            a = rng.integers(len(active))
+            i = active[a]
+            for angle, dist in zip(rng.uniform(0, 2 * np.pi, k), rng.uniform(radius, 2 * radius, k)):
+                x = int(round(x_vals[i] + dist * np.cos(angle)))
+                y = int(round(y_vals[i] + dist * np.sin(angle)))
+                if fits(x, y):
+                    add(x, y)
+                    break
+            else:
+                active[a] = active[-1]
+                active.pop()
+
+    # Grow from one random valid pixel
+    valid_idx = np.flatnonzero(valid)
+    if valid_idx.size == 0:
+        return np.array([]), np.array([])
+    add(*divmod(int(valid_idx[rng.integers(valid_idx.size)]), imwidth))
+    del valid_idx
+    grow()
+
+    # Seed again from any valid pixels still further than radius from all sites (separate patches and gaps)
+    sites = np.ones((imheight, imwidth))
+    sites[x_vals, y_vals] = 0
+    uncovered = np.flatnonzero(valid & (ndimage.distance_transform_edt(sites) >= radius))
+    rng.shuffle(uncovered)
+    for idx in uncovered:
+        x, y = divmod(int(idx), imwidth)
+        if fits(x, y):
+            add(x, y)
+            grow()
+
+    return np.array(x_vals, dtype=float), np.array(y_vals, dtype=float)
+
+
+def thin_design(x_vals, y_vals, nsp):
+    """
+    Remove sites one at a time from the closest pair until nsp remain. The distance from each site to its nearest
+    neighbour is kept in a heap, and only the sites whose nearest neighbour was removed are looked up again
+    INPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+        nsp: (int) Number of sample sites to keep
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of the remaining sample sites
+        y_vals: (np.array) y coordinates of the remaining sample sites
+    """
+    n_sites = len(x_vals)
+    if n_sites <= nsp:
+        return x_vals, y_vals
+    points = np.column_stack([x_vals, y_vals])
+    tree = cKDTree(points)
+    removed = np.zeros(n_sites, dtype=bool)
+
+    def nearest_site(i):
+        # Look at more and more neighbours until one has not been removed
+        k = 2
+        while True:
+            k = min(2 * k, n_sites)
+            dist, idx = tree.query(points[i], k=k)
+            keep = (idx != i) & (idx < n_sites)
+            keep[keep] = ~removed[idx[keep]]
+            if keep.any():
+                first = np.argmax(keep)
+                return float(dist[first]), int(idx[first])
+            if k == n_sites:
+                return np.inf, i
+
+    # The first neighbour found can be the site itself when two sites share a position
+    dist, idx = tree.query(points, k=2)
+    own = idx[:, 0] == np.arange(n_sites)
+    nearest = np.where(own, idx[:, 1], idx[:, 0])
+    nearest_dist = dist[:, 1].tolist()
+    nearest_to = [[] for i in range(n_sites)]
+    for i, j in enumerate(nearest):
+        nearest_to[j].append(i)
+
+    # Drop the lowest numbered site of the closest pair, skipping heap entries which are out of date
+    heap = [(d, i) for i, d in enumerate(nearest_dist)]
+    heapq.heapify(heap)
+    n_left = n_sites
+    while n_left > nsp:
+        d, drop = heapq.heappop(heap)
+        if removed[drop] or d != nearest_dist[drop]:
+            continue
+        removed[drop] = True
+        n_left -= 1
+        for i in nearest_to[drop]:
+            if not removed[i]:
+                nearest_dist[i], j = nearest_site(i)
+                nearest_to[j].append(i)
+                heapq.heappush(heap, (nearest_dist[i], i))
+    return x_vals[~removed], y_vals[~removed]
+
+
+def generate_poisson_design(mask, nsp, seed=None, max_iter=30, spacing=None):
+    """
+    Fast alternative to generate_stratified_design for large maps, spacing sites evenly with Poisson disk sampling
+    rather than exact greedy placement. The disk radius is found by binary search to give nsp sites.
+    INPUTS:
+        mask: (.npy array) The invalid areas mask
+        nsp: (int) Number of sample sites in design
+        seed: (int) random seed, used for every radius tried so the number of sites changes smoothly with radius
+        max_iter: (int) maximum number of radii tried in the binary search
+        spacing: (np.array) if given, distance from each pixel to the sites already placed, pixels closer than the
+            disk radius to them are not used
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    n_valid = np.count_nonzero(mask)
+    if nsp > n_valid:
+        raise ValueError('Cannot place {} sites in {} valid pixels'.format(nsp, n_valid))
+    if seed is None:
+        seed = int(np.random.default_rng().integers(np.iinfo(np.int32).max))
+
+    def sample(radius):
+        if spacing is None:
+            return poisson_disk_sample(mask, radius, seed)
+        return poisson_disk_sample((mask != 0) & (spacing >= radius), radius, seed)
+
+    # One site always fits, so no radius is too large for it, place it at a random valid pixel
+    if nsp <= 1 and spacing is None:
+        valid_idx = np.flatnonzero(mask != 0)[np.random.default_rng(seed).integers(n_valid, size=nsp)]
+        x_vals, y_vals = np.divmod(valid_idx, mask.shape[1])
+        print('Poisson disk stratified design complete!')
+        return x_vals.astype(float), y_vals.astype(float)
+
+    # Start from a radius too large to fit nsp sites, keeping the largest radius found which fits at least nsp.
+    # No two sites fit within the map diagonal, so the radius is never grown past it
+    diagonal = np.hypot(*mask.shape)
+    lower, best = 1.0, None
+    upper = min(max(2 * np.sqrt(n_valid / float(nsp)), 2.0), diagonal)
+    x_vals, y_vals = sample(upper)
+    while len(x_vals) >= nsp and upper < diagonal:
+        lower, best = upper, (x_vals, y_vals)
+        upper = min(upper * 2, diagonal)
+        x_vals, y_vals = sample(upper)
+
+    for i in range(max_iter):
+        if (best is not None and len(best[0]) == nsp) or upper - lower < 1e-3:
+            break
+        radius = (lower + upper) / 2.0
+        x_vals, y_vals = sample(radius)
+        print('Radius {:.2f} pixels gives {} sites'.format(radius, len(x_vals)))
+        if len(x_vals) >= nsp:
+            lower, best = radius, (x_vals, y_vals)
+        else:
+            upper = radius
+
+    if best is None:
+        best = sample(lower)
+    x_vals, y_vals = thin_design(best[0], best[1], nsp)
+    print('Poisson disk stratified design complete!')
+    return x_vals, y_vals
+
+
+def generate_uniform_poisson_design(id_mix, id_im, seed=None):
+    """
+    Fast alternative to generate_uniform_design for large maps, placing the sites for each id with
+    generate_poisson_design inside that id only. Each id is kept at least its disk radius away from the sites
+    already placed for the ids before it.
+    INPUTS:
+        id_mix: (list) list of metric id values to be sampled
+        id_im: (np.array) distribution of all metric id values in the study landscape
+        seed: (int) random seed
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites, in the order of id_mix
+        y_vals: (np.array) y coordinates of sample sites, in the order of id_mix
+    """
+    id_mix = np.asarray(id_mix)
+    x_vals = np.zeros(len(id_mix))
+    y_vals = np.zeros(len(id_mix))
+    placed = np.zeros(len(id_mix), dtype=bool)
+    for i in np.unique(id_mix):
+        print('Plotting sites for id number {}'.format(i))
+        positions = np.flatnonzero(id_mix == i)
+
+        # Work on the bounding box of the id only
+        rows, cols = np.nonzero(id_im == i)
+        row_min, col_min = rows.min(), cols.min()
+        mask_id = id_im[row_min:rows.max() + 1, col_min:cols.max() + 1] == i
+
+        # Distance from each pixel of the id to the sites placed for earlier ids
+        spacing = None
+        if placed.any():
+            spacing = np.full(mask_id.shape, np.inf)
+            tree = cKDTree(np.column_stack([x_vals[placed], y_vals[placed]]))
+            spacing[rows - row_min, cols - col_min] = tree.query(np.column_stack([rows, cols]))[0]
+        x, y = generate_poisson_design(mask_id, len(positions), seed, spacing=spacing)
+        x_vals[positions] = x + row_min
+        y_vals[positions] = y + col_min
+        placed[positions] = True
+    print('Poisson disk uniform design complete!')
+    return x_vals, y_vals
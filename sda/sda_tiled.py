@@ -0,0 +1,168 @@
+import numpy as np
+from scipy import ndimage
+from multiprocessing import Pool
+from .sda import generate_stratified_design
+from utils.candidates import choose_max
+from utils.local_update import nearest_spacing
+
+
+def split_tiles(shape, n_tiles):
+    """
+    Split the landscape into a grid of n_tiles x n_tiles tiles
+    INPUTS:
+        shape: (tuple) height and width of the mask
+        n_tiles: (int) number of tiles along each side
+    OUTPUTS:
+        tiles: (list) first row, last row + 1, first column and last column + 1 of each tile
+    """
+    row_breaks = np.linspace(0, shape[0], n_tiles + 1).astype(int)
+    col_breaks = np.linspace(0, shape[1], n_tiles + 1).astype(int)
+    return [(row_breaks[i], row_breaks[i + 1], col_breaks[j], col_breaks[j + 1])
+            for i in range(n_tiles) for j in range(n_tiles)]
+
+
+def tile_quotas(mask, tiles, nsp):
+    """
+    Share the sample sites between tiles in proportion to their valid area (largest remainder rounding)
+    INPUTS:
+        mask: (.npy array) The invalid areas mask
+        tiles: (list) tile extents from split_tiles
+        nsp: (int) Number of sample sites in design
+    OUTPUTS:
+        quotas: (np.array) number of sample sites in each tile
+    """
+    areas = np.array([np.count_nonzero(mask[r0:r1, c0:c1]) for r0, r1, c0, c1 in tiles], dtype=float)
+    if areas.sum() == 0:
+        raise ValueError('No valid pixels in the mask to share {} sites between tiles'.format(nsp))
+    share = nsp * areas / areas.sum()
+    quotas = np.floor(share).astype(int)
+    quotas[np.argsort(quotas - share)[:nsp - quotas.sum()]] += 1
+    return quotas
+
+
+def design_tile(tile_args):
+    """
+    Run generate_stratified_design on one tile, used by the process pool
+    """
+    mask_tile, quota, seed = tile_args
+    if quota == 0:
+        return np.array([]), np.array([])
+    return generate_stratified_design(mask_tile, quota, rng=np.random.default_rng(seed))
+
+
+def relocate_site(mask, x_vals, y_vals, k, window, margin, rng=None):
+    """
+    Move site k to the valid pixel in its window which is furthest from all other sites
+    INPUTS:
+        mask: (.npy array) The invalid areas mask
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+        k: (int) index of the site to move
+        window: (tuple) first row, last row + 1, first column and last column + 1 the site may move within
+        margin: (int) extra pixels around the window in which other sites are included in the distance transform
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x: (int) new x coordinate
+        y: (int) new y coordinate
+        dist: (float) distance from the new position to the nearest other site
+    """
+    imheight, imwidth = mask.shape
+    r0, r1, c0, c1 = max(window[0] - margin, 0), min(window[1] + margin, imheight), \
+        max(window[2] - margin, 0), min(window[3] + margin, imwidth)
+    sites = np.ones((r1 - r0, c1 - c0))
+    others = np.arange(len(x_vals)) != k
+    inside = others & (x_vals >= r0) & (x_vals < r1) & (y_vals >= c0) & (y_vals < c1)
+    sites[x_vals[inside].astype(int) - r0, y_vals[inside].astype(int) - c0] = 0
+    dist_im = ndimage.distance_transform_edt(sites)
+
+    # Only pixels inside the window itself are candidates
+    candidates = np.zeros(dist_im.shape)
+    w0, w1, v0, v1 = window[0] - r0, window[1] - r0, window[2] - c0, window[3] - c0
+    candidates[w0:w1, v0:v1] = dist_im[w0:w1, v0:v1] * mask[window[0]:window[1], window[2]:window[3]]
+    x, y = choose_max(candidates, rng)
+    return x + r0, y + c0, candidates[x, y]
+
+
+def generate_tiled_stratified_design(mask, nsp, n_tiles=2, move_margin=50, processes=None, max_moves=None,
+                                     compare=False, rng=None):
+    """
+    Generate a stratified design in parallel by splitting the landscape into tiles, each given a share of the sample
+    sites proportional to its valid area. Tiles are designed on a process pool, then sites which end up closer across
+    tile borders than the spacing achieved within the tiles are moved, each within its tile extended by move_margin.
+    The tiles themselves do not overlap.
+    INPUTS:
+        mask: (.npy array) The invalid areas mask
+        nsp: (int) Number of sample sites in design
+        n_tiles: (int) number of tiles along each side
+        move_margin: (int) number of pixels a site may move over its tile border when reconciling
+        processes: (int) number of processes (default all cpus)
+        max_moves: (int) maximum number of sites moved when reconciling borders (default nsp)
+        compare: (bool) also run a single tile design, to report the spacing lost by tiling
+        rng: (np.random.Generator) random number generator, seeds each tile and breaks ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+        spacing: (dict) minimum spacing within tiles ('tile_min_spacing'), across the design before and after
+                 reconciliation ('seam_min_spacing', 'min_spacing'), number of sites moved ('moved') and the minimum
+                 spacing of a single tile design if compare is True ('single_tile_min_spacing')
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    imheight, imwidth = mask.shape
+    tiles = split_tiles(mask.shape, n_tiles)
+    quotas = tile_quotas(mask, tiles, nsp)
+    print('Designing {} tiles with {} sites in total'.format(len(tiles), nsp))
+
+    # Design the tiles in parallel
+    tile_seeds = rng.integers(np.iinfo(np.int32).max, size=len(tiles))
+    tile_args = [(mask[r0:r1, c0:c1], quota, seed) for (r0, r1, c0, c1), quota, seed in zip(tiles, quotas, tile_seeds)]
+    pool = Pool(processes)
+    tile_designs = pool.map(design_tile, tile_args)
+    pool.close()
+    pool.join()
+
+    x_vals, y_vals, site_tiles = [], [], []
+    tile_spacing = []
+    for t, ((r0, r1, c0, c1), (x, y)) in enumerate(zip(tiles, tile_designs)):
+        x_vals = np.append(x_vals, np.asarray(x) + r0)
+        y_vals = np.append(y_vals, np.asarray(y) + c0)
+        site_tiles = np.append(site_tiles, [t] * len(x)).astype(int)
+        if len(x) > 1:
+            tile_spacing.append(nearest_spacing(x, y).min())
+    tile_min = min(tile_spacing) if tile_spacing else np.inf
+    seam_min = nearest_spacing(x_vals, y_vals).min()
+
+    # Reconcile sites which are closer across a border than the spacing achieved within the tiles
+    if max_moves is None:
+        max_moves = nsp
+    moved = set()
+    settled = set()
+    for i in range(max_moves):
+        spacing = nearest_spacing(x_vals, y_vals)
+        order = [k for k in np.argsort(spacing) if spacing[k] < tile_min and k not in settled]
+        if not order:
+            break
+        k = order[0]
+        r0, r1, c0, c1 = tiles[site_tiles[k]]
+        window = (max(r0 - move_margin, 0), min(r1 + move_margin, imheight), max(c0 - move_margin, 0),
+                  min(c1 + move_margin, imwidth))
+        x, y, dist = relocate_site(mask, x_vals, y_vals, k, window, int(np.ceil(2 * tile_min)) if np.isfinite(tile_min)
+                                   else move_margin, rng)
+        settled.add(k)
+        if dist > spacing[k]:
+            x_vals[k], y_vals[k] = x, y
+            moved.add(k)
+            # Moving this site may have freed its neighbours
+            settled = {k}
+    spacing = {'tile_min_spacing': tile_min, 'seam_min_spacing': seam_min,
+               'min_spacing': nearest_spacing(x_vals, y_vals).min(), 'moved': len(moved)}
+    print('Moved {} sites near tile borders, minimum spacing {:.1f} pixels (within tiles {:.1f}, before moving {:.1f})'
+          .format(len(moved), spacing['min_spacing'], tile_min, seam_min))
+
+    if compare:
+        x_single, y_single = generate_stratified_design(mask, nsp, rng=rng)
+        spacing['single_tile_min_spacing'] = nearest_spacing(x_single, y_single).min()
+        print('Minimum spacing of a single tile design {:.1f} pixels'.format(spacing['single_tile_min_spacing']))
+
+    print('Tiled stratified sample design complete!')
+    return x_vals, y_vals, spacing
@@ -1,16 +1,25 @@
 import numpy as np
-from random import randint
 from scipy import ndimage
 from copy import copy
+from utils.candidates import choose_max
+from utils.checkpoint import load_placement, save_checkpoint, check_checkpoint
+from utils.local_update import find_affected_sites, local_update_report
 
 
-def update_stratified_design(mask, sampled_csv):
+def update_stratified_design(mask, sampled_csv, checkpoint_path=None, checkpoint_every=10, resume=False, rng=None,
+                             kept=None):
     """
     Main function for updating an existing or partially completed sample design, when certain sites are inaccessible.
     Takes as inputs an updated invalid areas mask, and a .csv file showing already sampled sites.
     INPUTS:
         mask: (np.array) Invalid areas mask
         sampled_csv: (data frame) Tagged data frame output by the original stratified design
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        rng: (np.random.Generator) random number generator used to break ties, pass a seeded generator for
+             reproducible designs
+        kept: (np.array) if given, true for unsampled sites which also stay where they are
     OUTPUTS:
         x_vals: (list) x coordinates of sample sites
         y_vals: (list) y coordinates of sample sites
@@ -18,9 +27,13 @@ def update_stratified_design(mask, sampled_csv):
 
     # Extract sampled site information from csv file
     nsp = len(sampled_csv)
-    sampled_df = sampled_csv.loc[sampled_csv['sampled'] == 1]
+    fixed = sampled_csv['sampled'].values == 1
+    print('{} sites already sampled and will not be moved'.format(np.count_nonzero(fixed)))
+    if kept is not None:
+        print('{} unsampled sites kept in place'.format(np.count_nonzero(kept & ~fixed)))
+        fixed = fixed | kept
+    sampled_df = sampled_csv.loc[fixed]
     n_sampled = len(sampled_df)
-    print('{} sites already sampled and will not be moved'.format(n_sampled))
     print('{} sites to be adjusted based on mask update'.format(nsp - n_sampled))
 
     # Initialise empty arrays and lists to save design
@@ -33,8 +46,21 @@ def update_stratified_design(mask, sampled_csv):
     mask_aux = copy(mask)
     x_vals = [sampled_x]
     y_vals = [sampled_y]
+    start = 0
 
-    for i in range(nsp - n_sampled):
+    if rng is None:
+        rng = np.random.default_rng()
+
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, 'update_stratified_design', mask.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        sites[x_vals.astype(int), y_vals.astype(int)] = 0
+        start = len(x_vals) - n_sampled
+        print('Resuming design from checkpoint, {} sites already placed'.format(start))
+
+    for i in range(start, nsp - n_sampled):
         print('Plotting site {} of {}'.format(i + 1, nsp - n_sampled))
 
         # Generate EDT image of all sampled/selected sites
@@ -43,12 +69,8 @@ def update_stratified_design(mask, sampled_csv):
         # Make all elements of EDT map in invalid region 0
         dist_im *= mask_aux
 
-        # Extract coordinates of pixels with maximum distance value
-        dist_mx = list(zip(*np.where(dist_im == dist_im.max())))
-
-        # Choose one max coord pair at random
-        idx = randint(0, len(dist_mx) - 1)
-        x, y = dist_mx[idx]
+        # Choose one of the pixels with maximum distance value at random
+        x, y = choose_max(dist_im, rng)
 
         # Save x and y coordinates
         x_vals = np.append(x_vals, x)
@@ -57,5 +79,47 @@ def update_stratified_design(mask, sampled_csv):
         # Code chosen site to be zero in site array
         sites[x, y] = 0
 
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and ((i + 1) % checkpoint_every == 0 or i + 1 == nsp - n_sampled):
+            save_checkpoint(checkpoint_path, design='update_stratified_design', shape=mask.shape,
+                            x_vals=x_vals, y_vals=y_vals, random_state=rng.bit_generator.state)
+
     print('Adapted stratified design complete!')
     return x_vals, y_vals
+
+
+def update_stratified_design_local(original_mask, updated_mask, sampled_csv, factor=1.0, checkpoint_path=None,
+                                   checkpoint_every=10, resume=False, rng=None):
+    """
+    Update a stratified design after a mask change, placing again only the sites affected by the change (see
+    find_affected_sites). All other sites stay where they are, so the cost depends on the size of the change.
+    INPUTS:
+        original_mask: (np.array) invalid areas mask the design was generated with
+        updated_mask: (np.array) updated invalid areas mask
+        sampled_csv: (data frame) Tagged data frame output by the original stratified design
+        factor: (float) multiple of the nearest neighbour distance searched for mask changes around each site
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites, sampled sites first then the others in their original order
+        y_vals: (np.array) y coordinates of sample sites, in the same order
+        report: (data frame) output of local_update_report
+    """
+    affected = find_affected_sites(original_mask, updated_mask, sampled_csv, factor)
+    print('{} of {} unsampled sites affected by the mask update'.format(
+        affected.sum(), sum(sampled_csv['sampled'] != 1)))
+
+    # Keep every unaffected site in place
+    x_all, y_all = update_stratified_design(updated_mask, sampled_csv, checkpoint_path, checkpoint_every, resume, rng,
+                                            kept=~affected)
+    x_new = sampled_csv['row'].values.astype(float)
+    y_new = sampled_csv['col'].values.astype(float)
+    x_new[affected] = np.hstack(x_all)[np.count_nonzero(~affected):]
+    y_new[affected] = np.hstack(y_all)[np.count_nonzero(~affected):]
+    report = local_update_report(sampled_csv, affected, x_new, y_new)
+
+    sampled = sampled_csv['sampled'].values == 1
+    order = np.concatenate([np.flatnonzero(sampled), np.flatnonzero(~sampled)])
+    return x_new[order], y_new[order], report
@@ -0,0 +1,673 @@
+import numpy as np
+import heapq
+from osgeo import ogr, osr
+
+# Number of points or segments tested against the polygon edges at once
+EDGE_BLOCK = 1024
+
+
+def geometry_rings(geom):
+    """
+    Rings of every polygon in an ogr geometry, multi polygons and collections are split into their polygons
+    """
+    name = geom.GetGeometryName()
+    if name == 'POLYGON':
+        return [[np.array(geom.GetGeometryRef(j).GetPoints())[:, :2] for j in range(geom.GetGeometryCount())]]
+    polygons = []
+    if name.startswith('MULTI') or name == 'GEOMETRYCOLLECTION':
+        for j in range(geom.GetGeometryCount()):
+            polygons += geometry_rings(geom.GetGeometryRef(j))
+    return polygons
+
+
+def read_polygons(vector_path, prj_info=None):
+    """
+    Read the polygons of a vector file, such as a GeoPackage or shape file
+    INPUTS:
+        vector_path: (str) path to the vector file
+        prj_info: (string) if given, polygons are reprojected to this projection when the file uses another
+    OUTPUTS:
+        polygons: (list) each polygon as a list of rings (outer boundary then holes), each ring an array of x, y
+        prj_info: (string) projection information of the polygons, None if the file has none
+    """
+    source = ogr.Open(vector_path)
+    if source is None:
+        raise ValueError('Cannot open polygon file {}'.format(vector_path))
+    layer = source.GetLayer()
+    srs = layer.GetSpatialRef()
+
+    transform = None
+    if prj_info is not None:
+        if srs is None:
+            raise ValueError('Polygon file {} has no projection, cannot match it to {}'.format(vector_path, prj_info))
+        srs = srs.Clone()
+        target = osr.SpatialReference()
+        if target.ImportFromWkt(prj_info) != 0:
+            raise ValueError("Cannot import projection '{}'".format(prj_info))
+        # GDAL 3 follows the axis order of the authority (latitude first), keep x first as in the files
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        if not srs.IsSame(target):
+            print('Reprojecting {} to the projection of the valid areas'.format(vector_path))
+            transform = osr.CoordinateTransformation(srs, target)
+        srs = target
+
+    polygons = []
+    for feature in layer:
+        geom = feature.GetGeometryRef()
+        if transform is not None:
+            geom = geom.Clone()
+            geom.Transform(transform)
+        polygons += geometry_rings(geom)
+    return polygons, srs.ExportToWkt() if srs is not None else None
+
+
+def crossing_y(start, end, x):
+    """
+    Where edges cross the line at each x, NaN for edges which do not cross it. An edge ending on the line only
+    counts on one side, so a ring crossing the line at a corner is counted once
+    """
+    crosses = (start[:, 0] > x) != (end[:, 0] > x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y_cross = start[:, 1] + (x - start[:, 0]) * (end[:, 1] - start[:, 1]) / (end[:, 0] - start[:, 0])
+    return np.where(crosses, y_cross, np.nan)
+
+
+class ValidArea(object):
+    """
+    Area sites may be placed in, made of valid polygons minus any excluded polygons. Points are tested against the
+    polygon rings directly, so no raster is needed. The polygon edges are listed in a grid so each point or segment
+    is only compared with the edges near it
+    """
+
+    def __init__(self, polygons, exclude_polygons=()):
+        """
+        INPUTS:
+            polygons: (list) valid polygons, each a list of rings as returned by read_polygons
+            exclude_polygons: (list) polygons which should not be sampled, in the same form
+        """
+        # Edges of every ring, closing any ring which is not closed, and the polygon each edge belongs to
+        all_polygons = list(polygons) + list(exclude_polygons)
+        rings = [[ring if np.array_equal(ring[0], ring[-1]) else np.vstack([ring, ring[:1]]) for ring in polygon]
+                 for polygon in all_polygons]
+        self.edge_polygon = np.concatenate([np.full(len(ring) - 1, j) for j, polygon in enumerate(rings)
+                                            for ring in polygon])
+        self.n_polygons = len(all_polygons)
+        self.n_valid = len(polygons)
+        rings = [ring for polygon in rings for ring in polygon]
+        n_valid_rings = sum(len(polygon) for polygon in polygons)
+        self.edge_start = np.vstack([ring[:-1] for ring in rings])
+        self.edge_end = np.vstack([ring[1:] for ring in rings])
+        self.lower = np.vstack(rings).min(axis=0)
+        self.upper = np.vstack(rings).max(axis=0)
+        self.eps = 1e-9 * max(self.upper - self.lower)
+        self.index_edges()
+
+        # Corners of the valid area. Corners of the valid rings lie on its edge so are kept unless excluded, while the
+        # corners of excluded rings and wherever they cross another edge are tested against the whole area
+        corners = [np.vstack([ring[:-1] for ring in rings[:n_valid_rings]])]
+        if len(rings) > n_valid_rings:
+            corners[0] = corners[0][~self.inside(corners[0])[1]]
+            exclude_rings = [ring[:-1] for ring in rings[n_valid_rings:]]
+            exclude_corners = np.vstack(exclude_rings)
+            before = np.vstack([np.roll(ring, 1, axis=0) for ring in exclude_rings]) - exclude_corners
+            after = np.vstack([np.roll(ring, -1, axis=0) for ring in exclude_rings]) - exclude_corners
+            corners.append(exclude_corners[self.contains(exclude_corners, before, after)])
+            crossings, seg_dir, edge_dir, _ = self.crossings(np.vstack([ring[:-1] for ring in rings[n_valid_rings:]]),
+                                                             np.vstack([ring[1:] for ring in rings[n_valid_rings:]]))
+            corners.append(crossings[self.contains(crossings, seg_dir, edge_dir)])
+        self.corners = np.unique(np.vstack(corners), axis=0)
+
+    def grid_cell(self, points):
+        """
+        Row and column of the edge index grid cell holding each point, points outside the grid go to its border.
+        Cells are found from the same lower corners used everywhere else, so rounding never puts a point in a cell
+        whose lower corner lies beyond it
+        """
+        cell = np.floor((points - self.grid_lower) / self.cell_size).astype(np.int64)
+        cell -= self.grid_lower + cell * self.cell_size > points
+        cell += self.grid_lower + (cell + 1) * self.cell_size <= points
+        return np.clip(cell, 0, self.n_cells - 1)
+
+    def grid_cells(self, lower, upper):
+        """
+        Cells of the edge index grid overlapping each bounding box
+        INPUTS:
+            lower: (np.array) smallest x, y of each bounding box
+            upper: (np.array) largest x, y of each bounding box
+        OUTPUTS:
+            owner: (np.array) index of the bounding box of each overlap
+            cells: (np.array) row and column of the grid cell of each overlap
+        """
+        first = self.grid_cell(lower)
+        last = self.grid_cell(upper)
+        width = last[:, 1] - first[:, 1] + 1
+        counts = (last[:, 0] - first[:, 0] + 1) * width
+        owner = np.repeat(np.arange(len(lower)), counts)
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return owner, np.column_stack([first[owner, 0] + step // width[owner], first[owner, 1] + step % width[owner]])
+
+    def segment_cells(self, start, end):
+        """
+        Cells of the edge index grid each segment passes through or comes within a tiny distance of. Long segments
+        only list the cells along them, rather than every cell of their bounding box
+        INPUTS:
+            start: (np.array) x, y of the start of each segment
+            end: (np.array) x, y of the end of each segment
+        OUTPUTS:
+            owner: (np.array) index of the segment of each cell
+            cells: (np.array) cell, as row * n_cells + column
+        """
+        lower = np.minimum(start, end) - self.eps
+        upper = np.maximum(start, end) + self.eps
+
+        # Split each segment into the strips of grid rows it spans
+        first, last = self.grid_cell(lower)[:, 0], self.grid_cell(upper)[:, 0]
+        counts = last - first + 1
+        owner = np.repeat(np.arange(len(start)), counts)
+        row = first[owner] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        x0 = np.maximum(lower[owner, 0], self.grid_lower[0] + row * self.cell_size[0])
+        x1 = np.minimum(upper[owner, 0], self.grid_lower[0] + (row + 1) * self.cell_size[0])
+
+        # Height of the segment across each strip, steep segments are held to their bounding box
+        direction = end[owner] - start[owner]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = direction[:, 1] / direction[:, 0]
+            y0 = start[owner, 1] + (x0 - start[owner, 0]) * slope
+            y1 = start[owner, 1] + (x1 - start[owner, 0]) * slope
+        flat = np.isfinite(y0) & np.isfinite(y1)
+        y_lower = np.where(flat, np.maximum(np.minimum(y0, y1) - self.eps, lower[owner, 1]), lower[owner, 1])
+        y_upper = np.where(flat, np.minimum(np.maximum(y0, y1) + self.eps, upper[owner, 1]), upper[owner, 1])
+        first = self.grid_cell(np.column_stack([x0, y_lower]))[:, 1]
+        last = self.grid_cell(np.column_stack([x0, y_upper]))[:, 1]
+        counts = last - first + 1
+        col = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(owner, counts), np.repeat(row, counts) * self.n_cells + col
+
+    def cell_pairs(self, owner, cells):
+        """
+        Pair owners with every edge listed in a cell of the index
+        INPUTS:
+            owner: (np.array) index of the point or segment of each cell
+            cells: (np.array) cell, as row * n_cells + column
+        OUTPUTS:
+            owner: (np.array) point or segment of each pair
+            edge: (np.array) edge of each pair
+            cell: (np.array) cell the edge of each pair was listed in
+        """
+        counts = self.cell_start[cells + 1] - self.cell_start[cells]
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return (np.repeat(owner, counts), self.cell_edges[np.repeat(self.cell_start[cells], counts) + step],
+                np.repeat(cells, counts))
+
+    def index_edges(self):
+        """
+        Grid over the area with about one polygon edge per cell, listing the edges whose bounding box overlaps each
+        cell, so segments and points are only tested against the edges near them. The grid reaches half a cell
+        beyond the polygons, and which polygons each lower corner of a cell is inside is found once, by counting the
+        edges crossed along each grid line from its outside end. Edges touching the border of a cell are listed in
+        it too, so edges ending exactly on a grid line are never missed
+        """
+        self.edge_lower = np.minimum(self.edge_start, self.edge_end)
+        self.edge_upper = np.maximum(self.edge_start, self.edge_end)
+        n_cells = max(int(np.sqrt(len(self.edge_start))), 1)
+        self.cell_size = np.maximum(self.upper - self.lower, self.eps) / n_cells
+        self.grid_lower = self.lower - self.cell_size / 2
+        self.n_cells = n_cells + 1
+        owner, cells = self.grid_cells(self.edge_lower - self.eps, self.edge_upper + self.eps)
+
+        # Edges crossing the line x = row from the lower corner of each cell to the next, by polygon
+        corner = self.grid_lower + cells * self.cell_size
+        y_cross = crossing_y(self.edge_start[owner], self.edge_end[owner], corner[:, 0])
+        hit = (y_cross > corner[:, 1]) & (y_cross <= self.grid_lower[1] + (cells[:, 1] + 1) * self.cell_size[1])
+        rows, cols, polygons = cells[hit, 0], cells[hit, 1], self.edge_polygon[owner[hit]]
+
+        # Along each row a corner is inside a polygon after an odd number of its edges, so pair up the crossings
+        order = np.lexsort([cols, polygons, rows])
+        rows, cols, polygons = rows[order], cols[order], polygons[order]
+        group = rows * self.n_polygons + polygons
+        first = np.ones(len(group), dtype=bool)
+        first[1:] = group[1:] != group[:-1]
+        rank = np.arange(len(group)) - np.maximum.accumulate(np.where(first, np.arange(len(group)), 0))
+        enter = np.flatnonzero(rank % 2 == 0)
+        leave = enter + 1
+        paired = leave < len(group)
+        paired[paired] = group[leave[paired]] == group[enter[paired]]
+        stop = np.full(len(enter), self.n_cells - 1)
+        stop[paired] = cols[leave[paired]]
+        counts = stop - cols[enter]
+        inside_row = np.repeat(rows[enter], counts)
+        inside_col = (np.repeat(cols[enter] + 1, counts) + np.arange(counts.sum()) -
+                      np.repeat(np.cumsum(counts) - counts, counts))
+        corner_cells = inside_row * self.n_cells + inside_col
+        order = np.argsort(corner_cells, kind='stable')
+        self.corner_polygons = np.repeat(polygons[enter], counts)[order]
+        self.corner_start = np.searchsorted(corner_cells[order], np.arange(self.n_cells ** 2 + 1))
+
+        cells = cells[:, 0] * self.n_cells + cells[:, 1]
+        order = np.argsort(cells, kind='stable')
+        self.cell_edges = owner[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.n_cells ** 2 + 1))
+        return
+
+    def inside(self, points):
+        """
+        Which points are inside any valid polygon and any excluded polygon. Starting from the polygons the lower
+        corner of the point's grid cell is inside, the edges crossed on the way from the corner to the point are
+        counted, first along the grid line and then across to the point, so only the edges of one cell are tested.
+        The corners, the points and the path between them are all treated as moved up by a tiny amount, and right by
+        a far tinier amount, so a path running along an edge or through a polygon corner is counted the same way
+        on both legs and in the corners
+        INPUTS:
+            points: (np.array) x, y of each point
+        OUTPUTS:
+            in_valid: (np.array) True for points inside a valid polygon
+            in_exclude: (np.array) True for points inside an excluded polygon
+        """
+        in_polygon = [np.zeros(0, dtype=np.int64)]
+        for block in range(0, len(points), EDGE_BLOCK):
+            block_points = points[block:block + EDGE_BLOCK]
+            in_grid = np.flatnonzero(np.all((block_points >= self.grid_lower) &
+                                            (block_points < self.grid_lower + self.n_cells * self.cell_size), axis=1))
+            cell = self.grid_cell(block_points[in_grid])
+            cell_id = cell[:, 0] * self.n_cells + cell[:, 1]
+            corner = self.grid_lower + cell * self.cell_size
+
+            # Polygons the corners are inside
+            counts = self.corner_start[cell_id + 1] - self.corner_start[cell_id]
+            step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            toggles = [np.repeat(in_grid, counts) * self.n_polygons +
+                       self.corner_polygons[np.repeat(self.corner_start[cell_id], counts) + step]]
+
+            # Edges crossed along the grid line to the height of the point, then across to the point
+            point, edge, _ = self.cell_pairs(np.arange(len(in_grid)), cell_id)
+            start, end = self.edge_start[edge], self.edge_end[edge]
+            x, y = block_points[in_grid[point], 0], block_points[in_grid[point], 1]
+            y_cross = crossing_y(start, end, corner[point, 0])
+            y_lower, y_upper = np.minimum(corner[point, 1], y), np.maximum(corner[point, 1], y)
+            up_hit = (y_cross > y_lower) & (y_cross <= y_upper)
+
+            # Across, an edge crossing exactly at either end of the leg is moved along by the tiny move up
+            x_cross = crossing_y(start[:, ::-1], end[:, ::-1], y)
+            x_lower, x_upper = np.minimum(corner[point, 0], x), np.maximum(corner[point, 0], x)
+            leans_right = (end[:, 0] - start[:, 0]) * (end[:, 1] - start[:, 1]) > 0
+            across_hit = (((x_cross > x_lower) | ((x_cross == x_lower) & leans_right)) &
+                          ((x_cross < x_upper) | ((x_cross == x_upper) & ~leans_right)))
+            hit = up_hit ^ across_hit
+            toggles.append(in_grid[point[hit]] * self.n_polygons + self.edge_polygon[edge[hit]])
+
+            # Odd numbers of changes put a point inside a polygon
+            keys, counts = np.unique(np.concatenate(toggles), return_counts=True)
+            in_polygon.append(keys[counts % 2 == 1] + block * self.n_polygons)
+        in_polygon = np.concatenate(in_polygon)
+        in_valid = np.zeros(len(points), dtype=bool)
+        in_exclude = np.zeros(len(points), dtype=bool)
+        valid_polygon = in_polygon % self.n_polygons < self.n_valid
+        in_valid[in_polygon[valid_polygon] // self.n_polygons] = True
+        in_exclude[in_polygon[~valid_polygon] // self.n_polygons] = True
+        return in_valid, in_exclude
+
+    def contains(self, points, dir_a=None, dir_b=None):
+        """
+        True for points in the valid area
+        INPUTS:
+            points: (np.array) x, y of each point
+            dir_a: (np.array) for points on the edge of the valid area, direction of one of the two lines meeting at
+                   each point (two polygon edges, or a polygon edge and a Voronoi edge)
+            dir_b: (np.array) direction of the other line. If given, points are also accepted when moving them a tiny
+                   amount into any of the angles between the lines, or across them, lands in the valid area
+        OUTPUTS:
+            valid: (np.array) True for each point in the valid area
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        in_valid, in_exclude = self.inside(points)
+        valid = in_valid & ~in_exclude
+        if dir_a is None:
+            return valid
+
+        def unit(direction):
+            return direction / np.maximum(np.hypot(direction[:, 0], direction[:, 1]), 1e-300)[:, None]
+        dir_a, dir_b = unit(dir_a), unit(dir_b)
+        moves = [sign * self.eps * unit(direction) for direction in [dir_a + dir_b, dir_a - dir_b,
+                                                                      dir_a[:, ::-1] * np.array([1, -1])]
+                 for sign in [1, -1]]
+        moved = self.contains(np.vstack([points + move for move in moves]))
+        return valid | moved.reshape(len(moves), len(points)).any(axis=0)
+
+    def crossings(self, start, end):
+        """
+        Points where segments cross the edges of the valid area, for example edges of a Voronoi diagram
+        INPUTS:
+            start: (np.array) x, y of the start of each segment
+            end: (np.array) x, y of the end of each segment
+        OUTPUTS:
+            points: (np.array) x, y of each crossing
+            seg_dir: (np.array) direction of the segment at each crossing
+            edge_dir: (np.array) direction of the edge at each crossing
+            segment: (np.array) index of the segment of each crossing
+        """
+        points = [np.zeros((0, 2))]
+        seg_dirs = [np.zeros((0, 2))]
+        edge_dirs = [np.zeros((0, 2))]
+        segments = [np.zeros(0, dtype=np.int64)]
+        for block in range(0, len(start), EDGE_BLOCK):
+            seg_start = start[block:block + EDGE_BLOCK]
+            seg_end = end[block:block + EDGE_BLOCK]
+            seg_lower = np.minimum(seg_start, seg_end)
+            seg_upper = np.maximum(seg_start, seg_end)
+
+            # Pair each segment reaching the area with the edges listed in the grid cells it passes through
+            near = np.flatnonzero(np.all((seg_lower <= self.upper) & (seg_upper >= self.lower), axis=1))
+            owner, cells = self.segment_cells(seg_start[near], seg_end[near])
+            seg, edge, edge_cell = self.cell_pairs(near[owner], cells)
+            overlap = np.all((seg_lower[seg] <= self.edge_upper[edge]) & (self.edge_lower[edge] <= seg_upper[seg]),
+                             axis=1)
+            seg, edge, edge_cell = seg[overlap], edge[overlap], edge_cell[overlap]
+
+            # Where the segments cross
+            seg_dir = seg_end[seg] - seg_start[seg]
+            edge_dir = self.edge_end[edge] - self.edge_start[edge]
+            diff = self.edge_start[edge] - seg_start[seg]
+            denom = seg_dir[:, 0] * edge_dir[:, 1] - seg_dir[:, 1] * edge_dir[:, 0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (diff[:, 0] * edge_dir[:, 1] - diff[:, 1] * edge_dir[:, 0]) / denom
+                u = (diff[:, 0] * seg_dir[:, 1] - diff[:, 1] * seg_dir[:, 0]) / denom
+            hit = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+            # A segment and edge meeting in several cells cross once, in the cell holding the crossing
+            crossing = seg_start[seg] + np.where(hit, t, 0)[:, None] * seg_dir
+            cell = self.grid_cell(crossing)
+            hit &= cell[:, 0] * self.n_cells + cell[:, 1] == edge_cell
+            points.append(crossing[hit])
+            seg_dirs.append(seg_dir[hit])
+            edge_dirs.append(edge_dir[hit])
+            segments.append(block + seg[hit])
+        return np.vstack(points), np.vstack(seg_dirs), np.vstack(edge_dirs), np.concatenate(segments)
+
+    def sample(self, rng, max_tries=100000):
+        """
+        A point drawn uniformly at random from the valid area
+        """
+        for _ in range(max_tries):
+            point = rng.uniform(self.lower, self.upper)
+            if self.contains(point)[0]:
+                return point
+        if len(self.corners) == 0:
+            raise ValueError('The valid area is empty')
+        return self.corners[rng.integers(len(self.corners))]
+
+
+def circumcentres(a, b, c):
+    """
+    Centre and radius of the circle through the three corners of each triangle
+    """
+    ab, ac = b - a, c - a
+    d = 2 * (ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    ab_sq, ac_sq = (ab ** 2).sum(axis=1), (ac ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.column_stack([ac[:, 1] * ab_sq - ab[:, 1] * ac_sq, ab[:, 0] * ac_sq - ac[:, 0] * ab_sq]) / d[:, None]
+    return a + offset, np.hypot(offset[:, 0], offset[:, 1])
+
+
+class Triangulation(object):
+    """
+    Delaunay triangulation of the sites, built one site at a time (Bowyer-Watson). Each triangle keeps the triangle
+    across each of its edges, so adding a site only visits the triangles whose circumcircle holds it and the
+    triangles on the way to them. The Voronoi vertices are the centres of these circumcircles, and the Voronoi edge
+    between two sites joins the centres of the two triangles sharing the edge between them
+    """
+
+    def __init__(self, guards):
+        """
+        INPUTS:
+            guards: (np.array) x, y of three points anticlockwise around, and far outside, every site
+        """
+        self.points = [tuple(point) for point in np.asarray(guards, dtype=np.float64)]
+        self.corners = [[0, 1, 2]]
+        self.across = [[-1, -1, -1]]
+        self.alive = [True]
+        self.point_triangle = [0, 0, 0]
+
+    @staticmethod
+    def turn(u, v, p):
+        """
+        Positive if p is to the left of the line from u to v
+        """
+        return (v[0] - u[0]) * (p[1] - u[1]) - (v[1] - u[1]) * (p[0] - u[0])
+
+    def in_circle(self, triangle, p):
+        """
+        True if p is strictly inside the circumcircle of a triangle
+        """
+        (ax, ay), (bx, by), (cx, cy) = [self.points[k] for k in self.corners[triangle]]
+        ax, ay, bx, by, cx, cy = ax - p[0], ay - p[1], bx - p[0], by - p[1], cx - p[0], cy - p[1]
+        return ((ax * ax + ay * ay) * (bx * cy - by * cx) + (bx * bx + by * by) * (cx * ay - cy * ax) +
+                (cx * cx + cy * cy) * (ax * by - ay * bx)) > 0
+
+    def circumcentres(self, triangles):
+        """
+        Centre and radius of the circumcircle of each triangle, the Voronoi vertex it stands for
+        """
+        corners = np.array([[self.points[k] for k in self.corners[t]] for t in triangles]).reshape(-1, 3, 2)
+        return circumcentres(corners[:, 0], corners[:, 1], corners[:, 2])
+
+    def locate(self, p, triangle):
+        """
+        Triangle holding p, found by walking from the given triangle across each edge p is beyond
+        """
+        while True:
+            a, b, c = [self.points[k] for k in self.corners[triangle]]
+            if self.turn(b, c, p) < 0:
+                triangle = self.across[triangle][0]
+            elif self.turn(c, a, p) < 0:
+                triangle = self.across[triangle][1]
+            elif self.turn(a, b, p) < 0:
+                triangle = self.across[triangle][2]
+            else:
+                return triangle
+
+    def add_point(self, p, near=None):
+        """
+        Add a point, replacing the triangles whose circumcircle holds it by triangles joining it to the edge of
+        that cavity
+        INPUTS:
+            p: (np.array) x, y of the new point, inside the guards
+            near: (int) a triangle near the point to start looking from, the newest triangle if None
+        OUTPUTS:
+            new_triangles: (list) triangles made for the point
+            neighbours: (list) points joined to the new point
+        """
+        p = (float(p[0]), float(p[1]))
+        point = len(self.points)
+        self.points.append(p)
+        if near is None or not self.alive[near]:
+            near = len(self.corners) - 1
+        cavity = {self.locate(p, near)}
+        stack = list(cavity)
+        while True:
+            while stack:
+                for other in self.across[stack.pop()]:
+                    if other >= 0 and other not in cavity and self.in_circle(other, p):
+                        cavity.add(other)
+                        stack.append(other)
+
+            # Each edge of the cavity must face the new point, rounding can leave one which does not
+            border = []
+            for triangle in cavity:
+                corners = self.corners[triangle]
+                for k in range(3):
+                    other = self.across[triangle][k]
+                    if other not in cavity:
+                        border.append((corners[(k + 1) % 3], corners[(k + 2) % 3], other, triangle))
+            behind = [other for u, v, other, _ in border
+                      if other >= 0 and self.turn(self.points[u], self.points[v], p) <= 0]
+            if not behind:
+                break
+            cavity.update(behind)
+            stack = behind
+
+        # Join the new point to each edge of the cavity, each new triangle meets the next around the point
+        first = len(self.corners)
+        starts = {}
+        ends = {}
+        for j, (u, v, other, old) in enumerate(border):
+            starts[u] = ends[v] = first + j
+        for j, (u, v, other, old) in enumerate(border):
+            self.corners.append([u, v, point])
+            self.across.append([starts[v], ends[u], other])
+            self.alive.append(True)
+            if other >= 0:
+                self.across[other][self.across[other].index(old)] = first + j
+            self.point_triangle[u] = first + j
+        self.point_triangle.append(first)
+        for triangle in cavity:
+            self.alive[triangle] = False
+        return list(range(first, len(self.corners))), [u for u, v, other, old in border]
+
+
+def generate_vector_design(polygons, nsp, exclude_polygons=(), rng=None):
+    """
+    Stratified design over polygons rather than a raster, placing sites iteratively at the point of the valid area
+    furthest from all other sites. This point is always a vertex of the Voronoi diagram of the sites, a crossing of
+    a Voronoi edge with the edge of the valid area, or a corner of the valid area, so only these are compared.
+    The Voronoi diagram is kept as a Delaunay triangulation, so adding a site only changes the cells next to it.
+    Vertices and crossings are dropped when the triangles they come from are replaced, the corners in the cells
+    next to the new site are checked against it, and the candidates are kept in a heap ordered by distance, so the
+    work for each site does not grow with the number of sites.
+    INPUTS:
+        polygons: (list) valid polygons, each a list of rings as returned by read_polygons
+        nsp: (int) Number of sample sites in design
+        exclude_polygons: (list) polygons which should not be sampled, in the same form
+        rng: (np.random.Generator) random number generator used to place the first site and break ties
+    OUTPUTS:
+        x_vals: (np.array) x (projected) coordinates of sample sites
+        y_vals: (np.array) y (projected) coordinates of sample sites
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    area = ValidArea(polygons, exclude_polygons)
+    sites = np.zeros((nsp, 2))
+
+    # As in the raster design every point is equally far from the (no) other sites, so the first is random
+    print('Plotting site 1')
+    sites[0] = area.sample(rng)
+
+    # Three guard points far outside the area keep every Voronoi edge between sites finite
+    centre = (area.lower + area.upper) / 2
+    reach = 10 * max(area.upper - area.lower)
+    angles = np.radians([90, 210, 330])
+    n_guards = len(angles)
+    mesh = Triangulation(centre + reach * np.column_stack([np.cos(angles), np.sin(angles)]))
+    new_triangles = mesh.add_point(sites[0])[0]
+
+    # Candidates are Voronoi vertices (tied to their triangle), crossings of Voronoi edges with the edge of the area
+    # (tied to the two triangles of the edge) and the furthest corners of each cell. Each is stored with its distance
+    # to the nearest site, so the heap holds (-distance, candidate) and entries which are out of date are skipped
+    points = []
+    kinds = []
+    owners = []
+    heap = []
+    VERTEX, CROSSING, CORNER = 0, 1, 2
+
+    def add_candidates(new_points, dist, kind, owner):
+        for point, d, k in zip(new_points, dist.tolist(), owner):
+            heapq.heappush(heap, (-d, len(points)))
+            points.append(point)
+            kinds.append(kind)
+            owners.append(k)
+
+    def current(neg_dist, index):
+        kind, owner = kinds[index], owners[index]
+        if kind == VERTEX:
+            return mesh.alive[owner]
+        if kind == CROSSING:
+            return mesh.alive[owner[0]] and mesh.alive[owner[1]]
+        return corner_dist[owner] == -neg_dist and furthest_corner[corner_owner[owner]] == -neg_dist
+
+    # Corners are kept with the site they are nearest to, so only those next to a new site are checked against it,
+    # and only the furthest corners of each cell are candidates
+    corners = area.corners
+    corner_dist = np.hypot(*(corners - sites[0]).T)
+    corner_owner = np.zeros(len(corners), dtype=np.int64)
+    corner_site = {0: np.arange(len(corners))}
+    furthest_corner = np.full(nsp, -1.0)
+
+    def add_furthest_corners(site):
+        owned = corner_site[site]
+        furthest = corner_dist[owned].max() if len(owned) else -1.0
+        if furthest != furthest_corner[site]:
+            furthest_corner[site] = furthest
+            owned = owned[corner_dist[owned] == furthest]
+            add_candidates(corners[owned], corner_dist[owned], CORNER, owned)
+
+    add_furthest_corners(0)
+    for i in range(1, nsp):
+        # Candidates from the triangles made for the last site
+        tri = np.array([mesh.corners[t] for t in new_triangles])
+        tri_centre, radius = mesh.circumcentres(new_triangles)
+        keep = np.flatnonzero((tri.min(axis=1) >= n_guards) & area.contains(tri_centre))
+        add_candidates(tri_centre[keep], radius[keep], VERTEX, [new_triangles[j] for j in keep])
+
+        # Voronoi edges of each new triangle with the triangles across its edges, once each
+        made = set(new_triangles)
+        pairs = []
+        for t in new_triangles:
+            for k, other in enumerate(mesh.across[t]):
+                u, v = mesh.corners[t][(k + 1) % 3], mesh.corners[t][(k + 2) % 3]
+                if other >= 0 and min(u, v) >= n_guards and (other not in made or t < other):
+                    pairs.append((t, other, u))
+        if pairs:
+            pairs = np.array(pairs)
+            crossings, seg_dir, edge_dir, segment = area.crossings(mesh.circumcentres(pairs[:, 0])[0],
+                                                                   mesh.circumcentres(pairs[:, 1])[0])
+            inside = area.contains(crossings, seg_dir, edge_dir)
+            crossings, segment = crossings[inside], segment[inside]
+            dist = np.hypot(*(crossings - np.array([mesh.points[u] for u in pairs[segment, 2]]).reshape(-1, 2)).T)
+            add_candidates(crossings, dist, CROSSING, [(pairs[j, 0], pairs[j, 1]) for j in segment])
+
+        print('Plotting site {}'.format(i + 1))
+
+        # Pop until the top is current, then collect every candidate equally far away
+        ties = []
+        while heap and (not ties or heap[0][0] == ties[0][0]):
+            entry = heapq.heappop(heap)
+            if current(*entry):
+                ties.append(entry)
+        if not ties or ties[0][0] == 0:
+            raise ValueError('No points left to place site {} at'.format(i + 1))
+
+        # Choose one of the candidates furthest from all sites at random, the others stay in the heap
+        best = ties.pop(rng.integers(len(ties)))
+        for entry in ties:
+            heapq.heappush(heap, entry)
+        index = best[1]
+        sites[i] = points[index]
+        if kinds[index] == VERTEX:
+            near = owners[index]
+        elif kinds[index] == CROSSING:
+            near = owners[index][0]
+        else:
+            near = mesh.point_triangle[n_guards + corner_owner[owners[index]]]
+        new_triangles, neighbours = mesh.add_point(sites[i], near)
+
+        # Corners of the cells next to the new site which are now nearer to it
+        moved = []
+        for neighbour in set(neighbours):
+            site = neighbour - n_guards
+            if site < 0 or not len(corner_site[site]):
+                continue
+            owned = corner_site[site]
+            dist = np.hypot(*(corners[owned] - sites[i]).T)
+            nearer = dist < corner_dist[owned]
+            if nearer.any():
+                corner_site[site] = owned[~nearer]
+                corner_dist[owned[nearer]] = dist[nearer]
+                moved.append(owned[nearer])
+                add_furthest_corners(site)
+        corner_site[i] = np.concatenate(moved) if moved else np.zeros(0, dtype=np.int64)
+        corner_owner[corner_site[i]] = i
+        add_furthest_corners(i)
+
+    print('Stratified sample design complete!')
+    return sites[:, 0], sites[:, 1]
@@ -0,0 +1,79 @@
+# Script for comparing bin choices before generating a uniform design
+# File: sweep_bin_options.py
+# Author: Ellie Bowler
+# Contact: e.bowler@uea.ac.uk
+# All code available at https://github.com/EllieBowler/
+# This script reads the habitat and metric maps once, and reports for every combination of the bin options and
+# numbers of sample sites how many metric ids would be sampled, the optimal number of sites per id (s_opt), and the
+# suggested lower and upper numbers of sample sites. It uses the same rules as generate_uniform_design.py.
+###################################################################
+# Usage:
+# --save_folder is the name of the directory where outputs will be saved, in the results subfolder
+# --hab_path is the name of the geo-referenced habitat map
+# --metrics is the path and name of a metric map (repeat for each metric)
+# --bins is the bin options for each metric, as a comma separated list (5,6,7) or a range (4-10)
+# --mask_path is the name of the input mask (for example InvalidAreasMask.tif)
+# --nsp is a number of sample points to try (repeat for each number)
+###################################################################
+# Example trying 4 to 10 bins for fragment area and 5 to 8 for distance to edge, with 50 and 80 sample sites
+# python sweep_bin_options.py --metrics=input/FragmentAreaLog10.tif --bins=4-10
+# --metrics=input/DistanceToEdgeLog2.tif --bins=5-8 --nsp=50 --nsp=80
+###################################################################
+
+from utils import get_file_info, extract_raster
+from uda import sweep_bins
+import os
+import numpy as np
+import click
+
+
+def parse_bin_options(bins):
+    """
+    Read bin options given as a comma separated list (5,6,7) or a range (4-10)
+    """
+    if '-' in bins:
+        lower, upper = bins.split('-')
+        return list(range(int(lower), int(upper) + 1))
+    return [int(b) for b in bins.split(',')]
+
+
+# Arguments used to call the method from the command line
+@click.command()
+@click.option('--save_folder', type=str, default='Bin_Sweep', help='Name of folder where results will be saved')
+@click.option('--hab_path', type=str, default='input/HabitatMap.tif', help='Path to categorical habitat map')
+@click.option('--metrics', multiple=True, help='Specify path and name of metric')
+@click.option('--bins', multiple=True, help='Bin options for each metric, for example 5,6,7 or 4-10')
+@click.option('--mask_path', type=str, default=None, help='Specify path and name of the invalid areas mask')
+@click.option('--nsp', type=int, multiple=True, help='Number of sample sites to try')
+def sweep_design_bins(save_folder, hab_path, metrics, bins, mask_path, nsp):
+
+    # make results folder to save output
+    save_path = 'results/{}'.format(save_folder)
+    if not os.path.exists(save_path):
+        os.mkdir(save_path)
+
+    # get habitat map, the habitat is always split into one bin per category
+    habmap, n_bins, res, geo_t, prj_info = get_file_info(hab_path)
+
+    if mask_path is not None:
+        mask = extract_raster(mask_path)
+    else:
+        mask = np.ones((habmap.shape[0], habmap.shape[1]))
+
+    metric_list = [habmap]
+    bins_options = [[n_bins]]
+
+    for i in range(len(metrics)):
+        metric_list.append(extract_raster(metrics[i]))
+        bins_options.append(parse_bin_options(bins[i]))
+
+    sweep_df = sweep_bins(metric_list, mask, bins_options, list(nsp) or [30])
+    print(sweep_df.to_string(index=False))
+
+    sweep_df.to_csv('{}/bin_sweep.csv'.format(save_path), index=False)
+    print('Bin sweep saved to {}/bin_sweep.csv'.format(save_path))
+    return
+
+
+if __name__ == '__main__':
+    sweep_design_bins()
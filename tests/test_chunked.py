@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+import dask.array as da
+from uda.uda_parts import build_id_image
+from uda.uda_chunked import build_id_image_chunked
+from utils.chunked import get_scheduler, update_mask_chunked
+from utils.load import update_mask
+
+BINS = [3, 4, 3]
+
+
+def example_maps(seed=0, shape=(150, 90)):
+    """
+    Habitat map, two metrics and a mask with invalid patches, small enough for the one-hot in-memory layers
+    """
+    rng = np.random.default_rng(seed)
+    habmap = rng.integers(1, BINS[0] + 1, shape)
+    metrics = [habmap, rng.normal(0, 1, shape), rng.gamma(2, 3, shape)]
+    mask = np.ones(shape)
+    mask[20:50, 10:40] = 0
+    mask[rng.random(shape) < 0.05] = 0
+    return metrics, mask
+
+
+def example_sites(shape=(150, 90), seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'row': rng.integers(0, shape[0], 12), 'col': rng.integers(0, shape[1], 12),
+                         'sampled': rng.choice([0, 1, 2], 12)})
+
+
+def check_id_image(compute_kwargs):
+    metrics, mask = example_maps()
+    expected = build_id_image(metrics, mask, BINS, 40, 'in-memory')
+    chunked = [da.from_array(metric, chunks=(32, metric.shape[1])) for metric in metrics]
+    result = build_id_image_chunked(chunked, mask, BINS, 40, compute_kwargs)
+
+    for binned, binned_expected in zip(result[0], expected[0]):
+        assert np.array_equal(binned, binned_expected)
+    for breaks, breaks_expected in zip(result[1], expected[1]):
+        assert np.array_equal(breaks, breaks_expected)
+    assert np.array_equal(result[2], expected[2])
+    assert list(result[3]) == list(expected[3])
+    pd.testing.assert_frame_equal(result[4], expected[4], check_dtype=False)
+    assert result[5] == expected[5]
+
+
+def check_update_mask(compute_kwargs):
+    metrics, mask = example_maps()
+    sites = example_sites()
+    expected = update_mask(sites, mask, 25.0, 2.5)
+    result = update_mask_chunked(sites, mask, 25.0, 2.5, chunk_rows=32).compute(**compute_kwargs)
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('scheduler', ['threads', 'processes'])
+def test_id_image_matches_in_memory(scheduler):
+    check_id_image(get_scheduler(scheduler, processes=2))
+
+
+@pytest.mark.parametrize('scheduler', ['threads', 'processes'])
+def test_update_mask_matches_in_memory(scheduler):
+    check_update_mask(get_scheduler(scheduler, processes=2))
+
+
+def test_local_cluster_matches_in_memory():
+    distributed = pytest.importorskip('dask.distributed')
+    with distributed.LocalCluster(n_workers=2, threads_per_worker=1, processes=False) as cluster:
+        compute_kwargs = get_scheduler(cluster.scheduler_address)
+        try:
+            check_id_image(compute_kwargs)
+            check_update_mask(compute_kwargs)
+        finally:
+            distributed.default_client().close()
@@ -0,0 +1,86 @@
+import time
+import numpy as np
+from matplotlib.path import Path
+from scipy.spatial import cKDTree
+from sda.sda_vector import ValidArea, generate_vector_design
+
+# Concave rings with edges along the grid lines the test points sit on
+RINGS = {
+    'L': [[0, 0], [100, 0], [100, 40], [40, 40], [40, 100], [0, 100]],
+    'comb': [[0, 0], [90, 0], [90, 60], [70, 60], [70, 20], [50, 20], [50, 60], [30, 60], [30, 20], [10, 20],
+             [10, 60], [0, 60]],
+    'star': [[50, 0], [60, 35], [100, 50], [60, 65], [50, 100], [40, 65], [0, 50], [40, 35]],
+    'stairs': [[0, 0], [80, 0], [80, 20], [60, 20], [60, 40], [40, 40], [40, 60], [20, 60], [20, 80], [0, 80]],
+}
+
+
+def on_boundary(ring, points):
+    """
+    True for points lying exactly on an edge of the ring, where inside or outside is not defined
+    """
+    start, end = ring, np.roll(ring, -1, axis=0)
+    d = end - start
+    rel = points[:, None] - start[None]
+    cross = d[None, :, 0] * rel[..., 1] - d[None, :, 1] * rel[..., 0]
+    dot = (rel * d[None]).sum(axis=2)
+    return np.any((cross == 0) & (dot >= 0) & (dot <= (d * d).sum(axis=1)[None]), axis=1)
+
+
+def test_contains_matches_path():
+    rng = np.random.default_rng(0)
+    for name, ring in RINGS.items():
+        ring = np.array(ring, dtype=float)
+        area = ValidArea([[ring]])
+
+        # Points on the lines through every corner, on and beyond the ends of the edges, plus random points
+        ticks = np.unique(np.concatenate([ring.ravel(), ring.ravel() + 0.75, ring.ravel() - 5, [-10, 110]]))
+        points = np.column_stack([np.repeat(ticks, len(ticks)), np.tile(ticks, len(ticks))])
+        points = np.vstack([points, rng.uniform(-10, 110, (2000, 2))])
+        points = points[~on_boundary(ring, points)]
+        expected = Path(np.vstack([ring, ring[:1]]), closed=True).contains_points(points)
+        mismatch = points[area.contains(points) != expected]
+        assert len(mismatch) == 0, '{}: wrong at {}'.format(name, mismatch[:5].tolist())
+
+
+def test_contains_l_shape_beyond_edge_end():
+    ring = np.array(RINGS['L'], dtype=float)
+    area = ValidArea([[ring]])
+    assert not area.contains(np.array([[45, 100], [60.75, 100], [100, 45], [100, 60.75]])).any()
+    assert area.contains(np.array([[20, 100 - 1e-6], [70, 40 - 1e-6], [39, 99]])).all()
+
+
+def test_contains_excluded_polygons():
+    ring = np.array(RINGS['comb'], dtype=float)
+    hole = np.array(RINGS['L'], dtype=float) / 5 + 2
+    area = ValidArea([[ring]], [[hole]])
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-5, 95, (5000, 2))
+    points = points[~on_boundary(ring, points) & ~on_boundary(hole, points)]
+    expected = (Path(np.vstack([ring, ring[:1]])).contains_points(points) &
+                ~Path(np.vstack([hole, hole[:1]])).contains_points(points))
+    assert np.array_equal(area.contains(points), expected)
+
+
+def test_vector_design_furthest_point():
+    # Each site is at least as far from the earlier sites as any point of the valid area
+    valid = [[np.array(RINGS['comb'], dtype=float)]]
+    exclude = [[np.array(RINGS['star'], dtype=float) / 10 + [40, 30]]]
+    x_vals, y_vals = generate_vector_design(valid, 40, exclude, rng=np.random.default_rng(2))
+    sites = np.column_stack([x_vals, y_vals])
+    area = ValidArea(valid, exclude)
+    points = np.random.default_rng(3).uniform(area.lower, area.upper, (100000, 2))
+    points = np.vstack([points[area.contains(points)], area.corners])
+    for k in range(1, len(sites)):
+        spacing = np.hypot(*(sites[:k] - sites[k]).T).min()
+        assert cKDTree(sites[:k]).query(points)[0].max() <= spacing + 1e-9
+
+
+def test_vector_design_cost_per_site_flat():
+    # Adding a site only changes the cells next to it, so four times the sites takes about four times as long
+    valid = [[np.array(RINGS['stairs'], dtype=float)]]
+    times = {}
+    for nsp in [250, 1000]:
+        start = time.perf_counter()
+        generate_vector_design(valid, nsp, rng=np.random.default_rng(0))
+        times[nsp] = (time.perf_counter() - start) / nsp
+    assert times[1000] < 2 * times[250], 'seconds per site {}'.format(times)
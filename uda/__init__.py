@@ -1,3 +1,6 @@
 from .uda import *
 from .uda_parts import *
-from .uda_update import *
\ No newline at end of file
+from .uda_update import *
+from .uda_sweep import *
+from .uda_chunked import *
+from .uda_session import *
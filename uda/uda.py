@@ -1,15 +1,23 @@
 import numpy as np
-from random import randint
 from scipy import ndimage
+from utils.candidates import choose_max
+from utils.checkpoint import load_placement, save_checkpoint, check_checkpoint, pack_distance, restore_distance
 
 
-def generate_uniform_design(id_mix, id_im):
+def generate_uniform_design(id_mix, id_im, checkpoint_path=None, checkpoint_every=10, resume=False,
+                            save_distance=False, rng=None):
     """
     Main function for generating a uniform design.
     Places site evenly within the range of the input metrics, while also spacing them as evenly as possible spatially.
     INPUTS:
         id_mix: (list) list of metric id values to be sampled
         id_im: (np.array) distribution of all metric id values in the study landscape
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        save_distance: (bool) also save the distance transform in checkpoints, so it is not recomputed on resume
+        rng: (np.random.Generator) random number generator used to break ties, pass a seeded generator for
+             reproducible designs
     OUTPUTS:
         x_vals: (list) x coordinates of sample sites
         y_vals: (list) y coordinates of sample sites
@@ -23,7 +31,20 @@ def generate_uniform_design(id_mix, id_im):
     y_vals = []
     loop_count = 1
 
-    for i in id_mix:
+    if rng is None:
+        rng = np.random.default_rng()
+
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, 'generate_uniform_design', id_im.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        sites[x_vals.astype(int), y_vals.astype(int)] = 0
+        dist_im = restore_distance(checkpoint, sites)
+        loop_count = len(x_vals) + 1
+        print('Resuming design from checkpoint, {} sites already placed'.format(len(x_vals)))
+
+    for i in id_mix[loop_count - 1:]:
         print('Plotting site {}, id number {}'.format(loop_count, i))
 
         # Select binary map relating to selected ID
@@ -32,12 +53,8 @@ def generate_uniform_design(id_mix, id_im):
         # Mask out any regions of EDT not in ID
         layer = mask_id * dist_im
 
-        # Extract coordinates of pixels with maximum distance value
-        dist_mx = list(zip(*np.where(layer == layer.max())))
-
-        # Choose one max coord pair at random
-        idx = randint(0, len(dist_mx) - 1)
-        x, y = dist_mx[idx]
+        # Choose one of the pixels with maximum distance value at random
+        x, y = choose_max(layer, rng)
 
         # Save x and y coordinates
         x_vals = np.append(x_vals, x)
@@ -49,7 +66,117 @@ def generate_uniform_design(id_mix, id_im):
         # Update the euclidean distance transform
         dist_im = ndimage.distance_transform_edt(sites)
 
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and (loop_count % checkpoint_every == 0 or loop_count == len(id_mix)):
+            save_checkpoint(checkpoint_path, design='generate_uniform_design', shape=id_im.shape,
+                            x_vals=x_vals, y_vals=y_vals, random_state=rng.bit_generator.state,
+                            distance=pack_distance(dist_im) if save_distance else None)
+
         loop_count += 1
 
     print('Uniform sample design complete!')
     return x_vals, y_vals
+
+
+def stratum_pixels(id_im):
+    """
+    Flat indices of the pixels of each id, in row by row order, found with one sort of the id image
+    INPUTS:
+        id_im: (np.array) distribution of all metric id values in the study landscape
+    OUTPUTS:
+        groups: (dict) flat pixel indices for each id value
+    """
+    flat = id_im.ravel()
+    order = np.argsort(flat, kind='stable')
+    values, starts = np.unique(flat[order], return_index=True)
+    return dict(zip(values, np.split(order, starts[1:])))
+
+
+def choose_max_in(dist_flat, pixels, rng):
+    """
+    Choose one of the given pixels holding their maximum distance at random, picking the same tie as choose_max
+    """
+    values = dist_flat[pixels]
+    ties = pixels[values == values.max()]
+    return ties[rng.integers(len(ties))]
+
+
+def generate_uniform_design_batched(id_mix, id_im, batch_size=10, tolerance=0.0, checkpoint_path=None,
+                                    checkpoint_every=10, resume=False, rng=None):
+    """
+    Batched version of generate_uniform_design, placing several sites between distance transforms.
+    Each round takes the next sites of id_mix while their ids are all different (up to batch_size), and finds the
+    best pixel of each id from the same distance transform. A site is kept if it is at least (1 - tolerance) times
+    its distance to the existing sites away from every site kept before it in the round, so the spacing of each site
+    is within tolerance of the spacing the sequential design would give it (with tolerance 0 the spacing is the
+    same, although a different pixel may be chosen among ties). The round stops at the first site which is not kept,
+    which starts the next round, and the distance transform is then updated once for all sites of the round.
+    INPUTS:
+        id_mix: (list) list of metric id values to be sampled
+        id_im: (np.array) distribution of all metric id values in the study landscape
+        batch_size: (int) largest number of sites placed in each round
+        tolerance: (float) fraction of its spacing a site may lose compared with the sequential design
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    """
+    imheight, imwidth = id_im.shape
+    sites = np.ones((imheight, imwidth))
+    # Every pixel is infinitely far from the (no) sites, so the first round places one site
+    dist_flat = np.full(imheight * imwidth, np.inf)
+    groups = stratum_pixels(id_im)
+    x_vals = np.array([], dtype=np.int64)
+    y_vals = np.array([], dtype=np.int64)
+    n_rounds = 0
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, 'generate_uniform_design_batched', id_im.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        sites[x_vals.astype(int), y_vals.astype(int)] = 0
+        dist_flat = ndimage.distance_transform_edt(sites).ravel()
+        print('Resuming design from checkpoint, {} sites already placed'.format(len(x_vals)))
+
+    while len(x_vals) < len(id_mix):
+        start = len(x_vals)
+        batch = []
+        for i in id_mix[start:start + batch_size]:
+            if i in batch:
+                break
+            batch.append(i)
+
+        # Keep sites while they are far enough from the sites already kept in this round
+        kept = []
+        for i in batch:
+            pixel = choose_max_in(dist_flat, groups[i], rng)
+            x, y = divmod(int(pixel), imwidth)
+            bound = (1 - tolerance) * dist_flat[pixel]
+            if any(np.hypot(x - kx, y - ky) < bound for kx, ky in kept):
+                break
+            kept.append((x, y))
+
+        # One distance transform for every site of the round
+        for x, y in kept:
+            x_vals = np.append(x_vals, x)
+            y_vals = np.append(y_vals, y)
+            sites[x, y] = 0
+        dist_flat = ndimage.distance_transform_edt(sites).ravel()
+        n_rounds += 1
+        print('Plotted sites {} to {} in round {}'.format(start + 1, len(x_vals), n_rounds))
+
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and (len(x_vals) // checkpoint_every > start // checkpoint_every or
+                                            len(x_vals) == len(id_mix)):
+            save_checkpoint(checkpoint_path, design='generate_uniform_design_batched', shape=id_im.shape,
+                            x_vals=x_vals, y_vals=y_vals, random_state=rng.bit_generator.state)
+
+    print('Uniform sample design complete in {} rounds!'.format(n_rounds))
+    return x_vals, y_vals
@@ -0,0 +1,100 @@
+import numpy as np
+from utils.chunked import require_dask, get_scheduler, as_chunked
+from .uda_parts import histogram_breaks, digitize_metric, build_df, label_multipliers, threshold_ids, combo_labels_of
+
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = None
+    da = None
+
+
+def lookup_ids(labels, mask, id_lookup):
+    """
+    Convert one chunk of labels to ids, zero in invalid areas
+    """
+    return id_lookup[labels] * mask
+
+
+def bin_metrics_chunked(metric_list, mask, bins_list, compute_kwargs=None):
+    """
+    Chunked version of bin_metrics. The range of each metric is found in one pass over the chunks, then each
+    chunk is binned independently
+    INPUTS:
+        metric_list: (list) chunked arrays of each of the input metric maps
+        mask: (np.array or dask array) binary mask showing locations which should not be sampled
+        bins_list: (list) number of bins each metric should be broken into
+        compute_kwargs: (dict) output of get_scheduler, local processes if None
+    OUTPUTS:
+        binned_metrics: (list) chunked arrays of the binned metrics (not yet computed)
+        combo_df: (data frame) data frame of all combinations
+        bin_breaks: (list) list of break points used to discretize the metrics
+    """
+    require_dask()
+    compute_kwargs = compute_kwargs or get_scheduler()
+    valid = as_chunked(mask, metric_list[0]) != 0
+
+    # Range of the unmasked values of every metric, all found in the same pass
+    ranges = []
+    for metric in metric_list:
+        ranges += [da.where(valid, metric, np.inf).min(), da.where(valid, metric, -np.inf).max()]
+    ranges = dask.compute(*ranges, **compute_kwargs)
+
+    binned_metrics = []
+    bin_breaks = []
+    for j, metric in enumerate(metric_list):
+        breaks = histogram_breaks(ranges[2 * j], ranges[2 * j + 1], bins_list[j], metric.dtype)
+        binned_metrics.append(metric.map_blocks(digitize_metric, breaks, dtype=np.int64).astype(np.float64))
+        bin_breaks.append(breaks)
+    combo_df = build_df([np.arange(0, n) for n in bins_list])
+    return binned_metrics, combo_df, bin_breaks
+
+
+def build_id_image_chunked(metric_list, mask, bins_list, nsp, compute_kwargs=None):
+    """
+    Chunked version of build_id_image, giving the same outputs as the numpy representations. The metric maps
+    are read chunk by chunk and the chunks processed in parallel, so the maps never need to fit in memory at once;
+    only the binned metrics and id image returned are held in full
+    INPUTS:
+        metric_list: (list) chunked arrays of each of the input metric maps, see load_raster_chunked
+        mask: (np.array or dask array) binary mask showing locations which should not be sampled
+        bins_list: (list) number of bins each metric should be broken into
+        nsp: (int) integer number of sample sites
+        compute_kwargs: (dict) output of get_scheduler, local processes if None
+    OUTPUTS:
+        binned_metrics: (list) list of all the binned metrics
+        bin_breaks: (list) list of break points used to discretize the metrics
+        id_im: (np.array) combined id image
+        unique_ids: (list) list of unique ids contained in id_im
+        id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        s_opt: (float) the optimal number of sample sites per id
+    """
+    require_dask()
+    compute_kwargs = compute_kwargs or get_scheduler()
+    mask = as_chunked(mask, metric_list[0])
+    binned_metrics, combo_df, bin_breaks = bin_metrics_chunked(metric_list, mask, bins_list, compute_kwargs)
+
+    # Combined label of the binned ids, as in label_metrics
+    n_labels = int(np.prod(bins_list, dtype=np.int64))
+    multipliers = label_multipliers(bins_list)
+    label_type = np.int32 if n_labels <= np.iinfo(np.int32).max else np.int64
+    labels = sum(binned_metrics[j].astype(label_type) * multipliers[j] for j in range(len(bins_list)))
+
+    # Count the (mask weighted) number of pixels with each label, summed over the chunks
+    counts = da.bincount(labels.ravel(), weights=mask.ravel().astype(np.float64), minlength=n_labels)
+    counts = counts.compute(**compute_kwargs)
+    combo_labels = combo_labels_of(combo_df, bins_list)
+    combo_df['Counts'] = counts[combo_labels]
+    id_df, s_opt = threshold_ids(combo_df, nsp)
+
+    # Look up table from label to position in id_df, as in generate_id_labels
+    id_lookup = np.zeros(n_labels)
+    unique_ids = []
+    for counter, k in enumerate(id_df.index.values):
+        id_lookup[combo_labels[k]] = counter + 1
+        unique_ids.append(counter + 1)
+    id_im = da.map_blocks(lookup_ids, labels, mask, id_lookup=id_lookup, dtype=np.float64)
+
+    binned_metrics, id_im = dask.compute(binned_metrics, id_im, **compute_kwargs)
+    return list(binned_metrics), bin_breaks, id_im, unique_ids, id_df, s_opt
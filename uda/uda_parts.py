@@ -1,37 +1,85 @@
 import numpy as np
 import pandas as pd
+import tempfile
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.load import extract_raster
 
 
-def discretize_metric(metric, mask, n_bins):
+def histogram_breaks(vmin, vmax, n_bins, dtype):
+    """
+    Calculate the same equal width bin breaks as np.histogram, from the range of the metric alone
+    INPUTS:
+        vmin: (float) minimum of the unmasked metric values
+        vmax: (float) maximum of the unmasked metric values
+        n_bins: (int) number of intervals the range of the metric should be divided into
+        dtype: (np.dtype) data type of the metric map
+    OUTPUTS:
+        breaks: (np.array) the intervals where the range of the metric was split
+    """
+    bin_type = np.dtype(dtype)
+    if not np.issubdtype(bin_type, np.floating):
+        bin_type = np.dtype(np.float64)
+    vmin, vmax = bin_type.type(vmin), bin_type.type(vmax)
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        raise ValueError('autodetected range of [{}, {}] is not finite'.format(vmin, vmax))
+    if vmin == vmax:
+        vmin, vmax = vmin - 0.5, vmax + 0.5
+    return np.linspace(vmin, vmax, n_bins + 1, endpoint=True, dtype=bin_type)
+
+
+def digitize_metric(metric, breaks):
+    """
+    Assign each metric value the id of the bin it falls in, matching the intervals used by discretize_metric
+    INPUTS:
+        metric: (np.array) fragmentation metric map, or any part of it
+        breaks: (list) the intervals where the range of the metric was split
+    OUTPUTS:
+        metric_bin: (np.array) the binned metric values, values outside the breaks are set to 0
+    """
+    n_bins = len(breaks) - 1
+    # Closed on the lower bound, open on the top
+    metric_bin = np.searchsorted(breaks, metric, side='right') - 1
+    # Make the last interval closed at the upper bound
+    metric_bin[metric == breaks[-1]] = n_bins - 1
+    metric_bin[(metric_bin < 0) | (metric_bin >= n_bins)] = 0
+    return metric_bin
+
+
+def discretize_metric(metric, mask, n_bins, tile_rows=None):
     """
     Convert continuous metrics to discrete, based on the specified number of bins
     INPUTS:
         metric: (np.array) fragmentation metric map
         mask: (np.array) binary mask showing locations which should not be sampled
         n_bins: (int) number of intervals the range of the metric should be divided into
+        tile_rows: (int) if given, process the map this many rows at a time to limit temporary memory
     OUTPUTS:
         metric_bin: (np.array) the binned fragmentation metric
         ids: (list) the unique id values assigned to each bin
         breaks: (list) the intervals where the range of the metric was split
     """
-    imheight, imwidth = metric.shape
-    # Mask out invalid areas of metric (numpy masked array function reads one as invalid, so invert mask)
-    metric_mask = np.ma.masked_array(metric, mask=(1-mask))
-    # Break range of unmasked metric values into 'n_bins' intervals
-    hist, breaks = np.histogram(metric_mask.compressed(), bins=n_bins)
+    imheight = metric.shape[0]
+    if tile_rows is None:
+        tile_rows = imheight
+        # Mask out invalid areas of metric (numpy masked array function reads one as invalid, so invert mask)
+        metric_mask = np.ma.masked_array(metric, mask=(1-mask))
+        # Break range of unmasked metric values into 'n_bins' intervals
+        hist, breaks = np.histogram(metric_mask.compressed(), bins=n_bins)
+    else:
+        # Find the range of the unmasked metric values one tile at a time
+        vmin, vmax = np.inf, -np.inf
+        for start in range(0, imheight, tile_rows):
+            values = metric[start:start + tile_rows][mask[start:start + tile_rows] != 0]
+            if values.size:
+                vmin, vmax = min(vmin, values.min()), max(vmax, values.max())
+        breaks = histogram_breaks(vmin, vmax, n_bins, metric.dtype)
     # Each bin a unique integer ID
     ids = np.arange(0, n_bins)
-    ones = np.ones((imheight, imwidth))
-    metric_bin = np.zeros((imheight, imwidth))
-    # Loop through ID's and convert all values in each bin to corresponding id
-    for ID in ids:
-        # Closed on the lower bound, open on the top
-        lower_lim = np.where(ones, metric_mask >= breaks[ID], 0)
-        upper_lim = np.where(ones, metric_mask < breaks[ID+1], 0)
-        # Make the last interval closed at the upper bound
-        if ID == n_bins-1:
-            upper_lim = np.where(ones, metric_mask <= breaks[ID+1], 0)
-        metric_bin += lower_lim*upper_lim*ID
+    metric_bin = np.zeros(metric.shape)
+    for start in range(0, imheight, tile_rows):
+        metric_bin[start:start + tile_rows] = digitize_metric(metric[start:start + tile_rows], breaks)
     return metric_bin, ids, breaks
 
 
@@ -50,7 +98,7 @@ def build_df(bin_ids):
     return combo_df
 
 
-def bin_metrics(metric_list, mask, bins_list):
+def bin_metrics(metric_list, mask, bins_list, tile_rows=None):
     """
     Bin all input metric arrays into discrete ID arrays, and create a data frame of all the
     unique combinations of these IDs
@@ -58,6 +106,7 @@ def bin_metrics(metric_list, mask, bins_list):
         metric_list: (list) list containing each of the input metric maps
         mask: (np.array) binary mask showing locations which should not be sampled
         bins_list: (list) number of bins each metric should be broken into
+        tile_rows: (int) if given, bin the metrics this many rows at a time
     OUTPUTS:
         binned_metrics: (list) list of all the binned metrics
         combo_df: (data frame) data frame of all combinations
@@ -68,7 +117,7 @@ def bin_metrics(metric_list, mask, bins_list):
     bin_breaks = []
     # Generate a binned version of all input metric arrays
     for i in range(len(metric_list)):
-        metric_bin, ids, breaks = discretize_metric(metric_list[i], mask, bins_list[i])
+        metric_bin, ids, breaks = discretize_metric(metric_list[i], mask, bins_list[i], tile_rows)
         binned_metrics.append(metric_bin)  # Save all new (discretized) metric arrays
         bin_ids.append(ids)  # Save the list of all IDs present for each array
         bin_breaks.append(breaks)  # Save the bin breaks for each metric
@@ -77,7 +126,78 @@ def bin_metrics(metric_list, mask, bins_list):
     return binned_metrics, combo_df, bin_breaks
 
 
-def generate_all_layers(binned_metrics, mask, combo_df, nsp):
+def read_and_bin(source, mask, n_bins, tile_rows=None):
+    """
+    Read a metric map if given a path, then bin it, used by the thread pool in bin_metrics_concurrent
+    """
+    start = time.time()
+    metric = extract_raster(source) if isinstance(source, str) else source
+    metric_bin, ids, breaks = discretize_metric(metric, mask, n_bins, tile_rows)
+    return metric_bin, ids, breaks, time.time() - start
+
+
+def bin_metrics_concurrent(metric_sources, mask, bins_list, threads=None, tile_rows=None, with_labels=True):
+    """
+    Read and bin the metrics on a thread pool, so reading one metric overlaps with reading and binning the others
+    (GDAL and most numpy operations release the GIL). Each metric is added to the combined label as soon as it is
+    binned, and the unbinned map is then dropped
+    INPUTS:
+        metric_sources: (list) paths to each of the metric maps, or the maps themselves if already loaded
+        mask: (np.array) binary mask showing locations which should not be sampled
+        bins_list: (list) number of bins each metric should be broken into
+        threads: (int) number of metrics read at once (default all of them)
+        tile_rows: (int) if given, bin the metrics this many rows at a time
+        with_labels: (bool) also build the combined label array, as label_metrics
+    OUTPUTS:
+        binned_metrics: (list) list of all the binned metrics
+        combo_df: (data frame) data frame of all combinations
+        bin_breaks: (list) list of break points used to discretize the metrics
+        labels: (np.array) combined label of the binned metric ids at each pixel, None if with_labels is False
+    """
+    n_metrics = len(metric_sources)
+    binned_metrics = [None] * n_metrics
+    bin_ids = [None] * n_metrics
+    bin_breaks = [None] * n_metrics
+    labels = None
+    if with_labels:
+        multipliers = label_multipliers(bins_list)
+        label_type = np.int32 if np.prod(bins_list, dtype=np.int64) <= np.iinfo(np.int32).max else np.int64
+        labels = np.zeros(mask.shape, dtype=label_type)
+
+    with ThreadPoolExecutor(max_workers=threads or n_metrics) as pool:
+        futures = {pool.submit(read_and_bin, metric_sources[j], mask, bins_list[j], tile_rows): j
+                   for j in range(n_metrics)}
+        for future in as_completed(futures):
+            j = futures[future]
+            metric_bin, ids, breaks, seconds = future.result()
+            print('Metric {} read and binned in {:.1f}s'.format(j, seconds))
+            binned_metrics[j] = metric_bin
+            bin_ids[j] = ids
+            bin_breaks[j] = breaks
+            if with_labels:
+                labels += (metric_bin * multipliers[j]).astype(label_type)
+    combo_df = build_df(bin_ids)
+    return binned_metrics, combo_df, bin_breaks, labels
+
+
+def threshold_ids(combo_df, nsp):
+    """
+    Remove empty ids, and ids with too few pixels to hold their share of the sample sites
+    INPUTS:
+        combo_df: (data frame) data frame of all combinations, with pixel counts in the Counts column
+        nsp: (int) integer number of sample sites
+    OUTPUTS:
+        id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        s_opt: (float) the optimal number of sample sites per id
+    """
+    id_df = combo_df[combo_df.Counts != 0]  # remove empty bins to create ID data frame
+    s_opt = float(nsp) / len(id_df)  # optimum sample sites in each ID
+    id_df = id_df[id_df.Counts >= 10 * np.ceil(s_opt)]  # remove IDs with too few pixels
+    s_opt = float(nsp) / len(id_df)
+    return id_df, s_opt
+
+
+def generate_all_layers(binned_metrics, mask, combo_df, nsp, layers_path=None):
     """
     Create one-hot masks for each ID and calculate the optimum number of sample sites in each ID
     INPUTS:
@@ -85,6 +205,7 @@ def generate_all_layers(binned_metrics, mask, combo_df, nsp):
         mask: (np.array) binary mask showing locations which should not be sampled
         combo_df: (data frame) data frame of all combinations
         nsp: (int) integer number of sample sites
+        layers_path: (str) if given, store the one-hot masks in a memory mapped file at this path
     OUTPUTS:
         all_layers: (np.array) one-hot masks for each of the unique ids
         id_df: (data frame) reduced version of combo_df, with all empty ids removed
@@ -93,7 +214,10 @@ def generate_all_layers(binned_metrics, mask, combo_df, nsp):
     imheight, imwidth = mask.shape
     combo_num = len(combo_df)
     # create 3d array to store ID combo layers in
-    all_layers = np.zeros((combo_num, imheight, imwidth))
+    if layers_path is None:
+        all_layers = np.zeros((combo_num, imheight, imwidth))
+    else:
+        all_layers = np.memmap(layers_path, dtype=np.float64, mode='w+', shape=(combo_num, imheight, imwidth))
     counts = []
     # Iterate through all unique ID combinations
     for i in range(combo_num):
@@ -107,10 +231,7 @@ def generate_all_layers(binned_metrics, mask, combo_df, nsp):
         counts.append(np.sum(layer_mask))  # Store the number of pixels in each unique combo layer
         all_layers[i, :, :] = layer_mask  # Save combo Id layer in 3d array
     combo_df['Counts'] = counts
-    id_df = combo_df[combo_df.Counts != 0]  # remove empty bins to create ID data frame
-    s_opt = np.float(nsp) / len(id_df)  # optimum sample sites in each ID
-    id_df = id_df[id_df.Counts >= 10 * np.ceil(s_opt)]  # remove IDs with too few pixels
-    s_opt = np.float(nsp) / len(id_df)
+    id_df, s_opt = threshold_ids(combo_df, nsp)
     return all_layers, id_df, s_opt
 
 
@@ -137,6 +258,177 @@ def generate_id_im(all_layers, id_df):
     return id_im, unique_ids
 
 
+def label_multipliers(bins_list):
+    """
+    Calculate the multiplier for each metric used to combine binned metric ids into a single label
+    INPUTS:
+        bins_list: (list) number of bins each metric was broken into
+    OUTPUTS:
+        multipliers: (list) label = sum of binned id * multiplier over all metrics
+    """
+    return [int(np.prod(bins_list[j + 1:], dtype=np.int64)) for j in range(len(bins_list))]
+
+
+def label_metrics(binned_metrics, bins_list, tile_rows=None):
+    """
+    Combine the binned metrics into a single label array, with one label per combination of ids.
+    This replaces the one-hot layers of generate_all_layers with a single integer array
+    INPUTS:
+        binned_metrics: (list) list of all the binned metrics
+        bins_list: (list) number of bins each metric was broken into
+        tile_rows: (int) if given, build the labels this many rows at a time
+    OUTPUTS:
+        labels: (np.array) combined label of the binned metric ids at each pixel
+    """
+    multipliers = label_multipliers(bins_list)
+    imheight = binned_metrics[0].shape[0]
+    label_type = np.int32 if np.prod(bins_list, dtype=np.int64) <= np.iinfo(np.int32).max else np.int64
+    labels = np.zeros(binned_metrics[0].shape, dtype=label_type)
+    if tile_rows is None:
+        tile_rows = imheight
+    for start in range(0, imheight, tile_rows):
+        for j in range(len(binned_metrics)):
+            labels[start:start + tile_rows] += (binned_metrics[j][start:start + tile_rows] * multipliers[j]).astype(label_type)
+    return labels
+
+
+def count_labels(labels, mask, n_labels, tile_rows=None):
+    """
+    Count the (mask weighted) number of pixels with each label
+    INPUTS:
+        labels: (np.array) combined label of the binned metric ids at each pixel, from label_metrics
+        mask: (np.array) binary mask showing locations which should not be sampled
+        n_labels: (int) number of possible labels, the product of the numbers of bins
+        tile_rows: (int) if given, count the labels this many rows at a time
+    OUTPUTS:
+        counts: (np.array) number of valid pixels with each label
+    """
+    imheight = labels.shape[0]
+    if tile_rows is None:
+        tile_rows = imheight
+    counts = np.zeros(n_labels)
+    for start in range(0, imheight, tile_rows):
+        counts += np.bincount(labels[start:start + tile_rows].ravel(),
+                              weights=mask[start:start + tile_rows].ravel(), minlength=n_labels)
+    return counts
+
+
+def combo_labels_of(combo_df, bins_list):
+    """
+    Combined label of each row of combo_df, matching label_metrics
+    """
+    multipliers = label_multipliers(bins_list)
+    return sum(combo_df[j].values.astype(np.int64) * multipliers[j] for j in range(len(bins_list)))
+
+
+def lookup_id_image(labels, mask, id_df, combo_labels, n_labels, tile_rows=None):
+    """
+    Create the combined ID array from the metric labels, numbering the ids kept in id_df from one
+    INPUTS:
+        labels: (np.array) combined label of the binned metric ids at each pixel, from label_metrics
+        mask: (np.array) binary mask showing locations which should not be sampled
+        id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        combo_labels: (np.array) combined label of each row of combo_df, from combo_labels_of
+        n_labels: (int) number of possible labels, the product of the numbers of bins
+        tile_rows: (int) if given, build the id image this many rows at a time
+    OUTPUTS:
+        id_im: (np.array) combined id image
+        unique_ids: (list) list of unique ids contained in id_im
+    """
+    imheight = labels.shape[0]
+    if tile_rows is None:
+        tile_rows = imheight
+    # Look up table from label to position in id_df (counting from one, zero for removed ids)
+    id_lookup = np.zeros(n_labels)
+    unique_ids = []
+    for counter, k in enumerate(id_df.index.values):
+        id_lookup[combo_labels[k]] = counter + 1
+        unique_ids.append(counter + 1)
+    id_im = np.zeros(labels.shape)
+    for start in range(0, imheight, tile_rows):
+        id_im[start:start + tile_rows] = id_lookup[labels[start:start + tile_rows]] * mask[start:start + tile_rows]
+    return id_im, unique_ids
+
+
+def generate_id_labels(labels, mask, combo_df, nsp, bins_list, tile_rows=None):
+    """
+    Count pixels in each ID and create the combined ID array directly from the metric labels,
+    giving the same outputs as generate_all_layers followed by generate_id_im without the one-hot layers
+    INPUTS:
+        labels: (np.array) combined label of the binned metric ids at each pixel, from label_metrics
+        mask: (np.array) binary mask showing locations which should not be sampled
+        combo_df: (data frame) data frame of all combinations
+        nsp: (int) integer number of sample sites
+        bins_list: (list) number of bins each metric was broken into
+        tile_rows: (int) if given, process the labels this many rows at a time
+    OUTPUTS:
+        id_im: (np.array) combined id image
+        unique_ids: (list) list of unique ids contained in id_im
+        id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        s_opt: (float) the optimal number of sample sites per id
+    """
+    n_labels = int(np.prod(bins_list, dtype=np.int64))
+    combo_labels = combo_labels_of(combo_df, bins_list)
+    counts = count_labels(labels, mask, n_labels, tile_rows)
+    combo_df['Counts'] = counts[combo_labels]
+    id_df, s_opt = threshold_ids(combo_df, nsp)
+    id_im, unique_ids = lookup_id_image(labels, mask, id_df, combo_labels, n_labels, tile_rows)
+    return id_im, unique_ids, id_df, s_opt
+
+
+def build_id_image(metric_list, mask, bins_list, nsp, representation='in-memory', tile_rows=None, layers_path=None,
+                   threads=None):
+    """
+    Run the binning and ID stages using the chosen representation (see utils.plan_memory)
+    INPUTS:
+        metric_list: (list) list containing each of the input metric maps, or paths to them if threads is given
+        mask: (np.array) binary mask showing locations which should not be sampled
+        bins_list: (list) number of bins each metric should be broken into
+        nsp: (int) integer number of sample sites
+        representation: (str) one of 'in-memory' (one-hot layers), 'memmap' (one-hot layers on disk),
+                        'sparse' (combined labels) or 'tiled' (combined labels processed in row tiles)
+        tile_rows: (int) rows per tile for the tiled representation
+        layers_path: (str) file to hold the one-hot layers for the memmap representation, a temporary file if None
+        threads: (int) if given, read and bin this many metrics at once (see bin_metrics_concurrent)
+    OUTPUTS:
+        binned_metrics: (list) list of all the binned metrics
+        bin_breaks: (list) list of break points used to discretize the metrics
+        id_im: (np.array) combined id image
+        unique_ids: (list) list of unique ids contained in id_im
+        id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        s_opt: (float) the optimal number of sample sites per id
+    """
+    if representation not in ('in-memory', 'memmap', 'sparse', 'tiled'):
+        raise ValueError('Unknown representation {}'.format(representation))
+    if representation != 'tiled':
+        tile_rows = None
+    labels = None
+    if threads is not None:
+        binned_metrics, combo_df, bin_breaks, labels = bin_metrics_concurrent(
+            metric_list, mask, bins_list, threads, tile_rows, with_labels=representation in ('sparse', 'tiled'))
+    else:
+        binned_metrics, combo_df, bin_breaks = bin_metrics(metric_list, mask, bins_list, tile_rows)
+
+    if representation in ('sparse', 'tiled'):
+        if labels is None:
+            labels = label_metrics(binned_metrics, bins_list, tile_rows)
+        id_im, unique_ids, id_df, s_opt = generate_id_labels(labels, mask, combo_df, nsp, bins_list, tile_rows)
+    elif representation == 'memmap':
+        remove_layers = layers_path is None
+        if remove_layers:
+            fd, layers_path = tempfile.mkstemp(suffix='.dat')
+            os.close(fd)
+        all_layers, id_df, s_opt = generate_all_layers(binned_metrics, mask, combo_df, nsp, layers_path)
+        id_im, unique_ids = generate_id_im(all_layers, id_df)
+        del all_layers
+        if remove_layers:
+            os.remove(layers_path)
+    else:
+        all_layers, id_df, s_opt = generate_all_layers(binned_metrics, mask, combo_df, nsp)
+        id_im, unique_ids = generate_id_im(all_layers, id_df)
+    return binned_metrics, bin_breaks, id_im, unique_ids, id_df, s_opt
+
+
 def upper_lower_suggest(nsp, id_df):
     """
     Calculate upper and lower number of sample sites to meet uniform distribution
@@ -154,7 +446,7 @@ def upper_lower_suggest(nsp, id_df):
     return nsp_lower.astype(int), nsp_upper.astype(int)
 
 
-def generate_id_list(unique_ids, s_opt, nsp, id_df):
+def generate_id_list(unique_ids, s_opt, nsp, id_df, random_state=None):
     """
     Generate a list of ids to sample in the design
     INPUTS:
@@ -162,15 +454,22 @@ def generate_id_list(unique_ids, s_opt, nsp, id_df):
         s_opt: (float) the optimal number of sample sites per id
         nsp: (int) integer number of sample sites
         id_df: (data frame) reduced version of combo_df, with all empty ids removed
+        random_state: (np.random.RandomState) random numbers used to draw and shuffle the ids, the global numpy
+            random state if not given
     OUTPUTS:
         id_mix: (np.array) list of ids to sample, randomly shuffled
         id_df: (data frame) reduced version of combo_df, with all empty ids removed
     """
+    # Store the id each row of id_df is given in id_im, used to merge metric ids into the saved design
+    if random_state is None:
+        random_state = np.random
+    id_df = id_df.copy()
+    id_df['ID'] = unique_ids
     id_rep = np.repeat(unique_ids, np.floor(s_opt))
     diff = nsp - len(id_rep)
     if diff > 0:
         print('difference of {}'.format(diff))
-        extra_ids = np.random.choice(unique_ids, diff, replace=False)
+        extra_ids = random_state.choice(unique_ids, diff, replace=False)
         id_rep = np.hstack([id_rep, extra_ids])
     elif diff < 0:
         print('error')
@@ -183,7 +482,7 @@ def generate_id_list(unique_ids, s_opt, nsp, id_df):
         df_ids = [i - 1 for i in id_rep]
         id_df = id_df.iloc[df_ids, :].copy(deep=True)
     id_df['Freq'] = np.unique(id_rep, return_counts=True)[1]
-    id_mix = np.random.permutation(id_rep)
+    id_mix = random_state.permutation(id_rep)
     return id_mix, id_df
 
 
@@ -191,12 +490,12 @@ def get_sampling_info(df_path):
     # All sites
     site_df = pd.read_csv(df_path)
     nsp = len(site_df)
-    unique_IDs = np.unique(site_df.combocode.values)
+    unique_IDs = np.unique(site_df.ID.values)
     # Sampled sites
     sampled_df = site_df.loc[site_df['sampled'] == 1]
     nsampled = len(sampled_df)
     # Unsampled sites
     unsampled_df = site_df.loc[site_df['sampled'] != 1]
-    id_mix_unsampled = np.random.choice(unsampled_df.combocode.values, len(unsampled_df), replace=False)
-    save_IDs = np.hstack([sampled_df.combocode.values, id_mix_unsampled])
+    id_mix_unsampled = np.random.choice(unsampled_df.ID.values, len(unsampled_df), replace=False)
+    save_IDs = np.hstack([sampled_df.ID.values, id_mix_unsampled])
     return sampled_df, nsp, id_mix_unsampled, save_IDs, unique_IDs, nsampled
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+import time
+from utils.load import get_file_info, extract_raster
+from utils.plot import plot_uniform
+from utils.save import save_uniform
+from .uda import generate_uniform_design
+from .uda_parts import bin_metrics, label_metrics, count_labels, combo_labels_of, threshold_ids, lookup_id_image, \
+    generate_id_list, upper_lower_suggest
+
+
+class DesignSession(object):
+    """
+    Uniform design for interactive use, for example in a notebook. Each stage of generate_uniform_design.py is run
+    when its result is first needed and kept until one of the inputs it depends on changes, so changing the number
+    of sample sites only reruns the thresholding of ids onward, and changing the mask does not read the maps again.
+
+    Example:
+        session = DesignSession('input/HabitatMap.tif', ['input/FragmentAreaLog10.tif'], [7], nsp=80)
+        x, y = session.design
+        session.update(nsp=50)
+        x, y = session.design
+        print(session.timings)
+
+    Inputs are compared by value, so after editing a map in place call invalidate with the name of its input
+    (for example session.invalidate('mask_path')) to read it again.
+    """
+
+    # Inputs and stages each stage depends on
+    STAGES = {
+        'habitat': ['hab_path'],
+        'metrics': ['metric_paths'],
+        'mask': ['mask_path', 'habitat'],
+        'binned': ['habitat', 'metrics', 'mask', 'bins'],
+        'counts': ['binned', 'mask'],
+        'ids': ['counts', 'mask', 'nsp'],
+        'id_list': ['ids', 'nsp', 'seed'],
+        'design': ['id_list', 'seed'],
+    }
+
+    def __init__(self, hab_path, metric_paths, bins, nsp=30, mask_path=None, seed=None):
+        """
+        INPUTS:
+            hab_path: (str) path to categorical habitat map
+            metric_paths: (list) path to each of the metric maps
+            bins: (list) number of bins to break each metric into
+            nsp: (int) integer number of sample sites
+            mask_path: (str) path to the invalid areas mask, or the mask itself as an array (default no mask)
+            seed: (int) random seed for the id list and design, the same seed gives the same design
+        """
+        self.inputs = {'hab_path': hab_path, 'metric_paths': list(metric_paths), 'bins': [int(b) for b in bins],
+                       'nsp': int(nsp), 'mask_path': mask_path, 'seed': seed}
+        self.results = {}
+        self.timings = pd.Series(dtype=float)
+
+    def update(self, **inputs):
+        """
+        Change inputs of the session, dropping only the results of stages which depend on them
+        INPUTS:
+            **inputs: new values for any of hab_path, metric_paths, bins, nsp, mask_path or seed
+        """
+        for name, value in inputs.items():
+            if name not in self.inputs:
+                raise ValueError('Unknown input {}, choose from {}'.format(name, ', '.join(self.inputs)))
+            if isinstance(value, (list, tuple)):
+                value = list(value)
+            current = self.inputs[name]
+            if value is current or (not isinstance(value, np.ndarray) and not isinstance(current, np.ndarray)
+                                    and value == current):
+                continue
+            self.inputs[name] = value
+            self.invalidate(name)
+        return self
+
+    def invalidate(self, name):
+        """
+        Drop the results of every stage depending on an input or stage
+        INPUTS:
+            name: (str) name of the input or stage which changed
+        """
+        for stage, depends in self.STAGES.items():
+            if name in depends and stage in self.results:
+                del self.results[stage]
+                self.invalidate(stage)
+        return
+
+    def get(self, stage):
+        """
+        Result of a stage, running it (and any stages it depends on) if needed
+        INPUTS:
+            stage: (str) name of the stage, see STAGES
+        OUTPUTS:
+            result: output of the stage
+        """
+        if stage not in self.STAGES:
+            raise ValueError('Unknown stage {}, choose from {}'.format(stage, ', '.join(self.STAGES)))
+        if stage not in self.results:
+            for depend in self.STAGES[stage]:
+                if depend in self.STAGES:
+                    self.get(depend)
+            start = time.time()
+            self.results[stage] = getattr(self, 'run_{}'.format(stage))()
+            self.timings[stage] = time.time() - start
+        return self.results[stage]
+
+    def stale(self):
+        """
+        Stages which will be run the next time the design is requested
+        """
+        return [stage for stage in self.STAGES if stage not in self.results]
+
+    @property
+    def bins_list(self):
+        return [self.get('habitat')['n_bins']] + self.inputs['bins']
+
+    def run_habitat(self):
+        habmap, n_bins, res, geo_t, prj_info = get_file_info(self.inputs['hab_path'])
+        return {'map': habmap, 'n_bins': n_bins, 'res': res, 'geo_t': geo_t, 'prj_info': prj_info}
+
+    def run_metrics(self):
+        return [extract_raster(path) for path in self.inputs['metric_paths']]
+
+    def run_mask(self):
+        mask_path = self.inputs['mask_path']
+        if mask_path is None:
+            return np.ones(self.get('habitat')['map'].shape)
+        if isinstance(mask_path, str):
+            return extract_raster(mask_path)
+        return np.asarray(mask_path)
+
+    def run_binned(self):
+        metric_list = [self.get('habitat')['map']] + self.get('metrics')
+        binned_metrics, combo_df, bin_breaks = bin_metrics(metric_list, self.get('mask'), self.bins_list)
+        return {'binned_metrics': binned_metrics, 'combo_df': combo_df, 'bin_breaks': bin_breaks}
+
+    def run_counts(self):
+        bins_list = self.bins_list
+        n_labels = int(np.prod(bins_list, dtype=np.int64))
+        labels = label_metrics(self.get('binned')['binned_metrics'], bins_list)
+        return {'labels': labels, 'n_labels': n_labels, 'counts': count_labels(labels, self.get('mask'), n_labels),
+                'combo_labels': combo_labels_of(self.get('binned')['combo_df'], bins_list)}
+
+    def run_ids(self):
+        counts = self.get('counts')
+        combo_df = self.get('binned')['combo_df'].copy()
+        combo_df['Counts'] = counts['counts'][counts['combo_labels']]
+        id_df, s_opt = threshold_ids(combo_df, self.inputs['nsp'])
+        id_im, unique_ids = lookup_id_image(counts['labels'], self.get('mask'), id_df, counts['combo_labels'],
+                                            counts['n_labels'])
+        return {'id_im': id_im, 'unique_ids': unique_ids, 'id_df': id_df, 's_opt': s_opt}
+
+    def run_id_list(self):
+        ids = self.get('ids')
+        id_mix, id_df = generate_id_list(ids['unique_ids'], ids['s_opt'], self.inputs['nsp'], ids['id_df'],
+                                         random_state=np.random.RandomState(self.inputs['seed']))
+        return {'id_mix': id_mix, 'id_df': id_df}
+
+    def run_design(self):
+        return generate_uniform_design(self.get('id_list')['id_mix'], self.get('ids')['id_im'],
+                                       rng=np.random.default_rng(self.inputs['seed']))
+
+    @property
+    def mask(self):
+        return self.get('mask')
+
+    @property
+    def binned_metrics(self):
+        return self.get('binned')['binned_metrics']
+
+    @property
+    def bin_breaks(self):
+        return self.get('binned')['bin_breaks']
+
+    @property
+    def id_im(self):
+        return self.get('ids')['id_im']
+
+    @property
+    def id_df(self):
+        return self.get('id_list')['id_df']
+
+    @property
+    def s_opt(self):
+        return self.get('ids')['s_opt']
+
+    @property
+    def id_mix(self):
+        return self.get('id_list')['id_mix']
+
+    @property
+    def design(self):
+        return self.get('design')
+
+    def suggest_nsp(self):
+        """
+        Lower and upper numbers of sample sites giving the same number of sites in every id
+        """
+        return upper_lower_suggest(self.inputs['nsp'], self.get('ids')['id_df'])
+
+    def plot(self):
+        """
+        Plot the design in a pop up, as plot_uniform
+        """
+        x, y = self.design
+        plot_uniform(self.id_im, self.mask, x, y)
+        return
+
+    def save(self, save_path):
+        """
+        Save the design as save_uniform, including the id image, binned metrics and mask
+        INPUTS:
+            save_path: (str) path specifying where to save the files
+        OUTPUTS:
+            csv_path: (str) path of the saved .csv file
+        """
+        x, y = self.design
+        habitat = self.get('habitat')
+        return save_uniform(x, y, self.id_mix, self.id_df, self.id_im, habitat['prj_info'], habitat['geo_t'],
+                            save_path, binned_metrics=self.binned_metrics, mask=self.mask)
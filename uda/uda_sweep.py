@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import itertools
+from functools import reduce
+from .uda_parts import histogram_breaks, digitize_metric, build_df, label_multipliers, threshold_ids, \
+    upper_lower_suggest, combo_labels_of
+
+
+def lcm(a, b):
+    return a * b // np.gcd(a, b)
+
+
+def fine_count_table(metric_list, mask, bins_options):
+    """
+    Count the valid pixels in each cell of a fine joint histogram of the metrics. The number of fine bins for each
+    metric is a common multiple of all the bin numbers to be tried, so every coarser binning is a merge of fine bins
+    and can be evaluated from this table without reading the metric maps again
+    INPUTS:
+        metric_list: (list) list containing each of the input metric maps
+        mask: (np.array) binary mask showing locations which should not be sampled
+        bins_options: (list) for each metric, a list of the numbers of bins to be tried
+    OUTPUTS:
+        table: (dict) 'fine_bins' number of fine bins per metric, 'cells' fine bin ids of each occupied cell
+               (one row per cell, one column per metric) and 'counts' number of valid pixels in each cell
+    """
+    valid = mask != 0
+    if not valid.any():
+        raise ValueError('No valid pixels in the mask to count the metric bins over')
+    fine_bins = [int(reduce(lcm, [int(n) for n in options])) for options in bins_options]
+    if np.prod(fine_bins, dtype=np.float64) > np.iinfo(np.int64).max:
+        raise ValueError('Too many fine bins {} to combine, try fewer bin options per metric'.format(fine_bins))
+    multipliers = label_multipliers(fine_bins)
+
+    # Fine bin ids of the valid pixels, combined into a single label as in label_metrics
+    labels = np.zeros(np.count_nonzero(valid), dtype=np.int64)
+    for j in range(len(metric_list)):
+        values = metric_list[j][valid]
+        breaks = histogram_breaks(values.min(), values.max(), fine_bins[j], metric_list[j].dtype)
+        labels += digitize_metric(values, breaks).astype(np.int64) * multipliers[j]
+
+    cell_labels, counts = np.unique(labels, return_counts=True)
+    cells = np.stack(np.unravel_index(cell_labels, fine_bins), axis=-1) if len(fine_bins) else cell_labels
+    print('{} valid pixels fall in {} occupied cells of the fine histogram'.format(len(labels), len(cell_labels)))
+    return {'fine_bins': fine_bins, 'cells': cells, 'counts': counts}
+
+
+def evaluate_bins(table, bins_list, nsp):
+    """
+    Work out the ids which survive for a given binning of the metrics, using the fine count table only.
+    Matches bin_metrics and generate_all_layers, apart from pixels lying exactly on a bin break which can
+    fall either side due to rounding
+    INPUTS:
+        table: (dict) output of fine_count_table
+        bins_list: (list) number of bins each metric should be broken into
+        nsp: (int) integer number of sample sites
+    OUTPUTS:
+        summary: (dict) number of combinations, non empty and surviving ids, s_opt, pixel counts and the
+                 suggested lower and upper numbers of sample sites
+    """
+    # Merge fine bins into the coarse bins, fine bin i lies in coarse bin floor(i * n_bins / fine_bins)
+    multipliers = label_multipliers(bins_list)
+    coarse_labels = np.zeros(len(table['counts']), dtype=np.int64)
+    for j in range(len(bins_list)):
+        coarse_labels += (table['cells'][:, j] * bins_list[j] // table['fine_bins'][j]) * multipliers[j]
+    counts = np.bincount(coarse_labels, weights=table['counts'], minlength=int(np.prod(bins_list)))
+
+    # Same steps as generate_all_layers, on the counts alone
+    combo_df = build_df([np.arange(0, n) for n in bins_list])
+    combo_labels = combo_labels_of(combo_df, bins_list)
+    combo_df['Counts'] = counts[combo_labels]
+    summary = {'bins': ';'.join(str(n) for n in bins_list), 'nsp': nsp, 'n_combos': len(combo_df),
+               'n_nonempty': int(np.count_nonzero(combo_df.Counts))}
+    try:
+        id_df, s_opt = threshold_ids(combo_df, nsp)
+        nsp_lower, nsp_upper = upper_lower_suggest(nsp, id_df)
+    except ZeroDivisionError:
+        # No ids have enough pixels for this many sample sites
+        summary.update({'n_ids': 0, 's_opt': np.nan, 'min_count': 0, 'max_count': 0,
+                        'nsp_lower': 0, 'nsp_upper': 0})
+        return summary
+    summary.update({'n_ids': len(id_df), 's_opt': s_opt, 'min_count': id_df.Counts.min(),
+                    'max_count': id_df.Counts.max(), 'nsp_lower': nsp_lower, 'nsp_upper': nsp_upper})
+    return summary
+
+
+def sweep_bins(metric_list, mask, bins_options, nsp_list):
+    """
+    Evaluate every combination of the bin options for each metric, for each number of sample sites
+    INPUTS:
+        metric_list: (list) list containing each of the input metric maps
+        mask: (np.array) binary mask showing locations which should not be sampled
+        bins_options: (list) for each metric, a list of the numbers of bins to be tried
+        nsp_list: (list) numbers of sample sites to be tried
+    OUTPUTS:
+        sweep_df: (data frame) one row per binning and number of sample sites, see evaluate_bins
+    """
+    table = fine_count_table(metric_list, mask, bins_options)
+    rows = []
+    for bins_list in itertools.product(*bins_options):
+        for nsp in nsp_list:
+            rows.append(evaluate_bins(table, list(bins_list), nsp))
+    return pd.DataFrame(rows)
@@ -1,10 +1,13 @@
 import numpy as np
-from random import randint
 from scipy import ndimage
 from copy import copy
+from utils.candidates import choose_max
+from utils.checkpoint import load_placement, save_checkpoint, check_checkpoint, pack_distance, restore_distance
+from utils.local_update import find_affected_sites, local_update_report
 
 
-def update_uniform_design(mask, id_mix, id_im, sampled_csv):
+def update_uniform_design(mask, id_mix, id_im, sampled_csv, checkpoint_path=None, checkpoint_every=10, resume=False,
+                          save_distance=False, rng=None, kept=None):
     """
     Main function for updating an existing or partially completed uniform design, when certain sites are inaccessible.
     Places site evenly within the range of the input metrics, while also spacing them as evenly as possible spatially.
@@ -13,6 +16,13 @@ def update_uniform_design(mask, id_mix, id_im, sampled_csv):
         id_mix: (list) list of metric id values to be sampled
         id_im: (np.array) distribution of all metric id values in the study landscape
         sampled_csv: (data frame) Tagged data frame output by the original uniform design
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path, giving the same design as an uninterrupted run
+        save_distance: (bool) also save the distance transform in checkpoints, so it is not recomputed on resume
+        rng: (np.random.Generator) random number generator used to break ties, pass a seeded generator for
+             reproducible designs
+        kept: (np.array) if given, true for unsampled sites which also stay where they are
     OUTPUTS:
         x_vals: (list) x coordinates of sample sites
         y_vals: (list) y coordinates of sample sites
@@ -20,9 +30,13 @@ def update_uniform_design(mask, id_mix, id_im, sampled_csv):
 
     # Extract sampled site information from csv file
     nsp = len(sampled_csv)
-    sampled_df = sampled_csv.loc[sampled_csv['sampled'] == 1]
+    fixed = sampled_csv['sampled'].values == 1
+    print('{} sites already sampled and will not be moved'.format(np.count_nonzero(fixed)))
+    if kept is not None:
+        print('{} unsampled sites kept in place'.format(np.count_nonzero(kept & ~fixed)))
+        fixed = fixed | kept
+    sampled_df = sampled_csv.loc[fixed]
     n_sampled = len(sampled_df)
-    print('{} sites already sampled and will not be moved'.format(n_sampled))
     print('{} sites to be adjusted based on mask update'.format(nsp - n_sampled))
 
     imheight, imwidth = id_im.shape
@@ -40,7 +54,20 @@ def update_uniform_design(mask, id_mix, id_im, sampled_csv):
 
     loop_count = 1
 
-    for i in id_mix:
+    if rng is None:
+        rng = np.random.default_rng()
+
+    checkpoint = load_placement(checkpoint_path) if resume else None
+    if checkpoint is not None:
+        check_checkpoint(checkpoint, 'update_uniform_design', id_im.shape)
+        x_vals, y_vals = checkpoint['x_vals'], checkpoint['y_vals']
+        rng.bit_generator.state = checkpoint['random_state']
+        sites[x_vals.astype(int), y_vals.astype(int)] = 0
+        dist_im = restore_distance(checkpoint, sites)
+        loop_count = len(x_vals) - n_sampled + 1
+        print('Resuming design from checkpoint, {} sites already placed'.format(loop_count - 1))
+
+    for i in id_mix[loop_count - 1:]:
         print('Plotting site {} of {}'.format(loop_count, nsp - n_sampled))
 
         # Select binary map relating to selected ID
@@ -49,12 +76,8 @@ def update_uniform_design(mask, id_mix, id_im, sampled_csv):
         # Mask out any regions of EDT not in ID
         layer = mask_id * dist_im * mask_aux
 
-        # Extract coordinates of pixels with maximum distance value
-        dist_mx = list(zip(*np.where(layer == layer.max())))
-
-        # Choose one max coord pair at random
-        idx = randint(0, len(dist_mx) - 1)
-        x, y = dist_mx[idx]
+        # Choose one of the pixels with maximum distance value at random
+        x, y = choose_max(layer, rng)
 
         # Save coordinates
         x_vals = np.append(x_vals, x)
@@ -66,7 +89,54 @@ def update_uniform_design(mask, id_mix, id_im, sampled_csv):
         # Update the euclidean distance transform
         dist_im = ndimage.distance_transform_edt(sites)
 
+        # Save progress so the design can be resumed if it is stopped
+        if checkpoint_path is not None and (loop_count % checkpoint_every == 0 or loop_count == len(id_mix)):
+            save_checkpoint(checkpoint_path, design='update_uniform_design', shape=id_im.shape,
+                            x_vals=x_vals, y_vals=y_vals, random_state=rng.bit_generator.state,
+                            distance=pack_distance(dist_im) if save_distance else None)
+
         loop_count += 1
 
     print('Adapted uniform design complete!')
     return x_vals, y_vals
+
+
+def update_uniform_design_local(original_mask, updated_mask, id_im, sampled_csv, factor=1.0, checkpoint_path=None,
+                                checkpoint_every=10, resume=False, rng=None):
+    """
+    Update a uniform design after a mask change, placing again only the sites affected by the change (see
+    find_affected_sites). Each affected site is placed again within its original id, all other sites stay in place.
+    INPUTS:
+        original_mask: (np.array) invalid areas mask the design was generated with
+        updated_mask: (np.array) updated invalid areas mask
+        id_im: (np.array) distribution of all metric id values in the study landscape
+        sampled_csv: (data frame) Tagged data frame output by the original uniform design
+        factor: (float) multiple of the nearest neighbour distance searched for mask changes around each site
+        checkpoint_path: (str) if given, save the sites placed so far to this file every checkpoint_every sites
+        checkpoint_every: (int) number of sites placed between checkpoints
+        resume: (bool) continue from the sites saved in checkpoint_path
+        rng: (np.random.Generator) random number generator used to break ties
+    OUTPUTS:
+        x_vals: (np.array) x coordinates of sample sites, sampled sites first then the others in their original order
+        y_vals: (np.array) y coordinates of sample sites, in the same order
+        save_ids: (np.array) metric id value of each sample site, in the same order
+        report: (data frame) output of local_update_report
+    """
+    affected = find_affected_sites(original_mask, updated_mask, sampled_csv, factor)
+    print('{} of {} unsampled sites affected by the mask update'.format(
+        affected.sum(), sum(sampled_csv['sampled'] != 1)))
+
+    # Keep every unaffected site in place
+    ids = sampled_csv['ID'].values
+    x_all, y_all = update_uniform_design(updated_mask, ids[affected], id_im, sampled_csv, checkpoint_path,
+                                         checkpoint_every, resume, rng=rng, kept=~affected)
+    x_new = sampled_csv['row'].values.astype(float)
+    y_new = sampled_csv['col'].values.astype(float)
+    x_new[affected] = np.hstack(x_all)[np.count_nonzero(~affected):]
+    y_new[affected] = np.hstack(y_all)[np.count_nonzero(~affected):]
+    report = local_update_report(sampled_csv, affected, x_new, y_new)
+    report['ID'] = ids
+
+    sampled = sampled_csv['sampled'].values == 1
+    order = np.concatenate([np.flatnonzero(sampled), np.flatnonzero(~sampled)])
+    return x_new[order], y_new[order], ids[order], report
@@ -11,14 +11,22 @@
 # --save_folder is the name of the directory where outputs will be saved, in the results sub-folder
 # --updated_mask_path is the name of the updated mask file (for example InvalidAreasMask_updated.tif)
 # --csv_path csv file output by the original stratified design, sampled sites should be tagged with a one
+# --resume (optional flag) continue from the last checkpoint if the previous run was stopped
+# --checkpoint_every (optional) number of sites placed between checkpoints, default 10
+# --local (optional flag) only move the sites near changes between the original and updated masks, keeping
+#        the rest in place. The changes are also saved to a _report.csv file
+# --original_mask_path the mask the design was generated with, needed with --local
+# --candidates_path (optional) .csv or vector file of the points sites may be placed at, for example along trails
+#        and roads, combined with the mask (see load_candidate_points), not used with --local
 ###################################################################
 # Example adapting design generated using the test data
 # python update_stratified_design_opt1.py --save_folder=Stratified_Adapted
 # --updated_mask_path=input/InvalidAreasMask_updated.tif --csv_path=results/30site_strat_tagged_opt1.csv
 ###################################################################
 
-from utils import get_file_info, plot_adapted_stratified, save_stratified
-from sda import update_stratified_design
+from utils import get_file_info, extract_raster, plot_adapted_stratified, save_stratified, clear_checkpoint
+from utils import load_candidate_points
+from sda import update_stratified_design, update_stratified_design_local, update_stratified_design_points
 import os
 import click
 import pandas as pd
@@ -28,7 +36,15 @@ import pandas as pd
 @click.option('--save_folder', type=str, default='Stratified_Adapted', help='Name folder where results will be saved')
 @click.option('--updated_mask_path', type=str, default='input/InvalidAreasMask_updated.tif', help='Path and name of updated invalid areas mask')
 @click.option('--csv_path', type=str, default='results/30site_strat_tagged_opt2.csv', help='Path to tagged csv file')
-def generate_design(save_folder, updated_mask_path, csv_path):
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped design')
+@click.option('--checkpoint_every', type=int, default=10, help='Number of sites placed between checkpoints')
+@click.option('--local', is_flag=True, help='Only move sites near changes to the mask')
+@click.option('--original_mask_path', type=str, default='input/InvalidAreasMask.tif', help='Path and name of original invalid areas mask, used with --local')
+@click.option('--candidates_path', type=str, default=None, help='Path and name of the candidate points file')
+def generate_design(save_folder, updated_mask_path, csv_path, resume, checkpoint_every, local, original_mask_path,
+                    candidates_path):
+    if candidates_path is not None and local:
+        raise click.UsageError('--candidates_path can not be used with --local')
 
     # make results folder to save output
     save_path = 'results/{}'.format(save_folder)
@@ -40,14 +56,30 @@ def generate_design(save_folder, updated_mask_path, csv_path):
     updated_mask, n_bins, res, geo_t, prj_info = get_file_info(updated_mask_path)
     sampled_csv = pd.read_csv(csv_path)
 
-    # generate design
-    x_adpt, y_adpt = update_stratified_design(updated_mask, sampled_csv)
+    # generate design, saving progress to a checkpoint
+    checkpoint_path = '{}/{}site_strat_adapted_checkpoint.pkl'.format(save_path, len(sampled_csv))
+    if not resume:
+        clear_checkpoint(checkpoint_path)
+    if local:
+        original_mask = extract_raster(original_mask_path)
+        x_adpt, y_adpt, report = update_stratified_design_local(original_mask, updated_mask, sampled_csv,
+                                                                checkpoint_path=checkpoint_path,
+                                                                checkpoint_every=checkpoint_every, resume=resume)
+    elif candidates_path is not None:
+        # place sites only at the candidate points valid in the updated mask
+        rows, cols = load_candidate_points(candidates_path, prj_info, geo_t, updated_mask.shape, updated_mask)
+        x_adpt, y_adpt = update_stratified_design_points(rows, cols, sampled_csv)
+    else:
+        x_adpt, y_adpt = update_stratified_design(updated_mask, sampled_csv, checkpoint_path, checkpoint_every, resume)
 
     # plot design in pop up
     plot_adapted_stratified(updated_mask, x_adpt, y_adpt, sampled_csv)
 
     # save results to csv
-    save_stratified(x_adpt, y_adpt, prj_info, geo_t, save_path, sampled_csv)
+    csv_path = save_stratified(x_adpt, y_adpt, prj_info, geo_t, save_path, sampled_csv)
+    if local:
+        report.to_csv(csv_path.replace('.csv', '_report.csv'), index=False)
+    clear_checkpoint(checkpoint_path)
     return
 
 
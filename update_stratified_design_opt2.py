@@ -15,14 +15,27 @@
 #       2 : If the site is inaccessible, and you wish to exclude a radius around it
 #       0 : Any sites which have not been sampled
 # --radius is the radius to exclude around inaccessible sites (in metres)
+# --resume (optional flag) continue from the last checkpoint if the previous run was stopped
+# --checkpoint_every (optional) number of sites placed between checkpoints, default 10
+# --local (optional flag) only move the sites near the excluded areas, keeping the rest in place.
+#        The changes are also saved to a _report.csv file
+# --candidates_path (optional) .csv or vector file of the points sites may be placed at, for example along trails
+#        and roads, combined with the mask (see load_candidate_points), not used with --local
+# --backend (optional) numpy (default) excludes the radius around tagged sites in memory, dask does it in chunks of
+#        rows in parallel, giving the same mask
+# --scheduler (optional) with the dask backend, processes (default) for the local cpus or the address of a
+#        dask.distributed scheduler to run on a cluster
+# --chunk_rows (optional) with the dask backend, number of mask rows in each chunk, default 1024
 ###################################################################
 # Example adapting design generated using the test data
 # python update_stratified_design_opt2.py --save_folder=Stratified_Adapted --original_mask_path=input/InvalidAreasMask.tif
 # --csv_path=results/30site_strat_tagged_opt2.csv --radius=1000
 ###################################################################
 
-from utils import get_file_info, plot_adapted_stratified, save_stratified, update_mask
-from sda import update_stratified_design
+from utils import get_file_info, plot_adapted_stratified, save_stratified, clear_checkpoint, update_mask
+from utils import update_mask_chunked, get_scheduler
+from utils import load_candidate_points
+from sda import update_stratified_design, update_stratified_design_local, update_stratified_design_points
 import os
 import click
 import pandas as pd
@@ -33,7 +46,17 @@ import pandas as pd
 @click.option('--original_mask_path', type=str, default='input/InvalidAreasMask.tif', help='Path and name of invalid areas mask')
 @click.option('--csv_path', type=str, default='results/30site_strat_tagged_opt2.csv', help='Path to tagged csv file')
 @click.option('--radius', type=float, default=3000, help='Radius to exclude around tagged points (in metres)')
-def generate_design(save_folder, original_mask_path, csv_path, radius):
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped design')
+@click.option('--checkpoint_every', type=int, default=10, help='Number of sites placed between checkpoints')
+@click.option('--local', is_flag=True, help='Only move sites near the excluded areas')
+@click.option('--candidates_path', type=str, default=None, help='Path and name of the candidate points file')
+@click.option('--backend', type=click.Choice(['numpy', 'dask']), default='numpy', help='Array backend used to update the mask')
+@click.option('--scheduler', type=str, default='processes', help='Dask scheduler, processes or a cluster address')
+@click.option('--chunk_rows', type=int, default=1024, help='Number of mask rows in each chunk for the dask backend')
+def generate_design(save_folder, original_mask_path, csv_path, radius, resume, checkpoint_every, local,
+                    candidates_path, backend, scheduler, chunk_rows):
+    if candidates_path is not None and local:
+        raise click.UsageError('--candidates_path can not be used with --local')
 
     # make results folder to save output
     save_path = 'results/{}'.format(save_folder)
@@ -44,16 +67,36 @@ def generate_design(save_folder, original_mask_path, csv_path, radius):
     original_mask, n_bins, res, geo_t, prj_info = get_file_info(original_mask_path)
     sampled_csv = pd.read_csv(csv_path)
 
-    updated_mask = update_mask(sampled_csv, original_mask, radius, res)
+    # exclude a radius around the tagged sites, the dask backend updates the mask chunk by chunk in parallel
+    if backend == 'dask':
+        updated_mask = update_mask_chunked(sampled_csv, original_mask, radius, res, chunk_rows).compute(
+            **get_scheduler(scheduler))
+    else:
+        updated_mask = update_mask(sampled_csv, original_mask, radius, res)
 
-    # generate design
-    x_adpt, y_adpt = update_stratified_design(updated_mask, sampled_csv)
+    # generate design, saving progress to a checkpoint
+    checkpoint_path = '{}/{}site_strat_adapted_checkpoint.pkl'.format(save_path, len(sampled_csv))
+    if not resume:
+        clear_checkpoint(checkpoint_path)
+    if local:
+        x_adpt, y_adpt, report = update_stratified_design_local(original_mask, updated_mask, sampled_csv,
+                                                                checkpoint_path=checkpoint_path,
+                                                                checkpoint_every=checkpoint_every, resume=resume)
+    elif candidates_path is not None:
+        # place sites only at the candidate points valid in the updated mask
+        rows, cols = load_candidate_points(candidates_path, prj_info, geo_t, updated_mask.shape, updated_mask)
+        x_adpt, y_adpt = update_stratified_design_points(rows, cols, sampled_csv)
+    else:
+        x_adpt, y_adpt = update_stratified_design(updated_mask, sampled_csv, checkpoint_path, checkpoint_every, resume)
 
     # plot design in pop up
     plot_adapted_stratified(updated_mask, x_adpt, y_adpt, sampled_csv)
 
     # save results to csv
-    save_stratified(x_adpt, y_adpt, prj_info, geo_t, save_path, sampled_csv)
+    csv_path = save_stratified(x_adpt, y_adpt, prj_info, geo_t, save_path, sampled_csv)
+    if local:
+        report.to_csv(csv_path.replace('.csv', '_report.csv'), index=False)
+    clear_checkpoint(checkpoint_path)
     return
 
 
@@ -1,61 +1,126 @@
-### Main script for updating a uniform design
-### NOTE: THIS CODE REQUIRES AN EXISTING UNIFORM DESIGN (generate_uniform_design.py)
-### File: update_uniform_design_opt2.py
-### Ellie Bowler
-### contact: e.bowler@uea.ac.uk
-### All code available at https://github.com/EllieBowler/
-### This script updates a uniform design by shifting points based in new innaccessible locations.
-### Sites which have already been sampled remain in the same location.
+# Main script for updating a uniform design, excluding areas around tagged sites
+# NOTE: THIS CODE REQUIRES AN EXISTING UNIFORM DESIGN (generate_uniform_design.py)
+# File: update_uniform_design_opt2.py
+# Author: Ellie Bowler
+# contact: e.bowler@uea.ac.uk
+# All code available at https://github.com/EllieBowler/
+# This script updates a uniform design by shifting points based in new inaccessible locations.
+# Sites which have already been sampled remain in the same location.
 ###################################################################
-## Usage:
+# Usage:
 # --save_folder is the name of the directory where outputs will be saved, in the results subfolder
-# --updated_mask_path is the name of the input mask (for example InvalidAreasMask.tif)
-# --csv_path csv file output by the original stratified design, with sampled column tagged
+# --original_mask_path is the name of the input mask (for example InvalidAreasMask.tif)
+# --csv_path csv file output by the original uniform design, with sampled column tagged. Tags are:
+#       1 : If site has already been sampled successfully
+#       2 : If the site is inaccessible, and you wish to exclude a radius around it
+#       0 : Any sites which have not been sampled
+# --id_im_path the id image saved with the original uniform design (ending _IDim.tif)
+# --radius is the radius to exclude around inaccessible sites (in metres)
+# --resume (optional flag) continue from the last checkpoint if the previous run was stopped
+# --checkpoint_every (optional) number of sites placed between checkpoints, default 10
+# --local (optional flag) only move the sites near the excluded areas, keeping the rest in place.
+#        The changes are also saved to a _report.csv file
+# --candidates_path (optional) .csv or vector file of the points sites may be placed at, for example along trails
+#        and roads, combined with the mask (see load_candidate_points), not used with --local
+# --backend (optional) numpy (default) excludes the radius around tagged sites in memory, dask does it in chunks of
+#        rows in parallel, giving the same mask
+# --scheduler (optional) with the dask backend, processes (default) for the local cpus or the address of a
+#        dask.distributed scheduler to run on a cluster
+# --chunk_rows (optional) with the dask backend, number of mask rows in each chunk, default 1024
 ###################################################################
 # Example adapting design generated using the test data
-# python update_uniform_design_opt2.py --save_folder AdaptedStratified30 --updated_mask_path input/InvalidAreasMask_updated.tif --csv_path results
+# python update_uniform_design_opt2.py --save_folder=Uniform_Adapted
+# --original_mask_path=input/InvalidAreasMask.tif --csv_path=results/80site_unif_tagged_opt2.csv
+# --id_im_path=results/80site_unif_IDim.tif --radius=1000
 ###################################################################
 
-from utils import get_file_info, plot_design, save_uniform
-from uda import update_uniform_design
+from utils import get_file_info, extract_raster, plot_uniform, save_uniform, load_checkpoint, save_checkpoint, \
+    clear_checkpoint, update_mask
+from utils import update_mask_chunked, get_scheduler
+from uda import update_uniform_design, update_uniform_design_local, get_sampling_info
+from utils import load_candidate_points
+from sda import update_uniform_design_points
 import os
 import click
+import numpy as np
+import pandas as pd
 
 
 @click.command()
-@click.option('--save_folder', type=str, default='Stratified_Adapted', help='Specify the name of the folder where results will be saved')
-@click.option('--original_mask_path', type=str, default='input/InvalidAreasMask_updated.tif', help='Specify path and name of the invalid areas mask')
-@click.option('--csv_path', type=int, default=30, help='Specify an integer number of sample sites')
-@click.option('--radius', type=float, default=2500, help='Radius to exclude around tagged sites (in metres)')
-def generate_design(save_folder, original_mask_path, csv_path, radius):
+@click.option('--save_folder', type=str, default='Uniform_Adapted', help='Name folder where results will be saved')
+@click.option('--original_mask_path', type=str, default='input/InvalidAreasMask.tif', help='Path and name of invalid areas mask')
+@click.option('--csv_path', type=str, default='results/80site_unif_tagged_opt2.csv', help='Path to tagged csv file')
+@click.option('--id_im_path', type=str, default='results/80site_unif_IDim.tif', help='Path to id image saved with the uniform design')
+@click.option('--radius', type=float, default=3000, help='Radius to exclude around tagged points (in metres)')
+@click.option('--resume', is_flag=True, help='Continue from the last checkpoint of a stopped design')
+@click.option('--checkpoint_every', type=int, default=10, help='Number of sites placed between checkpoints')
+@click.option('--local', is_flag=True, help='Only move sites near the excluded areas')
+@click.option('--candidates_path', type=str, default=None, help='Path and name of the candidate points file')
+@click.option('--backend', type=click.Choice(['numpy', 'dask']), default='numpy', help='Array backend used to update the mask')
+@click.option('--scheduler', type=str, default='processes', help='Dask scheduler, processes or a cluster address')
+@click.option('--chunk_rows', type=int, default=1024, help='Number of mask rows in each chunk for the dask backend')
+def generate_design(save_folder, original_mask_path, csv_path, id_im_path, radius, resume, checkpoint_every, local,
+                    candidates_path, backend, scheduler, chunk_rows):
+    if candidates_path is not None and local:
+        raise click.UsageError('--candidates_path can not be used with --local')
 
     # make results folder to save output
     save_path = 'results/{}'.format(save_folder)
     if not os.path.exists(save_path):
         os.mkdir(save_path)
 
-    savefiles = np.load(npz_path)
-    ID_im = savefiles['ID_im']
-    metrics = savefiles['immetrics']
-    binned_metrics = savefiles['binned_metrics']
-    site_df = pd.read_csv(csv_path)
-
     # get geo info and mask from path
-    original_mask, nbins, res, GeoT, auth_code = get_file_info(original_mask_path)
-    updated_mask = update_mask(site_df, original_mask, radius, res)
-    sampled_df, nsp, id_mix_unsampled, save_IDs, unique_IDs, nsampled = get_sampling_info(csv_path)
+    original_mask, n_bins, res, geo_t, prj_info = get_file_info(original_mask_path)
+    id_im = extract_raster(id_im_path)
+    sampled_csv = pd.read_csv(csv_path)
+
+    # exclude a radius around the tagged sites, the dask backend updates the mask chunk by chunk in parallel
+    if backend == 'dask':
+        updated_mask = update_mask_chunked(sampled_csv, original_mask, radius, res, chunk_rows).compute(
+            **get_scheduler(scheduler))
+    else:
+        updated_mask = update_mask(sampled_csv, original_mask, radius, res)
 
-    store_masks = store_layers(ID_im, updated_mask, unique_IDs)
+    # individual metric ids of each id value, as saved with the original design
+    id_df = sampled_csv.drop(columns=['site', 'longitude', 'latitude', 'row', 'col', 'sampled']).drop_duplicates('ID')
 
-    # generate design
-    x_adpt, y_adpt = update_uniform_design(sampled_df, id_mix_unsampled, store_masks)
+    checkpoint_path = '{}/{}site_unif_adapted_checkpoint.pkl'.format(save_path, len(sampled_csv))
+    if local:
+        # generate design, placing again only the sites near mask changes, each within its original id
+        if not resume:
+            clear_checkpoint(checkpoint_path)
+        x_adpt, y_adpt, save_ids, report = update_uniform_design_local(original_mask, updated_mask, id_im,
+                                                                       sampled_csv, checkpoint_path=checkpoint_path,
+                                                                       checkpoint_every=checkpoint_every,
+                                                                       resume=resume)
+    else:
+        # the order of the unsampled ids is drawn at random, so restore the random state of the run being resumed
+        checkpoint = load_checkpoint(checkpoint_path) if resume else None
+        if checkpoint is not None:
+            np.random.set_state(checkpoint['np_random_state'])
+        else:
+            clear_checkpoint(checkpoint_path)
+            save_checkpoint(checkpoint_path, np_random_state=np.random.get_state())
+        sampled_df, nsp, id_mix_unsampled, save_ids, unique_ids, n_sampled = get_sampling_info(csv_path)
+
+        # generate design, at the candidate points valid in the updated mask if given
+        if candidates_path is not None:
+            rows, cols = load_candidate_points(candidates_path, prj_info, geo_t, updated_mask.shape, updated_mask)
+            x_adpt, y_adpt = update_uniform_design_points(id_mix_unsampled, rows, cols, id_im[rows, cols],
+                                                          sampled_csv)
+        else:
+            x_adpt, y_adpt = update_uniform_design(updated_mask, id_mix_unsampled, id_im, sampled_csv,
+                                                   checkpoint_path, checkpoint_every, resume)
 
     # plot design in pop up
-    plot_design(updated_mask, x_adpt, y_adpt)
+    plot_uniform(id_im, updated_mask, x_adpt, y_adpt)
 
     # save results to csv
-    save_uniform(x_adpt, y_adpt, GeoT, auth_code, save_path, nsampled=0, updated='')
-
+    csv_path = save_uniform(x_adpt, y_adpt, save_ids, id_df, id_im, prj_info, geo_t, save_path, sampled_csv,
+                            mask=updated_mask)
+    if local:
+        report.to_csv(csv_path.replace('.csv', '_report.csv'), index=False)
+    clear_checkpoint(checkpoint_path)
     return
 
 
@@ -1,3 +1,10 @@
 from .load import *
+from .coords import *
 from .save import *
-from .plot import *
\ No newline at end of file
+from .plot import *
+from .candidates import *
+from .memory import *
+from .checkpoint import *
+from .local_update import *
+from .chunked import *
+from .mask_stack import *
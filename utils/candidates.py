@@ -0,0 +1,53 @@
+import numpy as np
+
+# Number of pixels compared against the maximum at once
+BLOCK_PIXELS = 2 ** 20
+
+
+def choose_max(arr, rng=None):
+    """
+    Choose one of the pixels holding the maximum value of arr, uniformly at random. Ties are counted row by row and
+    the chosen tie is found from the running counts, so no list of tied coordinates is built. Only a block of rows
+    is compared at a time, so the extra memory is one count per row however many pixels tie
+    INPUTS:
+        arr: (np.array) 2d image, for example a masked distance transform
+        rng: (np.random.Generator) random number generator, pass a seeded generator for reproducible designs
+    OUTPUTS:
+        x: (int) row of the chosen pixel
+        y: (int) column of the chosen pixel
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    imheight, imwidth = arr.shape
+    mx = arr.max()
+
+    # Number of maximum pixels in each row
+    block_rows = max(BLOCK_PIXELS // max(imwidth, 1), 1)
+    counts = np.empty(imheight, dtype=np.int64)
+    for start in range(0, imheight, block_rows):
+        counts[start:start + block_rows] = np.count_nonzero(arr[start:start + block_rows] == mx, axis=1)
+    cum_counts = np.cumsum(counts)
+
+    # Pick the k-th tie overall, then find its row and position within the row
+    k = rng.integers(cum_counts[-1])
+    x = int(np.searchsorted(cum_counts, k, side='right'))
+    k -= cum_counts[x] - counts[x]
+    y = int(np.flatnonzero(arr[x] == mx)[k])
+    return x, y
+
+
+def points_to_image(values, rows, cols, shape):
+    """
+    Image holding values at candidate points and zero elsewhere, for example the ids of the candidate points, so
+    designs over candidate points can be plotted and saved like raster designs
+    INPUTS:
+        values: (np.array) value at each candidate point
+        rows: (np.array) row of each candidate point
+        cols: (np.array) column of each candidate point
+        shape: (tuple) height and width of the image
+    OUTPUTS:
+        image: (np.array) 2d image of the values
+    """
+    image = np.zeros(shape)
+    image[rows, cols] = values
+    return image
@@ -0,0 +1,118 @@
+import numpy as np
+from scipy import ndimage
+import pickle
+import zlib
+import os
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Load the placement state saved by a design
+    INPUTS:
+        checkpoint_path: (str) path of the checkpoint file
+    OUTPUTS:
+        checkpoint: (dict) saved state, or None if there is no checkpoint
+    """
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_placement(checkpoint_path):
+    """
+    Load the sites saved by a design engine. The scripts save the random state used to draw the ids to the same
+    file before any site is placed, so a checkpoint holding no design yet means no sites were placed
+    INPUTS:
+        checkpoint_path: (str) path of the checkpoint file
+    OUTPUTS:
+        checkpoint: (dict) saved state, or None if no sites have been saved
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is None or 'design' not in checkpoint:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path, **state):
+    """
+    Add state to the checkpoint file, keeping any other values already saved in it.
+    The file is replaced in one step so a design killed while saving keeps the previous checkpoint
+    INPUTS:
+        checkpoint_path: (str) path of the checkpoint file
+        **state: values to save, for example x_vals=x_vals
+    OUTPUTS:
+        Saves the checkpoint to checkpoint_path
+    """
+    checkpoint = load_checkpoint(checkpoint_path) or {}
+    checkpoint.update(state)
+    tmp_path = '{}.tmp'.format(checkpoint_path)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, checkpoint_path)
+    return
+
+
+def clear_checkpoint(checkpoint_path):
+    """
+    Remove a checkpoint file, used when starting a new design or once a design is saved
+    INPUTS:
+        checkpoint_path: (str) path of the checkpoint file
+    """
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return
+
+
+def check_checkpoint(checkpoint, design, shape):
+    """
+    Make sure a checkpoint was saved by the same kind of design on a map of the same size
+    INPUTS:
+        checkpoint: (dict) saved state
+        design: (str) name of the design function resuming from the checkpoint
+        shape: (tuple) height and width of the map
+    """
+    if checkpoint.get('design') != design or tuple(checkpoint.get('shape', ())) != tuple(shape):
+        raise ValueError('Checkpoint was saved by {} on a {} map, cannot resume {} on a {} map'.format(
+            checkpoint.get('design'), checkpoint.get('shape'), design, shape))
+    return
+
+
+def pack_distance(dist_im):
+    """
+    Store a euclidean distance transform compactly and exactly, as compressed integer squared distances
+    INPUTS:
+        dist_im: (np.array) output of ndimage.distance_transform_edt
+    OUTPUTS:
+        packed: (dict) shape, integer type and compressed bytes of the squared distances
+    """
+    dist_sq = np.rint(dist_im ** 2)
+    dist_type = np.uint32 if dist_sq.max() <= np.iinfo(np.uint32).max else np.uint64
+    return {'shape': dist_im.shape, 'dtype': np.dtype(dist_type).str,
+            'data': zlib.compress(dist_sq.astype(dist_type).tobytes())}
+
+
+def unpack_distance(packed):
+    """
+    Rebuild a distance transform saved with pack_distance
+    INPUTS:
+        packed: (dict) output of pack_distance
+    OUTPUTS:
+        dist_im: (np.array) the distance transform
+    """
+    dist_sq = np.frombuffer(zlib.decompress(packed['data']), dtype=packed['dtype']).reshape(packed['shape'])
+    return np.sqrt(dist_sq.astype(np.float64))
+
+
+def restore_distance(checkpoint, sites):
+    """
+    Get the distance transform of the sites placed so far, from the checkpoint if it was saved, else recomputed
+    INPUTS:
+        checkpoint: (dict) saved state
+        sites: (np.array) site array with zeros at placed sites
+    OUTPUTS:
+        dist_im: (np.array) the distance transform
+    """
+    if checkpoint.get('distance') is not None:
+        return unpack_distance(checkpoint['distance'])
+    return ndimage.distance_transform_edt(sites)
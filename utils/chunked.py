@@ -0,0 +1,142 @@
+from osgeo import gdal
+import numpy as np
+
+# dask is optional, only needed for the chunked backend
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = None
+    da = None
+
+LOCAL_SCHEDULERS = ['processes', 'threads', 'synchronous']
+
+
+def require_dask():
+    """
+    Raise an informative error if dask is not installed
+    """
+    if dask is None:
+        raise ImportError('The chunked backend needs dask, install it with: conda install dask')
+    return
+
+
+def get_scheduler(scheduler='processes', processes=None):
+    """
+    Choose where chunked computations run, either a local pool or a dask.distributed cluster
+    INPUTS:
+        scheduler: (str) 'processes' (local process pool), 'threads', 'synchronous' (for debugging), or the
+                   address of a dask.distributed scheduler such as tcp://10.0.0.1:8786
+        processes: (int) number of local workers (default all cpus), ignored for a cluster
+    OUTPUTS:
+        compute_kwargs: (dict) keyword arguments to pass to dask.compute
+    """
+    require_dask()
+    if scheduler is None or scheduler in LOCAL_SCHEDULERS:
+        return {'scheduler': scheduler or 'processes', 'num_workers': processes}
+    try:
+        from dask.distributed import Client
+    except ImportError:
+        raise ImportError('Running on a cluster needs dask.distributed, install it with: conda install distributed')
+    client = Client(scheduler)
+    print('Connected to dask cluster at {}'.format(scheduler))
+    return {'scheduler': client.get}
+
+
+def read_rows(tif_path, start, n_rows):
+    """
+    Read a strip of rows from a geo tiff
+    """
+    tif_raw = gdal.Open(tif_path)
+    return tif_raw.ReadAsArray(0, start, tif_raw.RasterXSize, n_rows)
+
+
+def load_raster_chunked(tif_path, chunk_rows=1024):
+    """
+    Open a geo tiff as a chunked array, each chunk a strip of rows read from disk only when it is computed.
+    *Chunked version of extract_raster
+    INPUTS:
+        tif_path: (string) Relative path to .tif file
+        chunk_rows: (int) number of rows in each chunk
+    OUTPUTS:
+        file_map: (dask array) 2D chunked array of study site
+    """
+    require_dask()
+    tif_raw = gdal.Open(tif_path)
+    imheight, imwidth = tif_raw.RasterYSize, tif_raw.RasterXSize
+    dtype = tif_raw.ReadAsArray(0, 0, 1, 1).dtype
+    chunks = []
+    for start in range(0, imheight, chunk_rows):
+        n_rows = min(chunk_rows, imheight - start)
+        chunks.append(da.from_delayed(dask.delayed(read_rows)(tif_path, start, n_rows), shape=(n_rows, imwidth),
+                                      dtype=dtype))
+    return da.concatenate(chunks, axis=0)
+
+
+def get_file_info_chunked(file_path, chunk_rows=1024, compute_kwargs=None):
+    """
+    Chunked version of get_file_info, the number of categories is counted one chunk at a time
+    INPUTS:
+        file_path: (str) Path to the file
+        chunk_rows: (int) number of rows in each chunk
+        compute_kwargs: (dict) output of get_scheduler, local processes if None
+    OUTPUTS:
+        file_map: (dask array) The chunked map
+        n_bins: (int) The number of categories in the map
+        res: (float) Resolution of the map in meters
+        geo_t: (list) The geographic transform used to project the map
+        prj_info: (string) projection information
+    """
+    file_raw = gdal.Open(file_path)
+    prj_info = file_raw.GetProjection()
+    geo_t = file_raw.GetGeoTransform()
+    res = geo_t[1]
+    file_map = load_raster_chunked(file_path, chunk_rows)
+    n_bins = len(da.unique(file_map).compute(**(compute_kwargs or get_scheduler())))
+    return file_map, n_bins, res, geo_t, prj_info
+
+
+def as_chunked(array, like):
+    """
+    Chunk an array the same way as another chunked array, so the two can be combined block by block
+    """
+    require_dask()
+    if isinstance(array, da.Array):
+        return array.rechunk(like.chunks)
+    return da.from_array(np.asarray(array), chunks=like.chunks)
+
+
+def exclude_block(mask_block, x, y, radius, res, block_info=None):
+    """
+    Exclude a radius around the given sites from one chunk of the mask, using the exact distance to the nearest
+    site as ndimage.distance_transform_edt would
+    """
+    (row_start, row_stop), (col_start, col_stop) = block_info[0]['array-location']
+    rows = np.arange(row_start, row_stop)[:, None]
+    cols = np.arange(col_start, col_stop)[None, :]
+    dist_sq = np.full(mask_block.shape, np.iinfo(np.int64).max, dtype=np.int64)
+    for xi, yi in zip(x, y):
+        np.minimum(dist_sq, (rows - xi) ** 2 + (cols - yi) ** 2, out=dist_sq)
+    return np.where(np.sqrt(dist_sq) * res < radius, 0.0, 1.0) * mask_block
+
+
+def update_mask_chunked(site_df, mask, radius, res, chunk_rows=1024):
+    """
+    Chunked version of update_mask, excluding a radius around specified sites. Each chunk only needs the
+    coordinates of the tagged sites, so chunks are updated independently
+    INPUTS:
+        site_df: (panda dataframe) Dataframe containing sample site info and tagged sites
+        mask: (np.array or dask array) The original invalid areas mask
+        radius: (float) Radius to exclude around tagged sites in metres
+        res: (float) Resolution of the satellite image in metres
+        chunk_rows: (int) number of rows in each chunk, if the mask is not already chunked
+    OUTPUTS:
+        mask_update: (dask array) Updated mask showing new inaccessible areas
+    """
+    require_dask()
+    if not isinstance(mask, da.Array):
+        mask = da.from_array(np.asarray(mask), chunks=(chunk_rows, mask.shape[1]))
+    center_pixel = site_df.loc[site_df['sampled'] == 2]
+    x = center_pixel['row'].values.astype(np.int64)
+    y = center_pixel['col'].values.astype(np.int64)
+    return mask.map_blocks(exclude_block, x, y, radius, res, dtype=np.float64)
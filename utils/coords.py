@@ -0,0 +1,138 @@
+from osgeo import osr
+import numpy as np
+
+# Coordinate transformations already built, by projection
+_transforms = {}
+
+
+def get_transforms(prj_info):
+    """
+    Transformations between a projection and its geographic (longitude, latitude) coordinate system, built once
+    per projection and reused
+    INPUTS:
+        prj_info: (string) projection information extracted from geo-tiff
+    OUTPUTS:
+        to_geographic: (osr.CoordinateTransformation) projected to longitude and latitude
+        to_projected: (osr.CoordinateTransformation) longitude and latitude to projected
+    """
+    if prj_info not in _transforms:
+        srs = osr.SpatialReference()
+        if srs.ImportFromWkt(prj_info) != 0:
+            raise ValueError("Cannot import projection '{}'".format(prj_info))
+        srs_lat_long = srs.CloneGeogCS()
+        # GDAL 3 follows the axis order of the authority (latitude first), keep longitude first as in GDAL 2
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            srs_lat_long.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        _transforms[prj_info] = (osr.CoordinateTransformation(srs, srs_lat_long),
+                                 osr.CoordinateTransformation(srs_lat_long, srs))
+    return _transforms[prj_info]
+
+
+def transform_points(transform, a, b):
+    """
+    Apply a coordinate transformation to arrays of points in one call
+    """
+    a = np.asarray(a, dtype=np.float64).ravel()
+    b = np.asarray(b, dtype=np.float64).ravel()
+    if a.size == 0:
+        return np.array([]), np.array([])
+    points = np.array(transform.TransformPoints(np.column_stack([a, b]).tolist()))
+    return points[:, 0], points[:, 1]
+
+
+def pixel_to_projected(row, col, geo_t):
+    """
+    Projected coordinates of the centre of pixels
+    INPUTS:
+        row: (np.array) row of each pixel (x coordinates of sample sites)
+        col: (np.array) column of each pixel (y coordinates of sample sites)
+        geo_t: (list) geographic transformation values extracted from geo-tiff
+    OUTPUTS:
+        easting: (np.array) projected x coordinate of each pixel centre
+        northing: (np.array) projected y coordinate of each pixel centre
+    """
+    row = np.asarray(row, dtype=np.float64) + 0.5
+    col = np.asarray(col, dtype=np.float64) + 0.5
+    easting = geo_t[0] + col * geo_t[1] + row * geo_t[2]
+    northing = geo_t[3] + col * geo_t[4] + row * geo_t[5]
+    return easting, northing
+
+
+def projected_to_pixel(easting, northing, geo_t):
+    """
+    Pixels containing projected coordinates
+    INPUTS:
+        easting: (np.array) projected x coordinates
+        northing: (np.array) projected y coordinates
+        geo_t: (list) geographic transformation values extracted from geo-tiff
+    OUTPUTS:
+        row: (np.array) row of the pixel containing each point
+        col: (np.array) column of the pixel containing each point
+    """
+    dx = np.asarray(easting, dtype=np.float64) - geo_t[0]
+    dy = np.asarray(northing, dtype=np.float64) - geo_t[3]
+    det = geo_t[1] * geo_t[5] - geo_t[2] * geo_t[4]
+    col = (dx * geo_t[5] - dy * geo_t[2]) / det
+    row = (dy * geo_t[1] - dx * geo_t[4]) / det
+    return np.floor(row).astype(np.int64), np.floor(col).astype(np.int64)
+
+
+def projected_to_geographic(easting, northing, prj_info):
+    """
+    Longitude and latitude of projected coordinates
+    INPUTS:
+        easting: (np.array) projected x coordinates
+        northing: (np.array) projected y coordinates
+        prj_info: (string) projection information extracted from geo-tiff
+    OUTPUTS:
+        long: (np.array) longitude of each point
+        lat: (np.array) latitude of each point
+    """
+    return transform_points(get_transforms(prj_info)[0], easting, northing)
+
+
+def geographic_to_projected(long, lat, prj_info):
+    """
+    Projected coordinates of longitude and latitude
+    INPUTS:
+        long: (np.array) longitude of each point
+        lat: (np.array) latitude of each point
+        prj_info: (string) projection information extracted from geo-tiff
+    OUTPUTS:
+        easting: (np.array) projected x coordinate of each point
+        northing: (np.array) projected y coordinate of each point
+    """
+    return transform_points(get_transforms(prj_info)[1], long, lat)
+
+
+def pixel_to_geographic(row, col, prj_info, geo_t):
+    """
+    Longitude and latitude of the centre of pixels
+    INPUTS:
+        row: (np.array) row of each pixel (x coordinates of sample sites)
+        col: (np.array) column of each pixel (y coordinates of sample sites)
+        prj_info: (string) projection information extracted from geo-tiff
+        geo_t: (list) geographic transformation values extracted from geo-tiff
+    OUTPUTS:
+        long: (np.array) longitude of each pixel centre
+        lat: (np.array) latitude of each pixel centre
+    """
+    easting, northing = pixel_to_projected(row, col, geo_t)
+    return projected_to_geographic(easting, northing, prj_info)
+
+
+def geographic_to_pixel(long, lat, prj_info, geo_t):
+    """
+    Pixels containing longitude and latitude coordinates
+    INPUTS:
+        long: (np.array) longitude of each point
+        lat: (np.array) latitude of each point
+        prj_info: (string) projection information extracted from geo-tiff
+        geo_t: (list) geographic transformation values extracted from geo-tiff
+    OUTPUTS:
+        row: (np.array) row of the pixel containing each point
+        col: (np.array) column of the pixel containing each point
+    """
+    easting, northing = geographic_to_projected(long, lat, prj_info)
+    return projected_to_pixel(easting, northing, geo_t)
@@ -1,6 +1,8 @@
-from osgeo import gdal
+from osgeo import gdal, ogr
 import numpy as np
+import pandas as pd
 from scipy import ndimage
+from .coords import projected_to_pixel, geographic_to_pixel
 
 
 def get_file_info(file_path):
@@ -36,6 +38,19 @@ def extract_raster(tif_path):
     return tif_raw.ReadAsArray()
 
 
+def get_raster_shape(tif_path):
+    """
+    Read the size of a geo tiff without loading it, used to plan memory before reading the maps
+    INPUTS:
+        tif_path: (string) Relative path to .tif file
+    OUTPUTS:
+        imheight: (int) number of rows in the map
+        imwidth: (int) number of columns in the map
+    """
+    tif_raw = gdal.Open(tif_path)
+    return tif_raw.RasterYSize, tif_raw.RasterXSize
+
+
 def update_mask(site_df, mask, radius, res):
     """
     Update invalid areas mask by excluding a radius around specified sites
@@ -55,6 +70,9 @@ def update_mask(site_df, mask, radius, res):
     center_pixel = site_df.loc[site_df['sampled'] == 2]
     x = center_pixel['row'].values.astype(int)
     y = center_pixel['col'].values.astype(int)
+    if len(x) == 0:
+        # Nothing to exclude, the distance transform of an image without sites is not defined
+        return mask * 1.0
     new_mask[x, y] = 0
 
     # Threshold distance transform and add to original mask
@@ -65,3 +83,63 @@ def update_mask(site_df, mask, radius, res):
     mask_update = dist_im * mask
 
     return mask_update
+
+
+def read_point_file(points_path):
+    """
+    Read point locations from a .csv file, or any vector file GDAL can open such as a GeoPackage or shape file
+    INPUTS:
+        points_path: (str) path to the point file
+    OUTPUTS:
+        points: (data frame) with either row and col, longitude and latitude, or x and y (projected) columns
+    """
+    if points_path.lower().endswith('.csv'):
+        return pd.read_csv(points_path)
+    source = ogr.Open(points_path)
+    if source is None:
+        raise ValueError('Cannot open point file {}'.format(points_path))
+    layer = source.GetLayer()
+    srs = layer.GetSpatialRef()
+    coords = np.array([(feature.GetGeometryRef().GetX(), feature.GetGeometryRef().GetY()) for feature in layer])
+    coords = coords.reshape(-1, 2)
+    if srs is not None and srs.IsGeographic():
+        return pd.DataFrame({'longitude': coords[:, 0], 'latitude': coords[:, 1]})
+    return pd.DataFrame({'x': coords[:, 0], 'y': coords[:, 1]})
+
+
+def load_candidate_points(points_path, prj_info, geo_t, shape, mask=None):
+    """
+    Read the locations sites may be placed at, for example points along trails and roads, as pixels of the maps.
+    Points outside the maps or in invalid areas of the mask are dropped, as are repeated pixels
+    INPUTS:
+        points_path: (str) .csv file with row and col, longitude and latitude, or projected x and y columns, or a
+                     vector file of points (GeoPackage, shape file) in the projection of the maps or in longitude and
+                     latitude
+        prj_info: (string) projection information of the maps
+        geo_t: (list) geographic transformation values of the maps
+        shape: (tuple) height and width of the maps
+        mask: (np.array) if given, drop points where the mask is zero
+    OUTPUTS:
+        rows: (np.array) row of each candidate point
+        cols: (np.array) column of each candidate point
+    """
+    points = read_point_file(points_path)
+    if {'row', 'col'} <= set(points.columns):
+        rows, cols = points['row'].values.astype(np.int64), points['col'].values.astype(np.int64)
+    elif {'longitude', 'latitude'} <= set(points.columns):
+        rows, cols = geographic_to_pixel(points['longitude'].values, points['latitude'].values, prj_info, geo_t)
+    elif {'x', 'y'} <= set(points.columns):
+        rows, cols = projected_to_pixel(points['x'].values, points['y'].values, geo_t)
+    else:
+        raise ValueError('{} needs row and col, longitude and latitude, or x and y columns'.format(points_path))
+
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    rows, cols = rows[inside], cols[inside]
+    if mask is not None:
+        valid = mask[rows, cols] != 0
+        rows, cols = rows[valid], cols[valid]
+    flat = np.unique(rows * shape[1] + cols)
+    print('{} of {} candidate points inside the valid area'.format(len(flat), len(points)))
+    if len(flat) == 0:
+        raise ValueError('No candidate points in {} fall inside the valid area'.format(points_path))
+    return flat // shape[1], flat % shape[1]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+
+def nearest_spacing(x_vals, y_vals):
+    """
+    Distance from each site to its nearest neighbour
+    INPUTS:
+        x_vals: (np.array) x coordinates of sample sites
+        y_vals: (np.array) y coordinates of sample sites
+    OUTPUTS:
+        spacing: (np.array) nearest neighbour distance of each site in pixels
+    """
+    if len(x_vals) < 2:
+        return np.full(len(x_vals), np.inf)
+    points = np.column_stack([x_vals, y_vals])
+    dist, idx = cKDTree(points).query(points, k=2)
+    return dist[:, 1]
+
+
+def find_affected_sites(original_mask, updated_mask, sampled_csv, factor=1.0):
+    """
+    Find the unsampled sites whose placement could change after a mask update. A site is affected if it is now in an
+    invalid area, or if the mask changed within its neighbourhood: closer to the site than its nearest neighbouring
+    site, scaled by factor. Changes further away fall in the neighbourhoods of other sites.
+    INPUTS:
+        original_mask: (np.array) invalid areas mask the design was generated with
+        updated_mask: (np.array) updated invalid areas mask
+        sampled_csv: (data frame) Tagged data frame output by the original design
+        factor: (float) multiple of the nearest neighbour distance searched for mask changes around each site
+    OUTPUTS:
+        affected: (np.array) True for each site (row of sampled_csv) which should be placed again
+    """
+    x = sampled_csv['row'].values.astype(int)
+    y = sampled_csv['col'].values.astype(int)
+    unsampled = sampled_csv['sampled'].values != 1
+    invalid = updated_mask[x, y] == 0
+
+    # Distance from each site to the nearest pixel where the mask changed
+    changed = (original_mask != 0) != (updated_mask != 0)
+    if changed.any():
+        dist_change = ndimage.distance_transform_edt(~changed)[x, y]
+    else:
+        dist_change = np.full(len(x), np.inf)
+    spacing = nearest_spacing(x, y)
+    return unsampled & (invalid | (dist_change <= factor * spacing))
+
+
+def local_update_report(sampled_csv, affected, x_new, y_new):
+    """
+    Summarise which sites were kept and which were moved by a local update
+    INPUTS:
+        sampled_csv: (data frame) Tagged data frame output by the original design
+        affected: (np.array) output of find_affected_sites
+        x_new: (np.array) x coordinate of each site after the update, in the order of sampled_csv
+        y_new: (np.array) y coordinate of each site after the update, in the order of sampled_csv
+    OUTPUTS:
+        report: (data frame) original and new position of each site, whether it was affected, the distance it moved
+                (in pixels) and its status ('sampled', 'unchanged' or 'moved')
+    """
+    report = pd.DataFrame()
+    report['site'] = sampled_csv['site'].values if 'site' in sampled_csv else np.arange(1, len(sampled_csv) + 1)
+    report['row'] = sampled_csv['row'].values
+    report['col'] = sampled_csv['col'].values
+    report['sampled'] = sampled_csv['sampled'].values
+    report['affected'] = affected
+    report['new_row'] = x_new
+    report['new_col'] = y_new
+    report['distance_moved'] = np.hypot(x_new - report['row'].values, y_new - report['col'].values)
+    report['status'] = np.where(report['sampled'] == 1, 'sampled',
+                                np.where(report['distance_moved'] > 0, 'moved', 'unchanged'))
+    print('{} sites sampled, {} unchanged and {} moved'.format(*[sum(report['status'] == s)
+                                                               for s in ['sampled', 'unchanged', 'moved']]))
+    return report
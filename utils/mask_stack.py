@@ -0,0 +1,149 @@
+import numpy as np
+from functools import reduce
+from collections import OrderedDict
+from .load import extract_raster
+
+
+class MaskStack(object):
+    """
+    Named exclusion layers stored at one bit per pixel (1 = valid, 0 = invalid). Any subset of the layers can be
+    combined into a single mask which the design functions accept directly, so switching between exclusion
+    scenarios does not mean reading or multiplying full size rasters again.
+
+    Example:
+        stack = MaskStack(mask.shape)
+        stack.add('invalid', mask)
+        stack.add_file('additional', 'input/AdditionalMasks.tif')
+        stack.add_buffer('inaccessible', site_df, 1000, res)
+        x, y = generate_stratified_design(stack.mask(), 30)
+        x, y = generate_stratified_design(stack.mask(['invalid', 'additional']), 30)
+    """
+
+    def __init__(self, shape, max_cached=2):
+        """
+        INPUTS:
+            shape: (tuple) height and width of the landscape
+            max_cached: (int) number of combined masks kept unpacked, the least recently used are dropped first
+        """
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+        self.layers = OrderedDict()
+        self.max_cached = max_cached
+        self.cache = OrderedDict()
+
+    def pack(self, valid):
+        return np.packbits(np.asarray(valid).ravel() != 0)
+
+    def unpack(self, packed):
+        return np.unpackbits(packed, count=self.size).reshape(self.shape)
+
+    def add(self, name, layer):
+        """
+        Add or replace a layer
+        INPUTS:
+            name: (str) name of the layer
+            layer: (np.array) mask with zero at invalid locations
+        """
+        if np.shape(layer) != self.shape:
+            raise ValueError('Layer {} has shape {}, expected {}'.format(name, np.shape(layer), self.shape))
+        self.layers[name] = self.pack(layer)
+        self.cache.clear()
+        return self
+
+    def add_file(self, name, tif_path):
+        """
+        Add or replace a layer read from a geo tiff, with zero at invalid locations
+        INPUTS:
+            name: (str) name of the layer
+            tif_path: (str) path to the .tif file
+        """
+        return self.add(name, extract_raster(tif_path))
+
+    def add_buffer(self, name, site_df, radius, res):
+        """
+        Exclude a radius around the sites tagged with a two, as update_mask. If the layer already exists the new
+        exclusions are added to it, so buffers can be built up as sites are found to be inaccessible. The pixels
+        around each site are cleared directly in the packed layer, which is never unpacked
+        INPUTS:
+            name: (str) name of the layer
+            site_df: (panda dataframe) Dataframe containing sample site info and tagged sites
+            radius: (float) Radius to exclude around tagged sites in metres
+            res: (float) Resolution of the satellite image in metres
+        """
+        imheight, imwidth = self.shape
+        if name not in self.layers:
+            self.layers[name] = np.packbits(np.ones(self.size, dtype=bool))
+        packed = self.layers[name]
+        center_pixel = site_df.loc[site_df['sampled'] == 2]
+        window = int(np.ceil(radius / res))
+        for x, y in zip(center_pixel['row'].values.astype(int), center_pixel['col'].values.astype(int)):
+            r0, r1 = max(x - window, 0), min(x + window + 1, imheight)
+            c0, c1 = max(y - window, 0), min(y + window + 1, imwidth)
+            dist = np.sqrt((np.arange(r0, r1)[:, None] - x) ** 2 + (np.arange(c0, c1)[None, :] - y) ** 2) * res
+            rows, cols = np.nonzero(dist < radius)
+
+            # Clear the bit of each pixel, pixels are packed eight to a byte with the first in the highest bit
+            pixels = (rows + r0) * imwidth + cols + c0
+            np.bitwise_and.at(packed, pixels // 8, np.invert((128 >> (pixels % 8)).astype(np.uint8)))
+        self.cache.clear()
+        return self
+
+    def remove(self, name):
+        """
+        Remove a layer
+        INPUTS:
+            name: (str) name of the layer
+        """
+        del self.layers[name]
+        self.cache.clear()
+        return self
+
+    def compose(self, names=None, how='and'):
+        """
+        Combine layers bit by bit, still packed
+        INPUTS:
+            names: (list) names of the layers to combine (default all)
+            how: (str) 'and' for locations valid in every layer, 'or' for locations valid in any layer
+        OUTPUTS:
+            packed: (np.array) combined layer, eight pixels per byte
+        """
+        names = list(self.layers) if names is None else list(names)
+        if not names:
+            raise ValueError('No layers to combine')
+        if how not in ('and', 'or'):
+            raise ValueError('Unknown combination {}, choose and or or'.format(how))
+        combine = np.bitwise_and if how == 'and' else np.bitwise_or
+        return reduce(combine, [self.layers[name] for name in names])
+
+    def mask(self, names=None, how='and'):
+        """
+        Combined mask of any subset of the layers, one byte per pixel, to pass to the design functions.
+        The last max_cached combinations are kept until the layers change, so switching back to a scenario is free
+        INPUTS:
+            names: (list) names of the layers to combine (default all)
+            how: (str) 'and' for locations valid in every layer, 'or' for locations valid in any layer
+        OUTPUTS:
+            mask: (np.array) uint8 mask, 0 = invalid and 1 = valid
+        """
+        key = (tuple(self.layers) if names is None else tuple(names), how)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            self.cache[key] = self.unpack(self.compose(names, how))
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+        return self.cache[key]
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the packed layers
+        """
+        return sum(layer.nbytes for layer in self.layers.values())
+
+    def summary(self):
+        """
+        Number of valid pixels in each layer
+        """
+        return OrderedDict((name, int(np.unpackbits(layer, count=self.size).sum()))
+                           for name, layer in self.layers.items())
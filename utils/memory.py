@@ -0,0 +1,139 @@
+import numpy as np
+import re
+from .candidates import BLOCK_PIXELS
+
+# Approximate bytes per pixel held by each stage, based on the arrays the functions allocate.
+# Rasters are assumed to be read as 64 bit floats, which is the worst case for GDAL inputs.
+PIXEL_BYTES = 8
+# Temporaries while binning one metric (inverted mask, comparisons, bin index)
+BINNING_BYTES = 32
+# Temporaries while building each one-hot layer (im_layer, np.where output, layer_mask)
+LAYER_BYTES = 24
+# Combined labels, look up result and mask product used by generate_id_labels
+LABEL_BYTES = 24
+# scipy distance_transform_edt: feature transform, index grid and float64 distances
+EDT_BYTES = 40
+
+REPRESENTATIONS = ['in-memory', 'sparse', 'memmap', 'tiled']
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_memory(memory):
+    """
+    Convert a memory size such as '512M', '16G' or '2.5GB' to bytes
+    INPUTS:
+        memory: (str) memory size, plain numbers are read as bytes
+    OUTPUTS:
+        n_bytes: (int) memory size in bytes
+    """
+    match = re.match(r'^\s*([0-9.]+)\s*([KMGT]?)i?B?\s*$', str(memory).upper())
+    if match is None:
+        raise ValueError('Could not read memory size {}, use for example 512M or 16G'.format(memory))
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def format_memory(n_bytes):
+    """
+    Convert a number of bytes to a readable string
+    INPUTS:
+        n_bytes: (int) memory size in bytes
+    OUTPUTS:
+        memory: (str) memory size, for example '1.5 GB'
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n_bytes < 1024:
+            return '{:.1f} {}'.format(n_bytes, unit)
+        n_bytes /= 1024.0
+    return '{:.1f} TB'.format(n_bytes)
+
+
+def estimate_peak_memory(imheight, imwidth, n_metrics, bins_list, nsp, representation='in-memory',
+                         design='uniform', tile_rows=None):
+    """
+    Estimate the peak memory used to generate a design, stage by stage
+    INPUTS:
+        imheight: (int) height of the rasters in pixels
+        imwidth: (int) width of the rasters in pixels
+        n_metrics: (int) number of metric maps, including the habitat map
+        bins_list: (list) number of bins each metric is broken into
+        nsp: (int) number of sample sites
+        representation: (str) one of 'in-memory', 'sparse', 'memmap' or 'tiled' (see uda.build_id_image)
+        design: (str) 'uniform' or 'stratified'
+        tile_rows: (int) rows per tile for the tiled representation
+    OUTPUTS:
+        estimate: (dict) bytes used at the 'binning', 'layers' and 'design' stages, and the overall 'peak'
+    """
+    n_pixels = int(imheight) * int(imwidth)
+    n_combos = int(np.prod(bins_list, dtype=np.int64)) if len(bins_list) else 1
+    # Site coordinates are grown with np.append, so briefly held twice
+    sites = 2 * 2 * nsp * PIXEL_BYTES
+    # choose_max compares one block of pixels at a time and keeps a running tie count per row
+    ties = BLOCK_PIXELS + 2 * int(imheight) * PIXEL_BYTES
+    design_arrays = n_pixels * (4 * PIXEL_BYTES + EDT_BYTES) + ties + sites
+
+    if design == 'stratified':
+        mask = n_pixels * PIXEL_BYTES
+        return {'binning': 0, 'layers': 0, 'design': mask + design_arrays, 'peak': mask + design_arrays}
+
+    if representation not in REPRESENTATIONS:
+        raise ValueError('Unknown representation {}'.format(representation))
+    if representation == 'tiled':
+        work_pixels = min(int(tile_rows or imheight), int(imheight)) * int(imwidth)
+    else:
+        work_pixels = n_pixels
+
+    # Input metrics and the mask, then the binned metrics kept for saving
+    inputs = n_pixels * PIXEL_BYTES * (n_metrics + 1)
+    binned = n_pixels * PIXEL_BYTES * n_metrics
+    id_im = n_pixels * PIXEL_BYTES
+
+    binning = inputs + binned + work_pixels * BINNING_BYTES
+    if representation == 'in-memory':
+        layers = inputs + binned + n_combos * n_pixels * PIXEL_BYTES + n_pixels * LAYER_BYTES + id_im
+    elif representation == 'memmap':
+        layers = inputs + binned + n_pixels * LAYER_BYTES + id_im
+    else:
+        # labels are int32 unless the number of combinations needs int64
+        label_bytes = 4 if n_combos <= np.iinfo(np.int32).max else 8
+        layers = inputs + binned + n_pixels * label_bytes + work_pixels * LABEL_BYTES + id_im
+    design_peak = inputs + binned + id_im + design_arrays
+    return {'binning': binning, 'layers': layers, 'design': design_peak,
+            'peak': max(binning, layers, design_peak)}
+
+
+def plan_memory(imheight, imwidth, n_metrics, bins_list, nsp, max_memory, design='uniform'):
+    """
+    Choose the first representation (in the order of REPRESENTATIONS) whose estimated peak memory fits the budget.
+    Fails before any processing if none of them fit.
+    INPUTS:
+        imheight: (int) height of the rasters in pixels
+        imwidth: (int) width of the rasters in pixels
+        n_metrics: (int) number of metric maps, including the habitat map
+        bins_list: (list) number of bins each metric is broken into
+        nsp: (int) number of sample sites
+        max_memory: (int or str) memory budget in bytes, or a size such as '16G'
+        design: (str) 'uniform' or 'stratified'
+    OUTPUTS:
+        plan: (dict) the chosen 'representation', 'tile_rows' and memory 'estimate'
+    """
+    if isinstance(max_memory, str):
+        max_memory = parse_memory(max_memory)
+    representations = REPRESENTATIONS if design == 'uniform' else ['in-memory']
+    smallest = None
+    for representation in representations:
+        tile_rows = None
+        if representation == 'tiled':
+            # Keep the tile temporaries to a small share of the budget
+            tile_rows = int(max(1, min(imheight, 0.05 * max_memory / (max(imwidth, 1) * BINNING_BYTES))))
+        estimate = estimate_peak_memory(imheight, imwidth, n_metrics, bins_list, nsp, representation, design,
+                                        tile_rows)
+        if estimate['peak'] <= max_memory:
+            print('Estimated peak memory {} using the {} representation (limit {})'.format(
+                format_memory(estimate['peak']), representation, format_memory(max_memory)))
+            return {'representation': representation, 'tile_rows': tile_rows, 'estimate': estimate}
+        if smallest is None or estimate['peak'] < smallest[1]['peak']:
+            smallest = (representation, estimate)
+    stage = max(['binning', 'layers', 'design'], key=lambda k: smallest[1][k])
+    raise MemoryError('Estimated peak memory {} ({} representation, {} stage) exceeds the limit of {}'.format(
+        format_memory(smallest[1]['peak']), smallest[0], stage, format_memory(max_memory)))
@@ -1,5 +1,9 @@
 from matplotlib import pyplot as plt
 import numpy as np
+import weakref
+
+# Overview pyramids are cached per array so repeated previews of the same map are instant
+_overview_cache = {}
 
 
 def plot_uniform(id_im, mask, x, y):
@@ -14,8 +18,7 @@ def plot_uniform(id_im, mask, x, y):
         Creates a pop up for the design, should be closed manually
     """
     print('Close plot to save results and continue running the code...')
-    id_im_msk = np.ma.masked_array(id_im, mask=(1-mask))
-    plt.imshow(id_im_msk)
+    imshow_overview(id_im, valid=mask)
     plt.scatter(y, x, c='black', marker='x', linewidth=2)
     plt.axis('off')
     plt.title('Uniform design with {} sample sites'.format(len(x)))
@@ -35,10 +38,10 @@ def plot_stratified(mask, x, y):
     """
     print('Close plot to save results and continue running the code...')
     plt.figure(figsize=(7, 9))
-    plt.imshow(mask, cmap=plt.cm.get_cmap('Accent_r', 2))
+    img = imshow_overview(mask, cmap=plt.cm.get_cmap('Accent_r', 2))
     plt.title('{} design with {} sample sites'.format('Stratified', len(x)))
     plt.axis('off')
-    cbar = plt.colorbar(fraction=0.02, orientation='horizontal', pad=0.01)
+    cbar = plt.colorbar(img, fraction=0.02, orientation='horizontal', pad=0.01)
     cbar.set_ticks([0, 1])
     cbar.set_ticklabels(['0: Invalid', '1: Valid'])
     plt.scatter(y, x, c='black', marker='x', linewidth=1.5, s=70)
@@ -46,6 +49,31 @@ def plot_stratified(mask, x, y):
     return
 
 
+def plot_vector(polygons, exclude_polygons, x, y):
+    """
+    Plot a stratified design placed on polygons
+    INPUTS:
+        polygons: (list) valid polygons, each a list of rings as returned by read_polygons
+        exclude_polygons: (list) polygons which should not be sampled, in the same form
+        x: (list) projected x coordinates of sample sites
+        y: (list) projected y coordinates of sample sites
+    OUTPUTS:
+        Creates a pop up for the design, should be closed manually
+    """
+    print('Close plot to save results and continue running the code...')
+    plt.figure(figsize=(7, 9))
+    for rings, colour in [(polygons, 'tab:green'), (exclude_polygons, 'tab:red')]:
+        for polygon in rings:
+            for ring in polygon:
+                plt.plot(ring[:, 0], ring[:, 1], c=colour, linewidth=1)
+    plt.scatter(x, y, c='black', marker='x', linewidth=1.5, s=70)
+    plt.gca().set_aspect('equal')
+    plt.title('{} design with {} sample sites'.format('Stratified', len(x)))
+    plt.axis('off')
+    plt.show()
+    return
+
+
 def plot_adapted_stratified(mask, x, y, sampled_csv):
     """
     Plot updated stratified design
@@ -59,10 +87,10 @@ def plot_adapted_stratified(mask, x, y, sampled_csv):
     """
     print('Close plot to save results and continue running the code...')
     plt.figure(figsize=(7, 9))
-    plt.imshow(mask, cmap=plt.cm.get_cmap('Accent_r', 2))
+    img = imshow_overview(mask, cmap=plt.cm.get_cmap('Accent_r', 2))
     plt.title('{} design with {} sample sites'.format('Adapted Stratified', len(x)))
     plt.axis('off')
-    cbar = plt.colorbar(fraction=0.02, orientation='horizontal', pad=0.01)
+    cbar = plt.colorbar(img, fraction=0.02, orientation='horizontal', pad=0.01)
     cbar.set_ticks([0, 1])
     cbar.set_ticklabels(['0: Invalid', '1: Valid'])
     num_sampled = sum(sampled_csv.sampled)
@@ -72,3 +100,101 @@ def plot_adapted_stratified(mask, x, y, sampled_csv):
     plt.show()
     return
 
+
+def mode_downsample(im):
+    """
+    Halve the resolution of a categorical map, taking the most common value in each 2x2 block
+    INPUTS:
+        im: (.npy array) categorical map, such as a mask or id image
+    OUTPUTS:
+        im_half: (.npy array) map at half the resolution (odd edges are padded by repeating the last row/column)
+    """
+    imheight, imwidth = im.shape
+    im_pad = np.pad(im, ((0, imheight % 2), (0, imwidth % 2)), mode='edge')
+    block = np.stack([im_pad[0::2, 0::2], im_pad[0::2, 1::2], im_pad[1::2, 0::2], im_pad[1::2, 1::2]])
+    # Count how many of the four pixels share each pixel's value, ties go to the first pixel
+    votes = np.stack([sum(block[i] == block[j] for j in range(4)) for i in range(4)])
+    winner = np.argmax(votes, axis=0)
+    return np.take_along_axis(block, winner[np.newaxis], axis=0)[0]
+
+
+def build_overviews(im, min_size=256):
+    """
+    Build an overview pyramid of a categorical map, halving the resolution with mode aggregation at each level
+    INPUTS:
+        im: (.npy array) categorical map, such as a mask or id image
+        min_size: (int) stop once the longest side of the coarsest level is at most this many pixels
+    OUTPUTS:
+        overviews: (list) the map at full resolution followed by each coarser level
+    """
+    overviews = [im]
+    while max(overviews[-1].shape) > min_size:
+        overviews.append(mode_downsample(overviews[-1]))
+    return overviews
+
+
+def get_overviews(im):
+    """
+    Return the cached overview pyramid of a map, building it on first use
+    *The cache is keyed on the array object, so rebuild by passing a new array if a map is edited in place
+    INPUTS:
+        im: (.npy array) categorical map, such as a mask or id image
+    OUTPUTS:
+        overviews: (list) the map at full resolution followed by each coarser level
+    """
+    key = id(im)
+    cached = _overview_cache.get(key)
+    if cached is None or cached[0] != im.shape:
+        # Only the coarser levels are cached, holding the map itself would keep it from ever being freed
+        cached = (im.shape, build_overviews(im)[1:])
+        if key not in _overview_cache:
+            weakref.finalize(im, _overview_cache.pop, key, None)
+        _overview_cache[key] = cached
+    return [im] + cached[1]
+
+
+def select_overview_level(shape, ax, n_levels):
+    """
+    Choose the coarsest overview level which still has at least one pixel per screen pixel in the axes
+    INPUTS:
+        shape: (tuple) full resolution height and width of the map
+        ax: (matplotlib axes) axes the map will be drawn in
+        n_levels: (int) number of levels in the overview pyramid
+    OUTPUTS:
+        level: (int) index into the overview pyramid
+    """
+    bbox = ax.get_window_extent()
+    factor = max(shape[0] / max(bbox.height, 1.0), shape[1] / max(bbox.width, 1.0))
+    level = int(np.floor(np.log2(max(factor, 1.0))))
+    return min(level, n_levels - 1)
+
+
+def imshow_overview(im, valid=None, ax=None, **kwargs):
+    """
+    Draw a map using the overview level which matches the figure size, keeping full resolution axis coordinates
+    so sample sites can be overlaid using their row and column values
+    INPUTS:
+        im: (.npy array) categorical map, such as a mask or id image
+        valid: (.npy array) optional binary mask, pixels with zero are left blank
+        ax: (matplotlib axes) axes to draw in, defaults to the current axes
+        **kwargs: passed on to imshow
+    OUTPUTS:
+        img: (matplotlib image) the drawn image, for use with colorbar
+    """
+    if ax is None:
+        ax = plt.gca()
+    imheight, imwidth = im.shape
+    overviews = get_overviews(im)
+    level = select_overview_level(im.shape, ax, len(overviews))
+    im_level = overviews[level]
+    if valid is not None:
+        im_level = np.ma.masked_array(im_level, mask=(1 - get_overviews(valid)[level]))
+
+    # Each overview pixel covers scale x scale full resolution pixels
+    scale = 2 ** level
+    extent = (-0.5, im_level.shape[1] * scale - 0.5, im_level.shape[0] * scale - 0.5, -0.5)
+    kwargs.setdefault('interpolation', 'nearest')
+    img = ax.imshow(im_level, extent=extent, **kwargs)
+    ax.set_xlim(-0.5, imwidth - 0.5)
+    ax.set_ylim(imheight - 0.5, -0.5)
+    return img
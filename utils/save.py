@@ -1,8 +1,13 @@
 import pandas as pd
 import numpy as np
-from osgeo import osr, ogr
+from osgeo import ogr, gdal
 import time
 import os
+from .coords import pixel_to_projected, pixel_to_geographic, projected_to_geographic
+
+# GDAL data types used when exporting arrays
+GDAL_TYPES = {'uint8': gdal.GDT_Byte, 'uint16': gdal.GDT_UInt16, 'int16': gdal.GDT_Int16, 'uint32': gdal.GDT_UInt32,
+              'int32': gdal.GDT_Int32, 'float32': gdal.GDT_Float32, 'float64': gdal.GDT_Float64}
 
 
 def lat_long_convert(x, y, prj_info, geo_t):
@@ -14,29 +19,11 @@ def lat_long_convert(x, y, prj_info, geo_t):
         prj_info: (string) projection information extracted from geo-tiff
         geo_t: (list) geographic transformation values extracted from geo-tiff
     OUTPUTS:
-        long: (list) longitude values of sample sites
-        lat: (list) latitude values of sample sites
+        long: (np.array) longitude values of sample sites
+        lat: (np.array) latitude values of sample sites
     """
-    # Project row and column (will be for bottom left corner)
-    x_proj = x * geo_t[1] + geo_t[0]
-    y_proj = y * geo_t[5] + geo_t[3]
-
-    # Shift from bottom left to centre of the pixel
-    x_proj += geo_t[1] / 2.0
-    y_proj += geo_t[5] / 2.0
-
-    xy_proj = np.stack((x_proj, y_proj), axis=-1)
-
-    # Make spatial coordinate system
-    srs = osr.SpatialReference()
-    if srs.ImportFromWkt(prj_info) != 0:
-        print("Error: cannot import projection '%s'" % prj_info)
-        sys.exit(1)
-
-    srs_lat_long = srs.CloneGeogCS()
-    ct = osr.CoordinateTransformation(srs, srs_lat_long)
-    long, lat, height = list(zip(*ct.TransformPoints(xy_proj)))
-    return long, lat
+    # x is the row and y the column, so y gives the easting as in save_as_shp
+    return pixel_to_geographic(x, y, prj_info, geo_t)
 
 
 def save_as_shp(x, y, geo_t, out_filename):
@@ -50,25 +37,33 @@ def save_as_shp(x, y, geo_t, out_filename):
     OUTPUTS:
         Saves .shp file in the directory specified by out_filename
     """
+    # Project the centre of every pixel at once
+    x_proj, y_proj = pixel_to_projected(x, y, geo_t)
+    save_points_shp(x_proj, y_proj, out_filename)
+    return
+
+
+def save_points_shp(x_proj, y_proj, out_filename):
+    """
+    Export projected point locations to shape file
+    INPUTS:
+        x_proj: (np.array) projected x coordinates of sample sites
+        y_proj: (np.array) projected y coordinates of sample sites
+        out_filename: (str) path and name of the output shape file
+    OUTPUTS:
+        Saves .shp file in the directory specified by out_filename
+    """
     # Create the ESRI shape file
     driver = ogr.GetDriverByName('ESRI Shapefile')
     ds = driver.CreateDataSource(out_filename)
 
     layer = ds.CreateLayer('', None, ogr.wkbPoint)
-    for i in range(len(x)):
+    for i in range(len(x_proj)):
         feature = ogr.Feature(layer.GetLayerDefn())
 
-        # Project row and column (will be for bottom left corner)
-        x_proj = y[i] * geo_t[1] + geo_t[0]
-        y_proj = x[i] * geo_t[5] + geo_t[3]
-
-        # Shift from bottom left to centre of the pixel
-        x_proj += geo_t[1] / 2.0
-        y_proj += geo_t[5] / 2.0
-
         # Add each point to new geometry
         point = ogr.Geometry(ogr.wkbPoint)
-        point.AddPoint(x_proj, y_proj)
+        point.AddPoint(float(x_proj[i]), float(y_proj[i]))
         feature.SetGeometry(point)
         layer.CreateFeature(feature)
         feature.Destroy()
@@ -90,6 +85,7 @@ def save_stratified(x, y, prj_info, geo_t, save_path, sampled_csv=None):
         sampled_csv: (data frame) only entered if updating a design, else None
     OUTPUTS:
         Saves .csv in the directory specified by save_path
+        csv_path: (str) path of the saved .csv file
     """
     # Generate unique time stamp to avoid overwriting results
     ts = time.gmtime()
@@ -109,7 +105,7 @@ def save_stratified(x, y, prj_info, geo_t, save_path, sampled_csv=None):
 
     # For adapted designs add info to the sampled column
     if sampled_csv is not None:
-        num_sampled = sum(sampled_csv.sampled)
+        num_sampled = sum(sampled_csv.sampled == 1)
         result['sampled'] = [1] * num_sampled + [0] * (len(x) - num_sampled)
         csv_filename = '{}_{}site_strat_adapted'.format(ts, len(x))
 
@@ -118,21 +114,121 @@ def save_stratified(x, y, prj_info, geo_t, save_path, sampled_csv=None):
     result.to_csv('{}/{}.csv'.format(save_path, csv_filename), index_label='site')
     save_as_shp(x, y, geo_t, '{}/{}.shp'.format(save_path, csv_filename))
     print('Design saved as .csv and .shp in {} directory \nFile name: {}'.format(save_path, csv_filename))
+    return '{}/{}.csv'.format(save_path, csv_filename)
+
+
+def save_projected(x_proj, y_proj, prj_info, save_path):
+    """
+    Save a design placed in projected coordinates rather than on a raster, such as a vector design
+    INPUTS:
+        x_proj: (np.array) projected x coordinates of sample sites
+        y_proj: (np.array) projected y coordinates of sample sites
+        prj_info: (string) projection information of the coordinates
+        save_path: (str) path specifying where to save the files
+    OUTPUTS:
+        Saves .csv and .shp in the directory specified by save_path
+        csv_path: (str) path of the saved .csv file
+    """
+    # Generate unique time stamp to avoid overwriting results
+    ts = time.gmtime()
+    ts = time.strftime("%Y_%m_%d_%H%M%S", ts)
+
+    result = pd.DataFrame()
+    if prj_info:
+        result['longitude'], result['latitude'] = projected_to_geographic(x_proj, y_proj, prj_info)
+    result['x'] = x_proj
+    result['y'] = y_proj
+    result['sampled'] = 0
+    csv_filename = '{}_{}site_vector'.format(ts, len(x_proj))
+
+    # Write to csv and shape files
+    result.index += 1
+    result.to_csv('{}/{}.csv'.format(save_path, csv_filename), index_label='site')
+    save_points_shp(x_proj, y_proj, '{}/{}.shp'.format(save_path, csv_filename))
+    print('Design saved as .csv and .shp in {} directory \nFile name: {}'.format(save_path, csv_filename))
+    return '{}/{}.csv'.format(save_path, csv_filename)
+
+
+def id_type(max_value):
+    """
+    Smallest unsigned integer type able to hold ids up to max_value
+    """
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.float64
+
+
+def save_raster(array, file_path, prj_info, geo_t, dtype=None, block_size=256, resampling='MODE'):
+    """
+    Export an array as a cloud optimised geo tiff: internally tiled, compressed, and with overviews stored ahead of
+    the full resolution data, so it opens quickly in GIS software at any zoom. The array is written one strip of
+    tiles at a time, so memory mapped arrays are never copied in full.
+    INPUTS:
+        array: (np.array) map to export, can be a memory mapped array
+        file_path: (str) path and name of the output .tif file
+        prj_info: (string) projection information extracted from geo-tiff
+        geo_t: (list) geographic transformation values extracted from geo-tiff
+        dtype: (np.dtype) data type to store, defaults to the type of the array
+        block_size: (int) width and height of the internal tiles in pixels
+        resampling: (str) GDAL overview resampling, MODE suits categorical maps such as ids and masks
+    OUTPUTS:
+        Saves .tif file to file_path
+    """
+    imheight, imwidth = array.shape
+    dtype = np.dtype(array.dtype if dtype is None else dtype)
+    options = ['TILED=YES', 'BLOCKXSIZE={}'.format(block_size), 'BLOCKYSIZE={}'.format(block_size),
+               'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
+    # Write the full resolution data to a temporary tiled file, one strip of tiles at a time
+    driver = gdal.GetDriverByName('GTiff')
+    tmp_path = '{}.tmp.tif'.format(file_path)
+    ds = driver.Create(tmp_path, imwidth, imheight, 1, GDAL_TYPES[dtype.name], options=options)
+    ds.SetGeoTransform(geo_t)
+    ds.SetProjection(prj_info)
+    band = ds.GetRasterBand(1)
+    for start in range(0, imheight, block_size):
+        band.WriteArray(np.asarray(array[start:start + block_size]).astype(dtype), 0, start)
+    band = None
+
+    # Halve the resolution until the whole map fits in one tile
+    factors = []
+    factor = 2
+    while max(imheight, imwidth) > block_size * factor // 2:
+        factors.append(factor)
+        factor *= 2
+    if factors:
+        ds.BuildOverviews(resampling, factors)
+    ds.FlushCache()
+
+    # Copy so the overviews are stored before the full resolution data, the cloud optimised layout
+    cog = driver.CreateCopy(file_path, ds, options=options + ['COPY_SRC_OVERVIEWS=YES'])
+    cog = None
+    ds = None
+    driver.Delete(tmp_path)
     return
 
 
-def save_uniform(x, y, id_mix, id_df, id_im, prj_info, geo_t, save_path, sampled_csv=None):
+def save_uniform(x, y, id_mix, id_df, id_im, prj_info, geo_t, save_path, sampled_csv=None, binned_metrics=None,
+                 mask=None):
     """
-    Function to output final sample design to .csv and ESRI .shp file
+    Function to output final sample design to .csv and ESRI .shp file, and the id image, binned metrics and
+    mask to cloud optimised geo tiffs
     INPUTS:
         x: (list) x coordinates of sample sites
         y: (list) y coordinates of sample sites
+        id_mix: (list) metric id value of each sample site
+        id_df: (data frame) individual metric ids of each id value
+        id_im: (np.array) combined id image, needed to adapt the uniform design
         prj_info: (string) projection information extracted from geo-tiff
         geo_t: (list) geographic transformation values extracted from geo-tiff
         save_path: (str) path specifying where to save the .csv and .shp files
         sampled_csv: (data frame) only entered if updating a design, else None
+        binned_metrics: (list) binned metric maps to export, not saved if None
+        mask: (np.array) invalid areas mask used by the design, not saved if None
     OUTPUTS:
-        Saves .csv in the directory specified by save_path
+        Saves .csv, .shp and .tif files in the directory specified by save_path
+        csv_path: (str) path of the saved .csv file
     """
     # Generate unique time stamp to avoid overwriting results
     ts = time.gmtime()
@@ -156,18 +252,27 @@ def save_uniform(x, y, id_mix, id_df, id_im, prj_info, geo_t, save_path, sampled
 
     # For adapted designs add info to the sampled column
     if sampled_csv is not None:
-        num_sampled = sum(sampled_csv.sampled)
+        num_sampled = sum(sampled_csv.sampled == 1)
         result['sampled'] = [1] * num_sampled + [0] * (len(x) - num_sampled)
         csv_filename = '{}site_unif_adapted'.format(len(x))
 
     # Merge with id_df to store individual metric id values
-    result = pd.merge(result, id_df)
+    result = pd.merge(result, id_df, on='ID', how='left')
 
     # Write to csv and shape files
     result.index += 1
     result.to_csv('{}/{}/{}.csv'.format(save_path, ts, csv_filename), index_label='site')
     save_as_shp(x, y, geo_t, '{}/{}/{}.shp'.format(save_path, ts, csv_filename))
-    np.savez('{}/{}/{}.npz'.format(save_path, ts, csv_filename))
     print('Design saved as .csv and .shp in {}/{} directory \nFile name: {}'.format(save_path, ts, csv_filename))
-    print('Also saving id_im as {}.npz, which is used to adapt the uniform design'.format(csv_filename))
-    return
\ No newline at end of file
+
+    # Export the maps used by the design, the id image is needed to adapt the design
+    save_raster(id_im, '{}/{}/{}_IDim.tif'.format(save_path, ts, csv_filename), prj_info, geo_t,
+                id_type(np.max(id_im)))
+    if binned_metrics is not None:
+        for j in range(len(binned_metrics)):
+            save_raster(binned_metrics[j], '{}/{}/{}_binned_metric{}.tif'.format(save_path, ts, csv_filename, j),
+                        prj_info, geo_t, id_type(np.max(binned_metrics[j])))
+    if mask is not None:
+        save_raster(mask, '{}/{}/{}_mask.tif'.format(save_path, ts, csv_filename), prj_info, geo_t, np.uint8)
+    print('Also saving id_im as {}_IDim.tif, which is used to adapt the uniform design'.format(csv_filename))
+    return '{}/{}/{}.csv'.format(save_path, ts, csv_filename)
\ No newline at end of file